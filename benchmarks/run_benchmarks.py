@@ -0,0 +1,335 @@
+"""
+Offline benchmark suite for the presence pipeline.
+
+Runs every stage against a local stand-in for the Knesset API, the photo
+host and the Telegram Bot API (src/simulation/stub_server.py), so no
+network access or credentials are needed:
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 120,1000 --iterations 50 --json results.json
+    python benchmarks/run_benchmarks.py --telegram-latency 0.05 --rate-limit-every 10
+
+For every roster size it reports throughput, p50/p95 latency, the peak of
+Python allocations (tracemalloc) and process RSS for fetch, decode, diff,
+get_faction_summary, create_presence_image, JPEG encode and full poll cycles.
+The run exits non-zero if an expectation fails (see `check`), e.g. an
+incremental render that is not faster than a full one.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+# Imports no bot config, so it is safe before the environment is set up
+from simulation.environment import configure_environment, free_port  # noqa: E402
+
+# JPEG caps the canvas at 65535px, i.e. roughly 1,150 present members
+MAX_RENDER_MEMBERS = 1000
+
+
+def _rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Result:
+    def __init__(self, name: str, size: int, timings: List[float], peak_kb: float, note: str = ''):
+        self.name = name
+        self.size = size
+        self.timings = timings
+        self.peak_kb = peak_kb
+        self.rss_mb = _rss_mb()
+        self.note = note
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self.timings)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        mean = statistics.fmean(self.timings) if self.timings else 0.0
+        return {
+            'name': self.name, 'size': self.size, 'iterations': len(self.timings),
+            'ops_per_s': 1 / mean if mean else 0.0, 'mean_ms': mean * 1000,
+            'p50_ms': self.percentile(0.5), 'p95_ms': self.percentile(0.95),
+            'peak_kb': self.peak_kb, 'rss_mb': self.rss_mb, 'note': self.note
+        }
+
+
+async def measure(name: str, size: int, fn: Callable[[], Awaitable[Any]], iterations: int,
+                  setup: Optional[Callable[[], Any]] = None, warmup: int = 1) -> Result:
+    """
+    Time `fn` over `iterations` runs; `setup` runs untimed before each call.
+
+    Memory is measured in one extra traced run, since tracemalloc slows
+    down the timed ones.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        await fn()
+
+    timings = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    await fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return Result(name, size, timings, peak / 1024)
+
+
+def skipped(name: str, size: int, note: str) -> Result:
+    return Result(name, size, [], 0.0, note)
+
+
+async def run_size(stub, size: int, args, workdir: Path) -> List[Result]:
+    from services.service_graph import ServiceGraph
+    from services.photo_cache import PhotoCache
+    from services.image_encoder import ImageEncoder
+    from services.compositor import TileEntry
+    from utils.file_id_cache import FileIdCache
+    from utils.state_manager import StateManager
+    from utils.text_utils import hebrew_sort_key
+    from models.destination import Destination
+    from models.member import decode_lobby
+    from models.roster import Roster
+
+    stub.set_size(size)
+    results = []
+    destinations = [Destination(chat_id='@stub', rate_per_minute=args.telegram_rate, burst=3)]
+    # The same services the bot runs with, minus its state files and HTTP servers
+    async with ServiceGraph(destinations, FileIdCache(workdir / f"file_ids_{size}.json"),
+                            global_rate_per_second=args.telegram_rate / 60,
+                            persistent=False, metrics_enabled=False, snapshot_api=False) as services:
+        knesset_api = services.knesset_api
+        image_service = services.image_service
+        render_pool = services.render_pool
+        publisher = services.publisher
+        message_service = publisher.channels[0].message_service
+        roster = Roster()
+
+        # Fetch: every changed fetch decodes the full payload, unchanged ones hit the 304 path
+        results.append(await measure('fetch_changed', size, knesset_api.fetch_snapshot,
+                                     args.iterations, setup=lambda: stub.step(2)))
+        results.append(await measure('fetch_unchanged', size, knesset_api.fetch_snapshot,
+                                     args.iterations))
+
+        payload = stub.payload
+
+        async def decode():
+            decode_lobby(payload)
+        results.append(await measure('decode', size, decode, args.iterations))
+
+        data = knesset_api.last_data
+
+        async def diff():
+            roster.update(data.mks)
+            roster.differs_from(mask)
+        roster.update(data.mks)
+        mask = roster.present.copy()
+        mask[:2] ^= True
+        results.append(await measure('diff', size, diff, args.iterations))
+
+        async def summary():
+            message_service.get_faction_summary(roster)
+        results.append(await measure('faction_summary', size, summary, args.iterations))
+
+        # Every run starts from an empty photo cache
+        async def prefetch():
+            image_service.photo_cache = PhotoCache(services.http_client, tile_size=image_service.img_size,
+                                                   cache_dir=Path(tempfile.mkdtemp(dir=workdir)))
+            await image_service.prefetch_member_images(data.mks)
+        results.append(await measure('photo_prefetch_cold', size, prefetch,
+                                     max(1, args.iterations // 10), warmup=0))
+
+        present = [m for m in data.mks if m.is_present]
+        if len(present) > MAX_RENDER_MEMBERS:
+            note = f"{len(present)} present members exceed the JPEG canvas limit"
+            for name in ('render_full', 'render_incremental', 'jpeg_encode', 'budget_encode'):
+                results.append(skipped(name, size, note))
+        else:
+            # Compositing only: tiles are looked up once, outside the timed runs
+            entries = []
+            for member in sorted(present, key=hebrew_sort_key):
+                photo = await image_service.download_member_image(member.image_path, allow_stale=True)
+                entries.append(TileEntry(str(member.mk_id), photo, member.firstname, member.lastname))
+            compositor = image_service.compositor
+
+            async def render():
+                return await render_pool.run(compositor.render, entries)
+            results.append(await measure('render_full', size, render, args.iterations,
+                                         setup=compositor.reset))
+
+            # Toggle the middle member, so every slot after it shifts on each render
+            toggled = entries[len(entries) // 2]
+            variants = [entries, [e for e in entries if e is not toggled]]
+            state = {'i': 0}
+
+            async def render_incremental():
+                state['i'] += 1
+                await render_pool.run(compositor.render, variants[state['i'] % 2])
+            results.append(await measure('render_incremental', size, render_incremental,
+                                         args.iterations))
+
+            image = await image_service.create_presence_image(present)
+
+            # Full-size JPEG without a byte budget, for comparison
+            full_jpeg = ImageEncoder(image_format='jpeg', max_bytes=0, max_side=0)
+
+            async def encode():
+                full_jpeg.encode(image)
+            results.append(await measure('jpeg_encode', size, encode, args.iterations))
+
+            # Byte-budgeted encode as used for uploads (the note shows its output)
+            encoder = ImageEncoder()
+
+            async def budget_encode():
+                return encoder.encode(image)
+            result = await measure('budget_encode', size, budget_encode, args.iterations)
+            result.note = encoder.encode(image).describe()
+            results.append(result)
+
+        if len(present) > MAX_RENDER_MEMBERS:
+            results.append(skipped('full_cycle', size, 'render skipped at this size'))
+        else:
+            state_manager = StateManager(workdir / f"bot_state_{size}.json",
+                                         workdir / f"roster_snapshot_{size}.json")
+            cycle_roster = Roster()
+
+            async def cycle():
+                await poll_cycle(knesset_api, cycle_roster, publisher, state_manager)
+            changes = iter(range(1 << 30))
+            try:
+                results.append(await measure(
+                    'full_cycle', size, cycle, args.iterations,
+                    # Presence changes on every other poll, like a busy session
+                    setup=lambda: stub.step(1) if next(changes) % 2 else None))
+            finally:
+                state_manager.close()
+    return results
+
+
+async def poll_cycle(knesset_api, roster, publisher, state_manager) -> None:
+    """One iteration of the main loop: fetch, diff, captions, publish to every chat, save state."""
+    result = await knesset_api.fetch_snapshot()
+    if result is None:
+        raise RuntimeError("Fetch from the stand-in failed")
+    if result.changed and roster.update(result.data.mks):
+        publisher.on_layout_change(roster, result.data.mks)
+    captions = publisher.captions(roster, result.stale)
+    present_members = [m for m in result.data.mks if m.is_present]
+    await publisher.publish(roster, present_members, captions)
+    state_manager.update(channels=publisher.channel_states(), etag=knesset_api.etag,
+                         last_modified=knesset_api.last_modified, payload_digest=knesset_api.digest)
+    publisher.file_ids.save()
+
+
+def print_table(results: List[Result], stats: Dict[str, int]) -> None:
+    header = f"{'benchmark':<22}{'size':>7}{'ops/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'peak KiB':>11}{'RSS MiB':>9}"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        row = result.as_dict()
+        if not result.timings:
+            print(f"{row['name']:<22}{row['size']:>7}  skipped: {row['note']}")
+            continue
+        print(f"{row['name']:<22}{row['size']:>7}{row['ops_per_s']:>11.1f}{row['p50_ms']:>10.2f}"
+              f"{row['p95_ms']:>10.2f}{row['peak_kb']:>11.0f}{row['rss_mb']:>9.0f}"
+              + (f"  {row['note']}" if row['note'] else ''))
+    print()
+    print("Stand-in traffic: " + ", ".join(f"{name}={value}" for name, value in sorted(stats.items())))
+
+
+def check(results: List[Result]) -> List[str]:
+    """Expectations the results must meet; returns the failed ones."""
+    by_name = {(result.name, result.size): result for result in results if result.timings}
+    failures = []
+    for (name, size), full in by_name.items():
+        incremental = by_name.get(('render_incremental', size))
+        if name == 'render_full' and incremental and incremental.percentile(0.5) >= full.percentile(0.5):
+            failures.append(f"render_incremental p50 {incremental.percentile(0.5):.2f} ms is not below "
+                            f"render_full p50 {full.percentile(0.5):.2f} ms at size {size}")
+    return failures
+
+
+async def main(args) -> List[Result]:
+    port = free_port()
+    workdir = Path(tempfile.mkdtemp(prefix='knesset-bench-'))
+    # Every presence change is published right away, so full_cycle includes the photo path
+    configure_environment(port, workdir, {'RENDER_POOL_KIND': args.render_pool, 'CHANGE_SETTLE_SECONDS': '0'})
+
+    from simulation.stub_server import StubServer
+    # Per-request INFO logs would dominate the timings
+    logging.getLogger().setLevel(logging.WARNING)
+    stub = StubServer(port=port, knesset_latency=args.knesset_latency, photo_latency=args.photo_latency,
+                      telegram_latency=args.telegram_latency, rate_limit_every=args.rate_limit_every,
+                      retry_after=args.retry_after)
+    await stub.start()
+    results = []
+    try:
+        for size in args.sizes:
+            results.extend(await run_size(stub, size, args, workdir))
+    finally:
+        await stub.stop()
+
+    print_table(results, stub.stats)
+    if args.json:
+        output = Path(args.json)
+        if not output.is_absolute():
+            output = Path(args.cwd) / output
+        output.write_text(json.dumps({
+            'sizes': args.sizes, 'iterations': args.iterations,
+            'results': [result.as_dict() for result in results],
+            'stub_stats': dict(stub.stats)
+        }, indent=2))
+        print(f"Results written to {output}")
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--sizes', type=lambda s: [int(x) for x in s.split(',')], default=[120, 1000, 10000],
+                        help="Comma-separated roster sizes (default: 120,1000,10000)")
+    parser.add_argument('--iterations', type=int, default=20, help="Timed runs per benchmark")
+    parser.add_argument('--knesset-latency', type=float, default=0.0, help="Seconds added to Knesset responses")
+    parser.add_argument('--photo-latency', type=float, default=0.0, help="Seconds added to photo responses")
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="Seconds added to Telegram responses")
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help="Answer every N-th Telegram call with 429 (0 disables)")
+    parser.add_argument('--retry-after', type=float, default=0.05, help="retry_after of injected 429s")
+    parser.add_argument('--telegram-rate', type=float, default=1_000_000,
+                        help="Dispatcher rate limit per minute (default: effectively unlimited)")
+    parser.add_argument('--render-pool', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--json', help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+    args.cwd = os.getcwd()
+    return args
+
+
+if __name__ == "__main__":
+    failures = check(asyncio.run(main(parse_args())))
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,68 @@
+from typing import Dict, Optional
+import httpx
+from utils.logger import logger
+from config import (HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_MAX_CONNECTIONS,
+                    HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED)
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional 'h2' package (httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpClient:
+    """
+    Shared async HTTP client used by KnessetAPI, TelegramAPI and ImageService.
+
+    Keeps one keep-alive connection pool per host so consecutive requests in a
+    cycle reuse TLS connections instead of doing a fresh handshake each time.
+    Requests to hosts with broken certificates (the Knesset site) go through a
+    separate non-verifying pool, so Telegram traffic is always verified.
+    """
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT, connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 max_connections: int = HTTP_MAX_CONNECTIONS, max_keepalive: int = HTTP_MAX_KEEPALIVE,
+                 keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY, http2: bool = HTTP2_ENABLED):
+        """Initialize HttpClient; underlying pools are created on first use."""
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.http2 = http2 and _http2_available()
+        if http2 and not self.http2:
+            logger.warning("HTTP/2 requested but 'h2' is not installed, falling back to HTTP/1.1")
+        self._clients: Dict[bool, httpx.AsyncClient] = {}
+
+    def _get_client(self, verify: bool) -> httpx.AsyncClient:
+        """Return the pooled client for the given TLS verification mode."""
+        client = self._clients.get(verify)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits,
+                                       http2=self.http2, verify=verify)
+            self._clients[verify] = client
+        return client
+
+    async def get(self, url: str, verify: bool = True, **kwargs) -> httpx.Response:
+        """Send a GET request through the shared pool."""
+        return await self._get_client(verify).get(url, **kwargs)
+
+    async def post(self, url: str, verify: bool = True, **kwargs) -> httpx.Response:
+        """Send a POST request through the shared pool."""
+        return await self._get_client(verify).post(url, **kwargs)
+
+    async def close(self) -> None:
+        """Close all pooled connections."""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    async def __aenter__(self) -> "HttpClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> Optional[bool]:
+        await self.close()
+        return None
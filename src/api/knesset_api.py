@@ -1,31 +1,241 @@
-import requests
-import urllib3
+import asyncio
+import hashlib
+import random
+import time
+from typing import Dict, NamedTuple, Optional
+import httpx
 from utils.logger import logger
-from config import KNESSET_API_URL
+from utils.metrics import metrics
+from config import (KNESSET_API_URL, FETCH_ATTEMPTS, FETCH_RETRY_DELAY, FETCH_MIN_DEADLINE, FETCH_MAX_DEADLINE,
+                    FETCH_DEADLINE_FACTOR, FETCH_HEDGE_ENABLED, FETCH_HEDGE_QUANTILE)
+from api.http_client import HttpClient
+from api.resilience import CircuitBreaker, LatencyWindow
+from models.member import KnessetMember, LobbyData, decode_lobby
+
+
+class FetchResult(NamedTuple):
+    """Presence payload plus whether it differs from the previous fetch (stale: upstream unreachable)."""
+    data: LobbyData
+    changed: bool
+    stale: bool = False
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 class KnessetAPI:
-    @staticmethod
-    async def fetch_data():
+    """
+    Knesset lobby presence client.
+
+    Each attempt has a deadline of a few times the observed p99 latency
+    (bounded by FETCH_MIN_DEADLINE/FETCH_MAX_DEADLINE), and an attempt still
+    running after the FETCH_HEDGE_QUANTILE latency gets a second, hedged
+    request; whichever answers first wins. Failed attempts are retried
+    after a short jittered delay. Fetches that fail every attempt trip a
+    circuit breaker, and while it is open the last good snapshot is served
+    as stale without calling upstream.
+    """
+
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'Accept': 'application/json',
+        'Accept-Language': 'he-IL,he;q=0.9,en-US;q=0.8,en;q=0.7',
+        'Referer': 'https://www.knesset.gov.il/',
+        'Origin': 'https://www.knesset.gov.il'
+    }
+
+    def __init__(self, http_client: HttpClient):
+        """Initialize KnessetAPI with the shared HTTP client."""
+        self.http = http_client
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.digest: Optional[str] = None
+        self.last_data: Optional[LobbyData] = None
+        self.last_payload: Optional[bytes] = None
+        self._records: Dict[int, KnessetMember] = {}
+        self.latency = LatencyWindow()
+        self.breaker = CircuitBreaker()
+
+    def restore(self, etag: Optional[str], last_modified: Optional[str], digest: Optional[str],
+                payload: Optional[bytes] = None) -> None:
+        """
+        Reload the validators (and payload) of the last fetch before a restart.
+
+        With the saved payload of that fetch, the first request is conditional
+        and a 304 is served from it without a download. Without it, conditional
+        headers are only sent once a payload is held again, but a first
+        response with the same body digest is reported as unchanged.
+        """
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        if payload is not None and digest and hashlib.sha256(payload).hexdigest() == digest:
+            try:
+                with metrics.time('decode'):
+                    self.last_data = self._decode(payload)
+                self.last_payload = payload
+                logger.info("Restored roster snapshot with %d members", len(self.last_data.mks))
+            except Exception as e:
+                logger.warning("Ignoring undecodable roster snapshot: %s", e)
+
+    def _conditional_headers(self) -> Dict[str, str]:
+        headers = dict(self.HEADERS)
+        if self.last_data is not None:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def deadline(self) -> float:
+        """Per-attempt deadline in seconds, from the observed latency."""
+        p99 = self.latency.quantile(0.99)
+        if p99 is None:
+            return FETCH_MAX_DEADLINE
+        return min(FETCH_MAX_DEADLINE, max(FETCH_MIN_DEADLINE, p99 * FETCH_DEADLINE_FACTOR))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a slow attempt is hedged (None: don't hedge)."""
+        if not FETCH_HEDGE_ENABLED:
+            return None
+        return self.latency.quantile(FETCH_HEDGE_QUANTILE)
+
+    def retry_in(self) -> Optional[float]:
+        """Seconds until an open circuit lets a probe through (None unless open)."""
+        return self.breaker.retry_in()
+
+    async def _get(self, headers: Dict[str, str], deadline: float) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.http.get(KNESSET_API_URL, headers=headers, verify=False, timeout=deadline)
+        if response.status_code != 304:
+            response.raise_for_status()
+        self.latency.observe(time.perf_counter() - started)
+        return response
+
+    async def _attempt(self, headers: Dict[str, str]) -> httpx.Response:
+        """One attempt: a request, hedged by a second one if it outlasts the hedge delay, within the deadline."""
+        loop = asyncio.get_running_loop()
+        deadline = self.deadline()
+        end = loop.time() + deadline
+        hedge_at = self.hedge_delay()
+        if hedge_at is not None:
+            hedge_at = loop.time() + hedge_at if hedge_at < deadline else None
+        pending = {asyncio.ensure_future(self._get(headers, deadline))}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                wake = end if hedge_at is None else hedge_at
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, wake - loop.time()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if hedge_at is not None and pending and loop.time() >= hedge_at:
+                    # Slower than usual: the first answer of the two is used
+                    hedge_at = None
+                    metrics.inc('knesset_hedged_total')
+                    pending.add(asyncio.ensure_future(self._get(headers, max(0.0, end - loop.time()))))
+                elif loop.time() >= end:
+                    raise asyncio.TimeoutError(f"no response within {deadline:.1f}s")
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _stale(self) -> Optional[FetchResult]:
+        return FetchResult(self.last_data, False, stale=True) if self.last_data is not None else None
+
+    async def fetch_snapshot(self) -> Optional[FetchResult]:
+        """
+        Fetch presence data, skipping the JSON parse when nothing changed.
+
+        Uses ETag/If-Modified-Since when the server supports them and falls
+        back to comparing a digest of the response body.
+
+        Returns:
+            Optional[FetchResult]: Payload and change flag; the last payload
+                marked stale while upstream is failing, or None on failure
+                without one
+        """
+        if not self.breaker.allow():
+            metrics.inc('knesset_fetches_total', result='stale')
+            return self._stale()
+
+        # A half-open circuit is probed with a single attempt
+        attempts = 1 if self.breaker.state == CircuitBreaker.HALF_OPEN else max(1, FETCH_ATTEMPTS)
+        headers = self._conditional_headers()
+        response = None
+        with metrics.time('fetch'):
+            for attempt in range(attempts):
+                try:
+                    response = await self._attempt(headers)
+                    metrics.inc('knesset_attempts_total', result='ok')
+                    break
+                except (httpx.HTTPError, asyncio.TimeoutError) as e:
+                    metrics.inc('knesset_attempts_total', result='timeout' if isinstance(
+                        e, (asyncio.TimeoutError, httpx.TimeoutException)) else 'error')
+                    logger.warning("Knesset fetch attempt %s/%s failed: %r", attempt + 1, attempts, e)
+                    if attempt + 1 < attempts:
+                        await asyncio.sleep(FETCH_RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5))
+
+        if response is None:
+            was_open = self.breaker.state == CircuitBreaker.OPEN
+            self.breaker.record_failure()
+            if self.breaker.state == CircuitBreaker.OPEN:
+                metrics.set('knesset_circuit_open', 1)
+                if not was_open:
+                    logger.error("Knesset API unavailable, pausing requests for %.0fs", self.breaker.cooldown)
+            metrics.inc('knesset_fetches_total', result='error')
+            return self._stale()
+        if self.breaker.state == CircuitBreaker.HALF_OPEN:
+            logger.info("Knesset API reachable again")
+        self.breaker.record_success()
+        metrics.set('knesset_circuit_open', 0)
+
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'application/json',
-                'Accept-Language': 'he-IL,he;q=0.9,en-US;q=0.8,en;q=0.7',
-                'Referer': 'https://www.knesset.gov.il/',
-                'Origin': 'https://www.knesset.gov.il'
-            }
-            
-            response = requests.get(KNESSET_API_URL, headers=headers, verify=False)
-            logger.info(f"Response status code: {response.status_code}")
-            
+            logger.info("Response status code: %s", response.status_code)
+
+            if response.status_code == 304 and self.last_data is not None:
+                metrics.inc('knesset_fetches_total', result='not_modified')
+                return FetchResult(self.last_data, False)
+
             response.raise_for_status()
-            data = response.json()
-            
-            logger.info(f"Successfully fetched data with {len(data.get('mks', []))} members")
-            return data
-            
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+
+            metrics.inc('knesset_bytes_total', len(response.content))
+            digest = hashlib.sha256(response.content).hexdigest()
+            if digest == self.digest and self.last_data is not None:
+                metrics.inc('knesset_fetches_total', result='unchanged')
+                return FetchResult(self.last_data, False)
+
+            with metrics.time('decode'):
+                data = self._decode(response.content)
+            # Same body as before a restart: decoded again, but not a change
+            changed = digest != self.digest
+            self.digest = digest
+            self.last_data = data
+            self.last_payload = response.content
+
+            logger.info("Successfully fetched data with %d members", len(data.mks))
+            metrics.inc('knesset_fetches_total', result='changed' if changed else 'unchanged')
+            return FetchResult(data, changed)
+
         except Exception as e:
-            logger.error(f"Error fetching Knesset data: {e}")
-            return None
\ No newline at end of file
+            metrics.inc('knesset_fetches_total', result='error')
+            logger.error("Error fetching Knesset data: %s", e)
+            return self._stale()
+
+    def _decode(self, content: bytes) -> LobbyData:
+        """Decode the payload, keeping the previous record of every unchanged member."""
+        data = decode_lobby(content)
+        records = {}
+        for i, member in enumerate(data.mks):
+            previous = self._records.get(member.mk_id)
+            if previous is None or previous != member:
+                previous = member.interned()
+            data.mks[i] = records[member.mk_id] = previous
+        self._records = records
+        return data
+
+    async def fetch_data(self) -> Optional[LobbyData]:
+        result = await self.fetch_snapshot()
+        return result.data if result else None
\ No newline at end of file
@@ -0,0 +1,85 @@
+import time
+from collections import deque
+from typing import Deque, Optional
+from config import (FETCH_LATENCY_WINDOW, BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN, BREAKER_MAX_COOLDOWN)
+
+
+class LatencyWindow:
+    """Rolling window of recent successful request latencies."""
+
+    def __init__(self, size: int = FETCH_LATENCY_WINDOW, min_samples: int = 10):
+        """
+        Initialize LatencyWindow.
+
+        Args:
+            size: Latencies to keep
+            min_samples: Latencies needed before quantiles are reported
+        """
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Latency quantile over the window, None until enough requests were seen."""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream that keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls are refused for `cooldown` seconds; then one probe is let through
+    (half-open). A successful probe closes the circuit, a failed one opens
+    it again for twice as long, up to `max_cooldown`.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, cooldown: float = BREAKER_COOLDOWN,
+                 max_cooldown: float = BREAKER_MAX_COOLDOWN):
+        """Initialize a closed CircuitBreaker."""
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_cooldown = cooldown
+        self.max_cooldown = max(max_cooldown, cooldown)
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        """Whether a call may go out now; moves an open circuit to half-open once it cooled down."""
+        if self.state == self.OPEN:
+            now = time.monotonic() if now is None else now
+            if now - self.opened_at < self.cooldown:
+                return False
+            self.state = self.HALF_OPEN
+        return True
+
+    def retry_in(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until an open circuit lets a probe through (None unless open)."""
+        if self.state != self.OPEN:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.opened_at + self.cooldown - now)
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+
+    def record_failure(self, now: Optional[float] = None) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+        elif self.failures < self.failure_threshold:
+            return
+        self.state = self.OPEN
+        self.opened_at = time.monotonic() if now is None else now
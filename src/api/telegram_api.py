@@ -1,101 +1,143 @@
-import requests
-from typing import List, Dict, Any
-import io
+import json
+from typing import List, Dict, Any, Optional, Union
 from utils.logger import logger
+from utils.metrics import metrics
 from config import TELEGRAM_API, CHANNEL_ID
-from PIL import Image
+from api.http_client import HttpClient
+from services.image_service import ImageService
+from services.image_encoder import EncodeResult
 
 
 class TelegramAPI:
-    def __init__(self):
-        """Initialize TelegramAPI with ImageService."""
-        from services.image_service import ImageService
-        self.image_service = ImageService()
+    def __init__(self, http_client: HttpClient, image_service: ImageService):
+        """Initialize TelegramAPI with the shared HTTP client and ImageService."""
+        self.http = http_client
+        self.image_service = image_service
 
     @staticmethod
-    def _image_to_bytes(image: Image.Image) -> bytes:
-        """Convert PIL Image to bytes."""
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='JPEG', quality=95)
-        img_byte_arr.seek(0)
-        return img_byte_arr.getvalue()
-
-    async def send_photo(self, members_data: List[Dict[str, Any]], caption: str):
-        """Send photo with present members to Telegram."""
-        try:
-            # Filter for present members only
-            present_members = [m for m in members_data if m['IsPresent']]
-
-            # Create image using ImageService
-            image = await self.image_service.create_presence_image(present_members)
-            if image is None:
-                logger.error("Failed to create presence image")
-                return None
-
-            # Convert image to bytes
-            image_bytes = self._image_to_bytes(image)
-
-            files = {
-                'photo': ('presence.jpg', image_bytes, 'image/jpeg'),
-            }
-
-            data = {
-                'chat_id': CHANNEL_ID,
-                'caption': caption,
-                'parse_mode': 'HTML'
-            }
-
-            response = requests.post(
-                f"{TELEGRAM_API}/sendPhoto",
-                data=data,
-                files=files
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('ok'):
-                    return result['result']['message_id']
-                else:
-                    logger.error(f"Telegram API returned not OK: {result}")
-                    return None
+    def is_not_modified(result: Dict[str, Any]) -> bool:
+        """Whether an edit failed only because the content was already up to date."""
+        return 'message is not modified' in result.get('description', '')
 
-            logger.error(f"Error sending photo: {response.text}")
+    @staticmethod
+    def retry_after(result: Dict[str, Any]) -> Optional[float]:
+        """Seconds to wait before retrying a rate-limited (429) request, if any."""
+        if result.get('error_code') != 429:
             return None
+        return float(result.get('parameters', {}).get('retry_after', 1))
 
-        except Exception as e:
-            logger.error(f"Error sending photo: {e}")
-            logger.exception("Full traceback:")
-            return None
+    async def request(self, method: str, data: Dict[str, Any],
+                      files: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Call a Bot API method.
 
-    async def update_caption(self, message_id: int, caption: str) -> bool:
-        """Update caption of existing message."""
+        Returns:
+            Dict[str, Any]: Decoded Telegram response; transport errors are reported
+            as {'ok': False, 'error_code': None, 'description': ...}
+        """
         try:
-            if not message_id:
-                logger.error("Invalid message_id: cannot be None or empty")
-                return False
-
-            data = {
-                'chat_id': CHANNEL_ID,
-                'message_id': message_id,
-                'caption': caption,
-                'parse_mode': 'HTML'
-            }
-
-            response = requests.post(
-                f"{TELEGRAM_API}/editMessageCaption",
-                data=data
-            )
-
-            if response.status_code == 200:
+            response = await self.http.post(f"{TELEGRAM_API}/{method}", data=data, files=files)
+            try:
                 result = response.json()
-                if not result.get('ok'):
-                    logger.error(f"Telegram API returned not OK: {result}")
-                    return False
-                return True
-
-            logger.error(f"Error updating caption. Status code: {response.status_code}, Response: {response.text}")
-            return False
+            except ValueError:
+                result = {'ok': False, 'error_code': response.status_code, 'description': response.text}
+
+            if not result.get('ok') and not self.is_not_modified(result):
+                logger.error("Telegram API %s returned not OK: %s", method, result)
+            if result.get('ok'):
+                label = 'ok'
+            else:
+                # A failed response without an error code gets a fixed label, never 'None'
+                label = str(result['error_code']) if result.get('error_code') is not None else 'error'
+            metrics.inc('telegram_requests_total', method=method, result=label)
+            return result
 
         except Exception as e:
-            logger.error(f"Error updating caption: {e}")
-            return False
\ No newline at end of file
+            metrics.inc('telegram_requests_total', method=method, result='transport_error')
+            logger.error("Error calling Telegram API %s: %s", method, e)
+            return {'ok': False, 'error_code': None, 'description': str(e)}
+
+    async def upload_photo(self, photo: EncodeResult, caption: str, chat_id: str = CHANNEL_ID) -> Dict[str, Any]:
+        """Upload an encoded photo with caption to a chat (the channel by default)."""
+        files = {
+            'photo': (photo.filename, photo.data, photo.mime_type),
+        }
+
+        data = {
+            'chat_id': chat_id,
+            'caption': caption,
+            'parse_mode': 'HTML'
+        }
+
+        with metrics.time('upload'):
+            result = await self.request('sendPhoto', data, files)
+        if result.get('ok'):
+            metrics.inc('telegram_upload_bytes_total', len(photo.data))
+        return result
+
+    async def send_cached_photo(self, file_id: str, caption: str, chat_id: str = CHANNEL_ID) -> Dict[str, Any]:
+        """Send a previously uploaded photo by its Telegram file_id."""
+        data = {
+            'chat_id': chat_id,
+            'photo': file_id,
+            'caption': caption,
+            'parse_mode': 'HTML'
+        }
+
+        return await self.request('sendPhoto', data)
+
+    async def send_media_group(self, photos: List[Union[str, EncodeResult]], caption: str,
+                               chat_id: str = CHANNEL_ID) -> Dict[str, Any]:
+        """
+        Send photos as one album; the caption goes on the first photo.
+
+        Args:
+            photos: file_ids of earlier uploads, or encoded images to upload
+            caption: Album caption
+        """
+        media = []
+        files = {}
+        for index, photo in enumerate(photos):
+            if isinstance(photo, str):
+                item = {'type': 'photo', 'media': photo}
+            else:
+                name = f"page{index}"
+                files[name] = (photo.filename, photo.data, photo.mime_type)
+                item = {'type': 'photo', 'media': f"attach://{name}"}
+            if index == 0:
+                item.update(caption=caption, parse_mode='HTML')
+            media.append(item)
+
+        data = {
+            'chat_id': chat_id,
+            'media': json.dumps(media, ensure_ascii=False)
+        }
+
+        with metrics.time('upload'):
+            result = await self.request('sendMediaGroup', data, files or None)
+        if result.get('ok'):
+            metrics.inc('telegram_upload_bytes_total', sum(len(data) for _, data, _ in files.values()))
+        return result
+
+    @staticmethod
+    def media_group_file_ids(result: Dict[str, Any]) -> List[Optional[str]]:
+        """file_id of the largest size of every photo in a sent album, in order."""
+        return [sizes[-1]['file_id'] if sizes else None
+                for sizes in (message.get('photo') or [] for message in result.get('result') or [])]
+
+    @staticmethod
+    def photo_file_id(result: Dict[str, Any]) -> Optional[str]:
+        """Return the file_id of the largest size of a sent photo."""
+        sizes = result.get('result', {}).get('photo') or []
+        return sizes[-1]['file_id'] if sizes else None
+
+    async def edit_caption(self, message_id: int, caption: str, chat_id: str = CHANNEL_ID) -> Dict[str, Any]:
+        """Edit the caption of an existing message."""
+        data = {
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'caption': caption,
+            'parse_mode': 'HTML'
+        }
+
+        return await self.request('editMessageCaption', data)
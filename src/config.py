@@ -7,15 +7,110 @@ load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 CHANNEL_ID = os.getenv("CHANNEL_ID")
 KNESSET_API_URL = os.getenv("KNESSET_API_URL")
-TELEGRAM_API = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}"
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+TELEGRAM_API = f"{TELEGRAM_API_BASE}/bot{TELEGRAM_TOKEN}"
 
 POLLING_INTERVAL = int(os.getenv("POLLING_INTERVAL", 60))
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", 3))
+POLL_MIN_INTERVAL = int(os.getenv("POLL_MIN_INTERVAL", 15))
+POLL_MAX_INTERVAL = int(os.getenv("POLL_MAX_INTERVAL", 15 * 60))
+POLL_BACKOFF_FACTOR = float(os.getenv("POLL_BACKOFF_FACTOR", 2))
+POLL_ACTIVE_HOURS = os.getenv("POLL_ACTIVE_HOURS", "8-23")
+POLL_ACTIVE_DAYS = os.getenv("POLL_ACTIVE_DAYS", "6,0,1,2,3")
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 30))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 10))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+
+# Knesset fetch: attempt deadlines follow the observed latency, within these bounds
+FETCH_ATTEMPTS = int(os.getenv("FETCH_ATTEMPTS", 3))
+FETCH_RETRY_DELAY = float(os.getenv("FETCH_RETRY_DELAY", 0.5))
+FETCH_MIN_DEADLINE = float(os.getenv("FETCH_MIN_DEADLINE", 2))
+FETCH_MAX_DEADLINE = float(os.getenv("FETCH_MAX_DEADLINE", 10))
+FETCH_DEADLINE_FACTOR = float(os.getenv("FETCH_DEADLINE_FACTOR", 3))
+FETCH_HEDGE_ENABLED = os.getenv("FETCH_HEDGE_ENABLED", "true").lower() == "true"
+FETCH_HEDGE_QUANTILE = float(os.getenv("FETCH_HEDGE_QUANTILE", 0.95))
+FETCH_LATENCY_WINDOW = int(os.getenv("FETCH_LATENCY_WINDOW", 100))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 3))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", 30))
+BREAKER_MAX_COOLDOWN = float(os.getenv("BREAKER_MAX_COOLDOWN", 5 * 60))
+
+TELEGRAM_RATE_PER_MINUTE = float(os.getenv("TELEGRAM_RATE_PER_MINUTE", 20))
+TELEGRAM_RATE_BURST = int(os.getenv("TELEGRAM_RATE_BURST", 3))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", 3))
+CAPTION_REFRESH_INTERVAL = int(os.getenv("CAPTION_REFRESH_INTERVAL", 5 * 60))
+CHANGE_SETTLE_SECONDS = float(os.getenv("CHANGE_SETTLE_SECONDS", 60))
+CHANGE_MAX_DELAY_SECONDS = float(os.getenv("CHANGE_MAX_DELAY_SECONDS", 5 * 60))
+CHANGE_MIN_DELTA = int(os.getenv("CHANGE_MIN_DELTA", 1))
+FILE_ID_CACHE_SIZE = int(os.getenv("FILE_ID_CACHE_SIZE", 1000))
+TELEGRAM_GLOBAL_RATE_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_RATE_PER_SECOND", 25))
 
 BASE_DIR = Path(__file__).parent.parent
-CACHE_DIR = BASE_DIR / "image_cache"
+CACHE_DIR = Path(os.getenv("CACHE_DIR", BASE_DIR / "image_cache"))
 STORAGE_FILE = BASE_DIR / "bot_state.json"
+ROSTER_SNAPSHOT_FILE = BASE_DIR / "roster_snapshot.json"
+FILE_ID_CACHE_FILE = BASE_DIR / "file_ids.json"
+HISTORY_DIR = BASE_DIR / "history"
+ATTENDANCE_FILE = BASE_DIR / "attendance.json"
+DESTINATIONS_FILE = Path(os.getenv("DESTINATIONS_FILE", BASE_DIR / "destinations.json"))
 FONT_PATH = BASE_DIR / "assets" / "fonts" / "ARIAL.TTF"
+PROFILE_DIR = BASE_DIR / "profiles"
+
+PHOTO_CACHE_MEMORY_ITEMS = int(os.getenv("PHOTO_CACHE_MEMORY_ITEMS", 200))
+PHOTO_CACHE_MAX_BYTES = int(os.getenv("PHOTO_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+PHOTO_CACHE_REVALIDATE_AFTER = int(os.getenv("PHOTO_CACHE_REVALIDATE_AFTER", 24 * 60 * 60))
+PHOTO_PREFETCH_CONCURRENCY = int(os.getenv("PHOTO_PREFETCH_CONCURRENCY", 16))
+PHOTO_PREFETCH_PER_HOST = int(os.getenv("PHOTO_PREFETCH_PER_HOST", 6))
+PHOTO_WARMUP_ON_START = os.getenv("PHOTO_WARMUP_ON_START", "true").lower() == "true"
+
+RENDER_POOL_KIND = os.getenv("RENDER_POOL_KIND", "thread")
+RENDER_POOL_WORKERS = int(os.getenv("RENDER_POOL_WORKERS", 2))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", 95))
+# 'off' sends one tall image; 'pages' and 'bloc' (coalition and opposition apart) send an album of pages
+ALBUM_MODE = os.getenv("ALBUM_MODE", "off")
+ALBUM_PAGE_SIZE = int(os.getenv("ALBUM_PAGE_SIZE", 24))
+ENCODE_FORMAT = os.getenv("ENCODE_FORMAT", "jpeg")
+ENCODE_MAX_BYTES = int(os.getenv("ENCODE_MAX_BYTES", 1024 * 1024))
+ENCODE_MAX_SIDE = int(os.getenv("ENCODE_MAX_SIDE", 2560))
+ENCODE_MIN_WIDTH = int(os.getenv("ENCODE_MIN_WIDTH", 480))
+ENCODE_MIN_QUALITY = int(os.getenv("ENCODE_MIN_QUALITY", 60))
+ENCODE_SUBSAMPLING = os.getenv("ENCODE_SUBSAMPLING", "4:2:0")
+ENCODE_PROGRESSIVE = os.getenv("ENCODE_PROGRESSIVE", "true").lower() == "true"
+ENCODE_CACHE_ITEMS = int(os.getenv("ENCODE_CACHE_ITEMS", 8))
+
+HISTORY_KEYFRAME_INTERVAL = int(os.getenv("HISTORY_KEYFRAME_INTERVAL", 64))
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", 365))
+
+ATTENDANCE_REPORT_ENABLED = os.getenv("ATTENDANCE_REPORT_ENABLED", "false").lower() == "true"
+# Israel time after which the day's report is sent, and the weekday (Monday=0) that also gets a weekly one
+ATTENDANCE_REPORT_TIME = os.getenv("ATTENDANCE_REPORT_TIME", "23:00")
+ATTENDANCE_WEEKLY_DAY = int(os.getenv("ATTENDANCE_WEEKLY_DAY", 2))
+ATTENDANCE_REPORT_TOP = int(os.getenv("ATTENDANCE_REPORT_TOP", 10))
+ATTENDANCE_RETENTION_DAYS = int(os.getenv("ATTENDANCE_RETENTION_DAYS", 35))
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9464))
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", 256))
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+
+SNAPSHOT_API_ENABLED = os.getenv("SNAPSHOT_API_ENABLED", "false").lower() == "true"
+SNAPSHOT_API_HOST = os.getenv("SNAPSHOT_API_HOST", "127.0.0.1")
+SNAPSHOT_API_PORT = int(os.getenv("SNAPSHOT_API_PORT", 9465))
+SNAPSHOT_LONG_POLL_MAX = float(os.getenv("SNAPSHOT_LONG_POLL_MAX", 60))
+SNAPSHOT_SSE_KEEPALIVE = float(os.getenv("SNAPSHOT_SSE_KEEPALIVE", 15))
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Per-module overrides, e.g. "photo_cache=DEBUG,httpx=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "httpx=WARNING")
+LOG_FILE = os.getenv("LOG_FILE", "knesset_bot.log")
+LOG_FILE_FORMAT = os.getenv("LOG_FILE_FORMAT", "json")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_ROTATE_HOURS = float(os.getenv("LOG_ROTATE_HOURS", 24))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 14))
 
 RLM = '\u200F'
 LRM = '\u200E'
@@ -1,75 +1,170 @@
 import asyncio
-from utils.logger import logger
-from utils.state_manager import StateManager
-from api.knesset_api import KnessetAPI
-from api.telegram_api import TelegramAPI
-from services.message_service import MessageService
-from config import POLLING_INTERVAL, MAX_RETRIES
+import itertools
+import os
+import sys
+from pathlib import Path
+from utils.logger import logger, cycle_id
+from utils.metrics import metrics
+from services.service_graph import ServiceGraph
+from config import POLLING_INTERVAL, POLL_MIN_INTERVAL, MAX_RETRIES, PHOTO_WARMUP_ON_START, ATTENDANCE_REPORT_ENABLED
 import time
 
 async def main():
-    state_manager = StateManager()
-    knesset_api = KnessetAPI()
-    message_service = MessageService()
-    telegram_api = TelegramAPI()
+    async with ServiceGraph() as services:
+        await run(services)
+
+async def run(services: ServiceGraph):
+    from services.poll_scheduler import AdaptivePollScheduler
+    from models.roster import Roster
+
+    knesset_api = services.knesset_api
+    image_service = services.image_service
+    publisher = services.publisher
+    history_store = services.history_store
+    state_manager = services.state_manager
+    attendance = services.attendance
+    scheduler = AdaptivePollScheduler()
     
     retries = 0
-    last_message_id, previous_present_members = state_manager.load_state()
+    state = state_manager.load()
+    # Resume from the saved state: known payload, published captions and images,
+    # so the first cycle can be a 304 and publish from cached photos
+    with metrics.time('restore'):
+        knesset_api.restore(state.etag, state.last_modified, state.payload_digest,
+                            state_manager.load_snapshot())
+    snapshot_digest = knesset_api.digest if knesset_api.last_data is not None else None
+    publisher.restore(state.channels)
+    attendance.load()
+    roster_images = None
+    prefetch_task = None
+    warmed_up = not PHOTO_WARMUP_ON_START
+    roster = Roster()
+    polled_mask = None
     
-    logger.info(f"Starting Knesset attendance bot with last message ID: {last_message_id}")
+    logger.info("Starting Knesset attendance bot with last message IDs: %s",
+                ", ".join(f"{c.chat_id}={c.message_id}" for c in publisher.channels))
     
+    cycles = itertools.count(1)
     while True:
         try:
+            # Every record logged during this cycle carries its id
+            cycle_id.set(next(cycles))
             start_time = time.time()
-            data = await knesset_api.fetch_data()
-            if not data:
+            metrics.take_last_stages()
+            result = await knesset_api.fetch_snapshot()
+            if not result:
                 if retries < MAX_RETRIES:
                     retries += 1
-                    logger.warning(f"Failed to fetch data. Retry {retries}/{MAX_RETRIES}")
-                    await asyncio.sleep(POLLING_INTERVAL)
+                    logger.warning("Failed to fetch data. Retry %d/%d", retries, MAX_RETRIES)
+                    # No snapshot to serve yet: back off as before, and at least until an
+                    # open circuit lets the next fetch reach upstream, so no retry is skipped
+                    await asyncio.sleep(max(POLLING_INTERVAL, knesset_api.retry_in() or 0))
                     continue
                 else:
                     logger.error("Max retries reached for data fetch")
                     break
                     
             retries = 0
-            current_present = {member['MkId'] for member in data['mks'] if member['IsPresent']}
-            caption = message_service.get_faction_summary(data['mks'])
+            data = result.data
+            if result.stale:
+                logger.warning("Knesset API unavailable, serving the last snapshot")
 
-            logger.info(f"Current present members: {len(current_present)}")
-            logger.info(f"Previous present members: {len(previous_present_members)}")
+            # An unchanged payload needs no roster or presence work
+            roster_stale = result.changed or polled_mask is None
+            if roster_stale:
+                # Prefetch photos of the whole roster whenever it changes
+                current_images = frozenset(m.image_path for m in data.mks if m.image_path)
+                if current_images != roster_images:
+                    roster_images = current_images
+                    if not warmed_up and image_service.cached_member_images(data.mks) == len(current_images):
+                        # Every photo is on disk already: refresh them in the background
+                        warmed_up = True
+                    if not warmed_up:
+                        logger.info("Warming up photo cache for %d members", len(current_images))
+                        with metrics.time('photo_warmup'):
+                            cached = await image_service.prefetch_member_images(data.mks)
+                        logger.info("Photo cache warm-up done: %d/%d available", cached, len(current_images))
+                        warmed_up = True
+                    elif prefetch_task is None or prefetch_task.done():
+                        prefetch_task = asyncio.create_task(image_service.prefetch_member_images(data.mks))
 
-            if current_present != previous_present_members:
-                present_members = [m for m in data['mks'] if m['IsPresent']]
-                logger.info(f"Change detected! Present members: {len(present_members)}")
-                
-                new_message_id = await telegram_api.send_photo(present_members, caption)
-                if new_message_id:
-                    last_message_id = new_message_id
-                    previous_present_members = current_present
-                    logger.info(f"Saving state with message ID: {last_message_id}")
-                    state_manager.save_state(last_message_id, previous_present_members)
-            else:
-                logger.info("No change in presence, updating existing message")
-                new_message_id = await message_service.update_or_resend(last_message_id, 
-                                                  [m for m in data['mks'] if m['IsPresent']], 
-                                                  caption)
-                if new_message_id and new_message_id != last_message_id:
-                    last_message_id = new_message_id
-                    logger.info(f"Updating state with new message ID: {last_message_id}")
-                    state_manager.save_state(last_message_id, previous_present_members)
+            diff_start = time.perf_counter()
+            if roster_stale and roster.update(data.mks):
+                # New slot layout: masks built on the old one can't be compared
+                publisher.on_layout_change(roster, data.mks)
+                polled_mask = None
+
+            presence_changed = polled_mask is None or roster.differs_from(polled_mask)
+            polled_mask = roster.present
+            metrics.observe_stage('diff', time.perf_counter() - diff_start)
+            if presence_changed:
+                # Written on the history writer thread, not on the event loop
+                history_store.submit(roster.present_ids())
+            captions = publisher.captions(roster, result.stale)
+            if services.snapshot_server is not None and roster_stale:
+                # Readers of the snapshot API get the new state before Telegram does
+                services.snapshot_server.update(roster, data.mks)
+
+            logger.info("Current present members: %d", roster.present_count,
+                        extra={'present': roster.present_count, 'presence_changed': presence_changed})
+
+            present_members = [m for m in data.mks if m.is_present]
+            await publisher.publish(roster, present_members, captions)
+
+            # Only members whose presence changed are visited
+            with metrics.time('attendance'):
+                attendance.observe(roster)
+            if ATTENDANCE_REPORT_ENABLED:
+                days_due = attendance.reports_due()
+                if days_due:
+                    members_by_id = {m.mk_id: m for m in data.mks}
+                    sent = [await publisher.publish_report(attendance.report(roster, days), members_by_id)
+                            for days in days_due]
+                    if all(sent):
+                        attendance.mark_reported()
+            attendance.save()
+
+            # Written on the state writer thread, and only if something changed
+            with metrics.time('state_save'):
+                state_manager.update(channels=publisher.channel_states(),
+                                     etag=knesset_api.etag, last_modified=knesset_api.last_modified,
+                                     payload_digest=knesset_api.digest)
+                if knesset_api.digest != snapshot_digest and knesset_api.last_payload is not None:
+                    state_manager.save_snapshot(knesset_api.last_payload)
+                    snapshot_digest = knesset_api.digest
+                publisher.file_ids.save()
         
             logger.info("Single run completed successfully")
             
             execution_time = time.time() - start_time
-            sleep_time = max(0, POLLING_INTERVAL - execution_time)
+            metrics.observe_stage('cycle', execution_time)
+            metrics.inc('cycles_total')
+            interval = scheduler.next_interval(presence_changed, roster.present_count)
+            due = publisher.next_due()
+            if due is not None:
+                # Come back in time to publish a deferred photo
+                interval = min(interval, due)
+            probe_due = knesset_api.retry_in()
+            if probe_due is not None:
+                # Probe the recovering upstream as soon as the circuit allows
+                interval = min(interval, max(probe_due, POLL_MIN_INTERVAL))
+            report_due = attendance.report_due_in() if ATTENDANCE_REPORT_ENABLED else None
+            if report_due:
+                # Wake up for the end-of-day report; a failed one is retried at the normal pace
+                interval = min(interval, report_due)
+            sleep_time = max(0, interval - execution_time)
             
-            logger.info(f"Run took {execution_time:.2f} seconds")
-            logger.info(f"Waiting {sleep_time:.2f} seconds until next run")
+            stages = {stage: round(seconds * 1000) for stage, seconds in metrics.take_last_stages().items()
+                      if stage != 'cycle'}
+            logger.info("Run took %.2f seconds (%s)", execution_time,
+                        ", ".join(f"{stage}={ms}ms" for stage, ms in stages.items()),
+                        extra={'duration_ms': round(execution_time * 1000), 'stages_ms': stages})
+            logger.info("Waiting %.2f seconds until next run", sleep_time)
             await asyncio.sleep(sleep_time)
         
         except Exception as e:
-            logger.error(f"Error in main execution: {e}", exc_info=True)
+            # The traceback once per run of failures, not on every retry
+            logger.error("Error in main execution: %s", e, exc_info=retries == 0)
             if retries < MAX_RETRIES:
                 retries += 1
                 await asyncio.sleep(POLLING_INTERVAL)
@@ -78,4 +173,7 @@ async def main():
                 await asyncio.sleep(POLLING_INTERVAL)
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["--replay"]:
+        # The replay points config at local stand-ins before importing it, so run it as a fresh process
+        os.execv(sys.executable, [sys.executable, str(Path(__file__).with_name("replay.py")), *sys.argv[2:]])
     asyncio.run(main())
\ No newline at end of file
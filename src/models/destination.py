@@ -0,0 +1,40 @@
+from pathlib import Path
+from typing import List, Literal
+import msgspec
+from config import CHANNEL_ID, DESTINATIONS_FILE, TELEGRAM_RATE_PER_MINUTE, TELEGRAM_RATE_BURST
+from utils.logger import logger
+
+
+class Destination(msgspec.Struct, frozen=True, forbid_unknown_fields=True):
+    """
+    A chat the presence updates are published to.
+
+    Loaded from DESTINATIONS_FILE, a JSON list such as
+    [{"chat_id": "@kneset_israel"}, {"chat_id": "-100123", "language": "en", "caption_format": "compact"}]
+    """
+    chat_id: str
+    language: Literal['he', 'en'] = 'he'
+    caption_format: Literal['full', 'compact'] = 'full'
+    rate_per_minute: float = TELEGRAM_RATE_PER_MINUTE
+    burst: int = TELEGRAM_RATE_BURST
+
+
+def load_destinations(path: Path = DESTINATIONS_FILE) -> List[Destination]:
+    """
+    Read the destination list; without a destinations file, publish to CHANNEL_ID only.
+
+    Raises:
+        ValueError: If the file exists but is invalid or lists a chat twice
+    """
+    if not path.exists():
+        return [Destination(chat_id=str(CHANNEL_ID))]
+    try:
+        destinations = msgspec.json.decode(path.read_bytes(), type=List[Destination])
+    except msgspec.DecodeError as e:
+        raise ValueError(f"Invalid destinations file {path}: {e}") from e
+
+    chat_ids = [d.chat_id for d in destinations]
+    if not destinations or len(set(chat_ids)) != len(chat_ids):
+        raise ValueError(f"Destinations file {path} must list each chat once")
+    logger.info("Publishing to %d destinations: %s", len(destinations), ', '.join(chat_ids))
+    return destinations
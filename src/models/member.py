@@ -1,23 +1,67 @@
-from dataclasses import dataclass
+import sys
+from typing import Any, Dict, List, Optional
+import msgspec
+from utils.logger import logger
 
-@dataclass
-class KnessetMember:
+
+class KnessetMember(msgspec.Struct, frozen=True, gc=False, rename='pascal'):
+    """
+    One member from the Knesset lobby payload.
+
+    Decoded straight from JSON by msgspec: instances are slotted, immutable
+    and not tracked by the garbage collector. Field names map to the API's
+    PascalCase keys (mk_id <-> MkId, faction_name <-> FactionName, ...).
+    The API sometimes sends null names; interned() turns them into ''.
+    """
     mk_id: int
-    firstname: str
-    lastname: str
-    faction_name: str
-    is_coalition: bool
-    is_present: bool
-    image_path: str
+    firstname: Optional[str] = ''
+    lastname: Optional[str] = ''
+    faction_name: Optional[str] = ''
+    is_coalition: bool = False
+    is_present: bool = False
+    image_path: Optional[str] = None
 
     @classmethod
-    def from_api_response(cls, data):
-        return cls(
-            mk_id=data['MkId'],
-            firstname=data['Firstname'],
-            lastname=data['Lastname'],
-            faction_name=data['FactionName'],
-            is_coalition=data['IsCoalition'],
-            is_present=data['IsPresent'],
-            image_path=data['ImagePath']
-        )
\ No newline at end of file
+    def from_api_response(cls, data: Dict[str, Any]) -> "KnessetMember":
+        return msgspec.convert(data, cls)
+
+    def interned(self) -> "KnessetMember":
+        """Copy with names interned (null names as ''), so all records of a faction share one string."""
+        return msgspec.structs.replace(self, firstname=sys.intern(self.firstname or ''),
+                                       lastname=sys.intern(self.lastname or ''),
+                                       faction_name=sys.intern(self.faction_name or ''))
+
+
+class LobbyData(msgspec.Struct, gc=False):
+    """Knesset lobby payload; only the member list is decoded."""
+    mks: List[KnessetMember] = []
+
+
+class _RawLobbyData(msgspec.Struct):
+    mks: List[msgspec.Raw] = []
+
+
+lobby_decoder = msgspec.json.Decoder(LobbyData)
+_raw_lobby_decoder = msgspec.json.Decoder(_RawLobbyData)
+_member_decoder = msgspec.json.Decoder(KnessetMember)
+
+
+def decode_lobby(content: bytes) -> LobbyData:
+    """
+    Decode a lobby payload, skipping member records that don't validate.
+
+    The whole payload is decoded in one pass; only when a record is invalid
+    is it decoded again record by record, so one bad member doesn't cost
+    the whole snapshot.
+    """
+    try:
+        return lobby_decoder.decode(content)
+    except msgspec.ValidationError as e:
+        logger.warning("Invalid member record in Knesset payload, decoding members one by one: %s", e)
+    mks = []
+    for raw in _raw_lobby_decoder.decode(content).mks:
+        try:
+            mks.append(_member_decoder.decode(raw))
+        except msgspec.ValidationError as e:
+            logger.warning("Skipping invalid member record %s: %s", bytes(raw)[:200], e)
+    return LobbyData(mks)
\ No newline at end of file
@@ -0,0 +1,94 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from models.member import KnessetMember
+
+
+class Roster:
+    """
+    Array-backed view of the Knesset member list.
+
+    Every member gets a dense slot; MkIds, faction indexes and coalition flags
+    are stored in arrays indexed by slot and presence is a boolean array, so
+    comparing two presence states is a XOR and all coalition/faction counts
+    come from a single bincount. The slot layout is rebuilt only when the
+    member list itself (ids, factions or coalition) changes.
+    """
+
+    def __init__(self):
+        """Initialize an empty roster."""
+        self.mk_ids = np.zeros(0, dtype=np.int64)
+        self.faction_names: List[str] = []
+        self.faction_index = np.zeros(0, dtype=np.int64)
+        self.coalition = np.zeros(0, dtype=bool)
+        self.present = np.zeros(0, dtype=bool)
+        self.slot_of: Dict[int, int] = {}
+        self._signature: Tuple = ()
+
+    def __len__(self) -> int:
+        return len(self.mk_ids)
+
+    def _build(self, members: List[KnessetMember]) -> None:
+        self.mk_ids = np.fromiter((m.mk_id for m in members), dtype=np.int64, count=len(members))
+        self.slot_of = {int(mk_id): slot for slot, mk_id in enumerate(self.mk_ids)}
+
+        factions: Dict[str, int] = {}
+        self.faction_index = np.fromiter((factions.setdefault(m.faction_name, len(factions)) for m in members),
+                                         dtype=np.int64, count=len(members))
+        self.faction_names = list(factions)
+        self.coalition = np.fromiter((m.is_coalition for m in members), dtype=bool, count=len(members))
+
+    def update(self, members: List[KnessetMember]) -> bool:
+        """
+        Load presence from the decoded member list.
+
+        Args:
+            members: List of member records
+
+        Returns:
+            bool: True if the slot layout changed (masks from before are invalid)
+        """
+        signature = tuple((m.mk_id, m.faction_name, m.is_coalition) for m in members)
+        layout_changed = signature != self._signature
+        if layout_changed:
+            self._build(members)
+            self._signature = signature
+        self.present = np.fromiter((m.is_present for m in members), dtype=bool, count=len(members))
+        return layout_changed
+
+    def mask_of(self, mk_ids: Iterable[int]) -> np.ndarray:
+        """Presence mask with the given members set (unknown ids are ignored)."""
+        mask = np.zeros(len(self), dtype=bool)
+        slots = [self.slot_of[mk_id] for mk_id in mk_ids if mk_id in self.slot_of]
+        mask[slots] = True
+        return mask
+
+    def changed_slots(self, mask: np.ndarray) -> np.ndarray:
+        """Slots whose presence differs from the given mask."""
+        return np.flatnonzero(self.present ^ mask)
+
+    def differs_from(self, mask: Optional[np.ndarray]) -> bool:
+        """Whether current presence differs from the given mask."""
+        return mask is None or mask.shape != self.present.shape or bool(np.any(self.present ^ mask))
+
+    def present_ids(self) -> Set[int]:
+        """MkIds of the present members."""
+        return set(self.mk_ids[self.present].tolist())
+
+    @property
+    def present_count(self) -> int:
+        return int(np.count_nonzero(self.present))
+
+    def coalition_stats(self) -> Tuple[int, int, int, int]:
+        """Return coalition present/total and opposition present/total."""
+        counts = np.bincount(self.coalition.astype(np.int64) * 2 + self.present, minlength=4)
+        opposition_absent, opposition_present, coalition_absent, coalition_present = counts.tolist()
+        return (coalition_present, coalition_present + coalition_absent,
+                opposition_present, opposition_present + opposition_absent)
+
+    def faction_stats(self) -> List[Tuple[str, int, int]]:
+        """Return (faction name, present, total) for every faction."""
+        counts = np.bincount(self.faction_index * 2 + self.present,
+                             minlength=2 * len(self.faction_names)).reshape(-1, 2)
+        present = counts[:, 1].tolist()
+        totals = counts.sum(axis=1).tolist()
+        return list(zip(self.faction_names, present, totals))
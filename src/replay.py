@@ -0,0 +1,338 @@
+"""
+Replay recorded or synthetic plenary sessions through the bot pipeline.
+
+Presence snapshots go through the real fetch, diff, caption, render and
+publish code, against the local stand-in for the Knesset API, the photo
+host and the Telegram Bot API (src/simulation/stub_server.py), so no
+production chat is touched:
+
+    python src/replay.py --session 300 --size 120
+    python src/replay.py --history history --start 2026-06-01T06:00 --end 2026-06-01T20:00 --speed 60
+    python src/replay.py --snapshots recorded.jsonl --chats 3 --json replay.json
+    python src/main.py --replay --session 300
+
+Time is virtual: every snapshot carries its recorded (or simulated) time,
+the change detectors run on that clock and deferred photos are published
+when they fall due, as in the live loop. `--speed` only sets how fast the
+session is played back (0, the default, runs unthrottled). For every
+presence change the report gives the processing latency and the session
+time until a photo showed it, plus Telegram traffic, stage timings, CPU
+time and peak memory.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# Imports no bot config, so it is safe before the environment is set up
+from simulation.environment import configure_environment, free_port  # noqa: E402
+from simulation.synthetic import SessionSimulator, make_roster  # noqa: E402
+
+Snapshot = Tuple[float, List[Dict[str, Any]]]
+
+
+def _stub_photos(members: List[Dict[str, Any]], photo_base_url: str) -> List[Dict[str, Any]]:
+    """Point member photos at the stand-in, whatever host they were recorded with."""
+    return [dict(member, ImagePath=f"{photo_base_url}/photos/{member['MkId']}.jpg") for member in members]
+
+
+def synthetic_snapshots(photo_base_url: str, size: int, steps: int, interval: float, seed: int,
+                        flap_size: int, vote_every: int) -> Iterator[Snapshot]:
+    """A simulated session: one snapshot every `interval` seconds."""
+    members = make_roster(size, photo_base_url, seed=seed)
+    session = SessionSimulator(members, steps, seed=seed, flap_size=flap_size, vote_every=vote_every)
+    for position in range(steps):
+        yield position * interval, [dict(member) for member in session.step()]
+
+
+def recorded_snapshots(path: Path, photo_base_url: str, interval: float) -> Iterator[Snapshot]:
+    """
+    Snapshots from a JSON Lines file, one Knesset payload per line.
+
+    A line may carry a "time" field (Unix timestamp); without one, lines are
+    `interval` seconds apart.
+    """
+    with open(path, encoding='utf-8') as f:
+        for position, line in enumerate(line for line in f if line.strip()):
+            payload = json.loads(line)
+            mks = payload['mks'] if isinstance(payload, dict) else payload
+            timestamp = payload.get('time', position * interval) if isinstance(payload, dict) else position * interval
+            yield float(timestamp), _stub_photos(mks, photo_base_url)
+
+
+def history_snapshots(directory: Path, start: datetime, end: datetime, photo_base_url: str,
+                      roster_file: Optional[Path] = None) -> Iterator[Snapshot]:
+    """
+    Presence changes recorded by HistoryStore between start and end.
+
+    The history keeps MkIds only; names and factions come from a saved
+    Knesset payload (`roster_file`) or are made up.
+    """
+    from utils.history_store import HistoryStore
+
+    store = HistoryStore(directory)
+    try:
+        if roster_file:
+            payload = json.loads(roster_file.read_text(encoding='utf-8'))
+            members = _stub_photos(payload['mks'] if isinstance(payload, dict) else payload, photo_base_url)
+        else:
+            mk_ids = store.members
+            members = make_roster(len(mk_ids), photo_base_url)
+            for member, mk_id in zip(members, mk_ids):
+                member['MkId'] = mk_id
+            members = _stub_photos(members, photo_base_url)
+
+        for timestamp, present in store.snapshots(start, end):
+            yield timestamp, [dict(member, IsPresent=member['MkId'] in present) for member in members]
+    finally:
+        store.close()
+
+
+class Report:
+    """What a replay did and what it cost."""
+
+    def __init__(self):
+        self.snapshots = 0
+        self.latencies: List[float] = []
+        self.photo_delays: List[float] = []
+        self.stages: Counter = Counter()
+        self.stage_runs: Counter = Counter()
+        self.session_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_mb = 0.0
+        self.traffic: Dict[str, int] = {}
+
+    @staticmethod
+    def _percentiles(values: List[float], scale: float = 1.0) -> Dict[str, float]:
+        if not values:
+            return {'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+        ordered = sorted(values)
+
+        def pick(q: float) -> float:
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale
+        return {'p50': pick(0.5), 'p95': pick(0.95), 'max': ordered[-1] * scale}
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'snapshots': self.snapshots, 'changes': len(self.latencies),
+            # An album counts as one photo message
+            'photos': self.traffic.get('telegram_sendPhoto', 0) + self.traffic.get('telegram_sendMediaGroup', 0),
+            'uploads': self.traffic.get('telegram_uploads', 0),
+            'caption_edits': self.traffic.get('telegram_editMessageCaption', 0),
+            'rate_limited': self.traffic.get('telegram_429', 0),
+            'latency_ms': self._percentiles(self.latencies, 1000),
+            'mean_latency_ms': statistics.fmean(self.latencies) * 1000 if self.latencies else 0.0,
+            'photo_delay_s': self._percentiles(self.photo_delays),
+            'stage_mean_ms': {stage: self.stages[stage] / self.stage_runs[stage] * 1000 for stage in self.stages},
+            'session_seconds': self.session_seconds, 'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds, 'peak_rss_mb': self.peak_rss_mb,
+            'traffic': self.traffic
+        }
+
+    def print(self) -> None:
+        row = self.as_dict()
+        latency, delay = row['latency_ms'], row['photo_delay_s']
+        print(f"Snapshots: {row['snapshots']}, presence changes: {row['changes']}, "
+              f"session time: {row['session_seconds']:.0f}s, wall time: {row['wall_seconds']:.1f}s")
+        print(f"Telegram: {row['photos']} photos ({row['uploads']} uploads), "
+              f"{row['caption_edits']} caption edits, {row['rate_limited']} rate limited")
+        print(f"Latency per change: p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+              f"max {latency['max']:.1f} ms")
+        print(f"Change to photo (session time): p50 {delay['p50']:.0f}s, p95 {delay['p95']:.0f}s, "
+              f"max {delay['max']:.0f}s")
+        print("Stage means: " + ", ".join(f"{stage}={ms:.1f}ms" for stage, ms in sorted(row['stage_mean_ms'].items())))
+        print(f"CPU: {row['cpu_seconds']:.1f}s, peak RSS: {row['peak_rss_mb']:.0f} MiB")
+
+
+class Replayer:
+    """Drives snapshots through the publisher on a virtual clock."""
+
+    # Deferred publications run between two snapshots at most (guards against a failing chat)
+    MAX_DEFERRED_PER_GAP = 16
+
+    def __init__(self, stub, knesset_api, publisher, speed: float = 0.0):
+        from models.roster import Roster
+        from utils.metrics import metrics
+
+        self.stub = stub
+        self.knesset_api = knesset_api
+        self.publisher = publisher
+        self.speed = speed
+        self.metrics = metrics
+        self.roster = Roster()
+        self.report = Report()
+        self.clock = 0.0
+        self._present_members = []
+        self._polled_mask = None
+        self._unpublished_since: Optional[float] = None
+
+    def _collect_stages(self) -> None:
+        for stage, seconds in self.metrics.take_last_stages().items():
+            self.report.stages[stage] += seconds
+            self.report.stage_runs[stage] += 1
+
+    async def _publish(self) -> None:
+        await self.publisher.publish(self.roster, self._present_members, now=self.clock)
+        if self._unpublished_since is not None and not any(
+                self.roster.differs_from(channel.published_mask) for channel in self.publisher.channels):
+            self.report.photo_delays.append(self.clock - self._unpublished_since)
+            self._unpublished_since = None
+
+    async def _publish_deferred(self, until: float) -> None:
+        """Publish photos that fall due before the next snapshot, as the live loop's wake-ups would."""
+        for _ in range(self.MAX_DEFERRED_PER_GAP):
+            due = self.publisher.next_due(self.clock)
+            if due is None or self.clock + due >= until:
+                return
+            self.clock += due
+            await self._publish()
+            self._collect_stages()
+
+    async def step(self, session_time: float, members: List[Dict[str, Any]], wall_origin: float) -> None:
+        await self._publish_deferred(session_time)
+        self.clock = session_time
+        if self.speed:
+            await asyncio.sleep(max(0.0, wall_origin + session_time / self.speed - time.perf_counter()))
+
+        self.stub.set_members(members)
+        self.metrics.take_last_stages()
+        start = time.perf_counter()
+        result = await self.knesset_api.fetch_snapshot()
+        if result is None:
+            raise RuntimeError("Fetch from the stand-in failed")
+        if result.changed and self.roster.update(result.data.mks):
+            self.publisher.on_layout_change(self.roster, result.data.mks)
+            self._polled_mask = None
+        changed = self.roster.differs_from(self._polled_mask)
+        self._polled_mask = self.roster.present
+        self._present_members = [m for m in result.data.mks if m.is_present]
+        if changed and self._unpublished_since is None:
+            self._unpublished_since = session_time
+
+        await self._publish()
+        if changed:
+            self.report.latencies.append(time.perf_counter() - start)
+        self.report.snapshots += 1
+        self._collect_stages()
+
+    async def run(self, snapshots: Iterator[Snapshot]) -> Report:
+        cpu_start = time.process_time()
+        wall_origin = time.perf_counter()
+        origin = None
+        for timestamp, members in snapshots:
+            origin = timestamp if origin is None else origin
+            await self.step(timestamp - origin, members, wall_origin)
+        # Let photos still pending at the end of the session fall due
+        await self._publish_deferred(float('inf'))
+
+        self.report.session_seconds = self.clock
+        self.report.wall_seconds = time.perf_counter() - wall_origin
+        self.report.cpu_seconds = time.process_time() - cpu_start
+        self.report.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.report.traffic = dict(self.stub.stats)
+        return self.report
+
+
+def _snapshots(args, photo_base_url: str) -> Iterator[Snapshot]:
+    if args.snapshots:
+        return recorded_snapshots(args.snapshots, photo_base_url, args.interval)
+    if args.history:
+        return history_snapshots(args.history, args.start, args.end, photo_base_url, args.roster)
+    return synthetic_snapshots(photo_base_url, args.size, args.session, args.interval, args.seed,
+                               args.flap_size, args.vote_every)
+
+
+async def main(args) -> Report:
+    port = free_port()
+    workdir = Path(tempfile.mkdtemp(prefix='knesset-replay-'))
+    configure_environment(port, workdir, {'RENDER_POOL_KIND': args.render_pool, **args.env})
+
+    from simulation.stub_server import StubServer
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    from services.service_graph import ServiceGraph
+    from utils.file_id_cache import FileIdCache
+    from models.destination import Destination
+
+    stub = StubServer(port=port, size=0, telegram_latency=args.telegram_latency,
+                      rate_limit_every=args.rate_limit_every, retry_after=args.retry_after)
+    await stub.start()
+    destinations = [Destination(chat_id=f"@replay{i}", language='he' if i % 2 == 0 else 'en',
+                                rate_per_minute=args.telegram_rate, burst=3)
+                    for i in range(args.chats)]
+    try:
+        async with ServiceGraph(destinations, FileIdCache(workdir / "file_ids.json"),
+                                global_rate_per_second=args.telegram_rate / 60,
+                                persistent=False, metrics_enabled=False, snapshot_api=False) as services:
+            replayer = Replayer(stub, services.knesset_api, services.publisher, speed=args.speed)
+            report = await replayer.run(_snapshots(args, stub.url))
+    finally:
+        await stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report.print()
+    if args.json:
+        args.json.write_text(json.dumps(report.as_dict(), indent=2))
+        print(f"Report written to {args.json}")
+    return report
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--session', type=int, default=300,
+                        help="Steps of a synthetic session (the default source, 300 steps)")
+    source.add_argument('--snapshots', type=Path, help="JSON Lines file of recorded Knesset payloads")
+    source.add_argument('--history', type=Path, help="HistoryStore directory to replay")
+    parser.add_argument('--start', type=datetime.fromisoformat, help="Start of the --history range (ISO time)")
+    parser.add_argument('--end', type=datetime.fromisoformat, help="End of the --history range (ISO time)")
+    parser.add_argument('--roster', type=Path, help="Saved Knesset payload naming the --history members")
+    parser.add_argument('--size', type=int, default=120, help="Members of a synthetic session")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--flap-size', type=int, default=2, help="Typical members changing per synthetic step")
+    parser.add_argument('--vote-every', type=int, default=30, help="Synthetic steps between vote bursts")
+    parser.add_argument('--interval', type=float, default=15,
+                        help="Session seconds between snapshots without a recorded time")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="Playback speed relative to session time (0: unthrottled)")
+    parser.add_argument('--chats', type=int, default=1, help="Destination chats, alternating Hebrew/English")
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="Seconds added to Telegram responses")
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help="Answer every N-th Telegram call with 429 (0 disables)")
+    parser.add_argument('--retry-after', type=float, default=0.05, help="retry_after of injected 429s")
+    parser.add_argument('--telegram-rate', type=float, default=1_000_000,
+                        help="Dispatcher rate limit per minute (default: effectively unlimited)")
+    parser.add_argument('--render-pool', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--set', dest='env', action='append', default=[], metavar='NAME=VALUE',
+                        help="Override a setting, e.g. --set CHANGE_SETTLE_SECONDS=0 (repeatable)")
+    parser.add_argument('--json', type=Path, help="Write the report to this JSON file")
+    parser.add_argument('--verbose', action='store_true', help="Keep the bot's INFO logs")
+    args = parser.parse_args(argv)
+
+    if args.history and not (args.start and args.end):
+        parser.error("--history needs --start and --end")
+    if any('=' not in item for item in args.env):
+        parser.error("--set expects NAME=VALUE")
+    args.env = dict(item.split('=', 1) for item in args.env)
+    # The replay runs in a scratch directory, so resolve paths first
+    for name in ('snapshots', 'history', 'roster', 'json'):
+        if getattr(args, name):
+            setattr(args, name, getattr(args, name).resolve())
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,377 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import msgspec
+import numpy as np
+import pytz
+from config import (ATTENDANCE_FILE, ATTENDANCE_RETENTION_DAYS, ATTENDANCE_REPORT_TIME, ATTENDANCE_WEEKLY_DAY,
+                    ATTENDANCE_REPORT_TOP)
+from utils.atomic_file import atomic_write
+from utils.logger import logger
+from models.roster import Roster
+
+
+class Stint(msgspec.Struct, array_like=True):
+    """Presence of a member that is still open, and the faction it is credited to."""
+    since: float
+    faction: str
+    coalition: bool
+
+
+class Sitting(msgspec.Struct, array_like=True):
+    """One sitting of the plenum: from the first member entering to the last one leaving."""
+    start: float
+    end: Optional[float] = None
+    peak: int = 0
+    member_seconds: float = 0.0
+    # Continues a sitting of the previous day past midnight
+    continued: bool = False
+
+
+class Streak(msgspec.Struct, array_like=True):
+    """Consecutive sitting days a member attended."""
+    current: int = 0
+    best: int = 0
+
+
+class DayTotals(msgspec.Struct):
+    """Present-seconds accumulated over one day (Israel time)."""
+    day: str
+    members: Dict[int, float] = {}
+    factions: Dict[str, float] = {}
+    coalition: float = 0.0
+    opposition: float = 0.0
+    sittings: List[Sitting] = []
+
+    def sitting_seconds(self, now: float) -> float:
+        """Time the plenum sat this day, an open sitting counted up to now."""
+        return sum((sitting.end if sitting.end is not None else now) - sitting.start for sitting in self.sittings)
+
+
+class AttendanceState(msgspec.Struct):
+    """Everything AttendanceStats persists."""
+    days: List[DayTotals] = []
+    open: Dict[int, Stint] = {}
+    streaks: Dict[int, Streak] = {}
+    last_sitting_day: Optional[str] = None
+    reported_day: Optional[str] = None
+    updated_at: Optional[float] = None
+
+
+class AttendanceReport(NamedTuple):
+    """Rankings over one or more days, as the report caption and chart show them."""
+    first_day: str
+    last_day: str
+    sittings: int
+    sitting_seconds: float
+    # (MkId, present seconds), most present first
+    members: List[Tuple[int, float]]
+    # (faction, present seconds, share of its possible member-time, coalition), highest share first
+    factions: List[Tuple[str, float, float, bool]]
+    coalition_share: float
+    opposition_share: float
+    # (MkId, current streak, longest streak ever, in sitting days), longest current first
+    streaks: List[Tuple[int, int, int]]
+
+    @property
+    def days(self) -> int:
+        return (datetime.fromisoformat(self.last_day) - datetime.fromisoformat(self.first_day)).days + 1
+
+
+class AttendanceStats:
+    """
+    Streaming attendance aggregates: present-time per member, faction and coalition/opposition.
+
+    Every cycle only the members whose presence changed are visited: an
+    entering member opens a stint, a leaving one closes it and its seconds
+    are added to the day's member, faction, bloc and sitting totals. Stints
+    still open are split at midnight. Sittings (from the first member
+    entering to the last one leaving), their peak attendance and the
+    members' streaks of attended sitting days are kept as well, so daily and
+    weekly rankings come from a handful of per-day totals instead of the
+    presence history. The totals of the last `retention_days` days are
+    saved as compact JSON on a background thread.
+    """
+
+    def __init__(self, path: Path = ATTENDANCE_FILE, retention_days: int = ATTENDANCE_RETENTION_DAYS,
+                 report_time: str = ATTENDANCE_REPORT_TIME, weekly_day: int = ATTENDANCE_WEEKLY_DAY):
+        """
+        Initialize AttendanceStats.
+
+        Args:
+            path: File the aggregates are saved to
+            retention_days: Days of totals to keep
+            report_time: Israel time ('HH:MM') after which the day's report is due
+            weekly_day: Weekday (Monday=0) whose report also covers the whole week
+        """
+        self.path = path
+        self.retention_days = max(1, retention_days)
+        hour, _, minute = report_time.partition(':')
+        self.report_hour, self.report_minute = int(hour), int(minute or 0)
+        self.weekly_day = weekly_day
+        self.israel_tz = pytz.timezone('Asia/Jerusalem')
+
+        self.state = AttendanceState()
+        self._today: Optional[DayTotals] = None
+        self._mask = None
+        self._mk_ids = None
+        self._dirty = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='attendance')
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder(AttendanceState)
+
+    # Persistence
+
+    def load(self) -> AttendanceState:
+        """Load the saved aggregates, or start empty if there are none."""
+        try:
+            if self.path.exists():
+                self.state = self._decoder.decode(self.path.read_bytes())
+        except (OSError, msgspec.DecodeError) as e:
+            logger.error("Attendance file %s is unreadable, starting over: %s", self.path, e)
+            self.state = AttendanceState()
+        self._today = self.state.days[-1] if self.state.days else None
+
+        # Presence while the bot was down is unknown: credit open stints up to the last update only
+        if self.state.updated_at is not None:
+            for mk_id in list(self.state.open):
+                self._close(mk_id, self.state.updated_at)
+        return self.state
+
+    def _write(self, data: bytes) -> bool:
+        try:
+            atomic_write(self.path, data)
+            return True
+        except Exception as e:
+            logger.error("Error saving attendance aggregates: %s", e)
+            return False
+
+    def save(self) -> Optional[Future]:
+        """
+        Persist the aggregates in the background if they changed.
+
+        Returns:
+            Optional[Future]: Future of the write, or None if nothing changed
+        """
+        if not self._dirty:
+            return None
+        self._dirty = False
+        # Encoded here, since the state keeps changing on the event loop
+        return self._executor.submit(self._write, self._encoder.encode(self.state))
+
+    def close(self) -> None:
+        """Wait for pending writes."""
+        self._executor.shutdown(wait=True)
+
+    # Updates
+
+    def _day_key(self, timestamp: float) -> str:
+        return datetime.fromtimestamp(timestamp, self.israel_tz).strftime('%Y-%m-%d')
+
+    def _day_start(self, day: str) -> float:
+        return self.israel_tz.localize(datetime.fromisoformat(day)).timestamp()
+
+    def _credit(self, mk_id: int, stint: Stint, seconds: float) -> None:
+        day = self._today
+        day.members[mk_id] = day.members.get(mk_id, 0.0) + seconds
+        day.factions[stint.faction] = day.factions.get(stint.faction, 0.0) + seconds
+        if stint.coalition:
+            day.coalition += seconds
+        else:
+            day.opposition += seconds
+        if day.sittings:
+            day.sittings[-1].member_seconds += seconds
+
+    def _close(self, mk_id: int, at: float) -> None:
+        stint = self.state.open.pop(mk_id, None)
+        if stint is not None and self._today is not None and at > stint.since:
+            self._credit(mk_id, stint, at - stint.since)
+        self._dirty = True
+
+    def _start_day(self, day: str, now: float) -> None:
+        """Close the current day at midnight and open `day`."""
+        previous = self._today
+        boundary = self._day_start(day)
+        if previous is not None:
+            for mk_id, stint in self.state.open.items():
+                if boundary > stint.since:
+                    self._credit(mk_id, stint, boundary - stint.since)
+                    stint.since = boundary
+            if previous.sittings and previous.sittings[-1].end is None:
+                # Without open stints the bot was down at midnight; the sitting ended by its last update
+                previous.sittings[-1].end = boundary if self.state.open else min(
+                    boundary, self.state.updated_at or boundary)
+            self._update_streaks(previous)
+
+        self._today = DayTotals(day)
+        if self.state.open:
+            # A sitting that runs past midnight continues in the new day
+            self._today.sittings.append(Sitting(boundary, peak=len(self.state.open), continued=True))
+        self.state.days.append(self._today)
+        cutoff = self._day_key(now - self.retention_days * 24 * 60 * 60)
+        self.state.days = [totals for totals in self.state.days if totals.day > cutoff]
+        self._dirty = True
+
+    def _update_streaks(self, day: DayTotals) -> None:
+        """Extend or break every member's streak after a sitting day; days without a sitting don't count."""
+        if not day.sittings or day.day == self.state.last_sitting_day:
+            return
+        streaks = self.state.streaks
+        for mk_id in day.members.keys() | streaks.keys():
+            streak = streaks.setdefault(mk_id, Streak())
+            if mk_id in day.members:
+                streak.current += 1
+                streak.best = max(streak.best, streak.current)
+            else:
+                streak.current = 0
+        self.state.last_sitting_day = day.day
+
+    def observe(self, roster: Roster, now: Optional[float] = None) -> int:
+        """
+        Account the time since the last cycle.
+
+        Args:
+            roster: Roster with the current presence
+            now: Unix time, defaults to time.time()
+
+        Returns:
+            int: Number of members whose presence changed
+        """
+        now = time.time() if now is None else now
+        day = self._day_key(now)
+        if self._today is None or self._today.day != day:
+            self._start_day(day, now)
+
+        if self._mask is not None and self._mk_ids is roster.mk_ids:
+            slots = roster.changed_slots(self._mask).tolist()
+        else:
+            # First cycle or new slot layout: diff against the open stints instead
+            for mk_id in [mk_id for mk_id in self.state.open if mk_id not in roster.slot_of]:
+                self._close(mk_id, now)
+            slots = roster.changed_slots(roster.mask_of(self.state.open)).tolist()
+
+        present = roster.present
+        for slot in slots:
+            mk_id = int(roster.mk_ids[slot])
+            if present[slot]:
+                self.state.open[mk_id] = Stint(now, roster.faction_names[roster.faction_index[slot]],
+                                               bool(roster.coalition[slot]))
+            else:
+                self._close(mk_id, now)
+
+        sittings = self._today.sittings
+        count = len(self.state.open)
+        if count and (not sittings or sittings[-1].end is not None):
+            sittings.append(Sitting(now))
+        if sittings and sittings[-1].end is None:
+            sittings[-1].peak = max(sittings[-1].peak, count)
+            if not count:
+                sittings[-1].end = now
+
+        self._mask = present
+        self._mk_ids = roster.mk_ids
+        self.state.updated_at = now
+        if slots:
+            self._dirty = True
+        return len(slots)
+
+    # Reports
+
+    def _report_at(self, day: str) -> float:
+        return self._day_start(day) + (self.report_hour * 60 + self.report_minute) * 60
+
+    def report_due_in(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until today's report is due (0 if it is), None if there is none to send."""
+        now = time.time() if now is None else now
+        day = self._day_key(now)
+        today = self._today
+        if self.state.reported_day == day or today is None or today.day != day or not today.sittings:
+            return None
+        return max(0.0, self._report_at(day) - now)
+
+    def reports_due(self, now: Optional[float] = None) -> List[int]:
+        """Day spans of the reports to send now: [] if none is due, [1] or [1, 7] on the weekly day."""
+        now = time.time() if now is None else now
+        if self.report_due_in(now) != 0:
+            return []
+        weekday = datetime.fromtimestamp(now, self.israel_tz).weekday()
+        return [1, 7] if weekday == self.weekly_day else [1]
+
+    def mark_reported(self, now: Optional[float] = None) -> None:
+        """Record that today's report was sent."""
+        self.state.reported_day = self._day_key(time.time() if now is None else now)
+        self._dirty = True
+
+    def report(self, roster: Roster, days: int = 1, now: Optional[float] = None,
+               top: int = ATTENDANCE_REPORT_TOP) -> AttendanceReport:
+        """
+        Rank members and factions over the last `days` days, today included.
+
+        Open stints are counted up to now. Faction and bloc shares are
+        present-time divided by the time their current members could have
+        been present (members x sitting time).
+
+        Args:
+            roster: Current roster, for faction sizes
+            days: Days to cover (1 for a daily report, 7 for a weekly one)
+            now: Unix time, defaults to time.time()
+            top: Members to rank
+        """
+        now = time.time() if now is None else now
+        last_day = self._day_key(now)
+        first_day = (datetime.fromisoformat(last_day) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        covered = [totals for totals in self.state.days if first_day <= totals.day <= last_day]
+
+        members: Dict[int, float] = {}
+        factions: Dict[str, float] = {}
+        blocs = [0.0, 0.0]
+        sittings = 0
+        sitting_seconds = 0.0
+        for totals in covered:
+            for mk_id, seconds in totals.members.items():
+                members[mk_id] = members.get(mk_id, 0.0) + seconds
+            for faction, seconds in totals.factions.items():
+                factions[faction] = factions.get(faction, 0.0) + seconds
+            blocs[0] += totals.coalition
+            blocs[1] += totals.opposition
+            sittings += sum(1 for sitting in totals.sittings if not sitting.continued)
+            sitting_seconds += totals.sitting_seconds(now)
+        if covered and covered[-1].day == last_day:
+            for mk_id, stint in self.state.open.items():
+                seconds = max(0.0, now - stint.since)
+                members[mk_id] = members.get(mk_id, 0.0) + seconds
+                factions[stint.faction] = factions.get(stint.faction, 0.0) + seconds
+                blocs[0 if stint.coalition else 1] += seconds
+
+        # Current faction sizes, and whether each faction sits in the coalition
+        sizes = {name: total for name, _, total in roster.faction_stats()}
+        in_coalition = dict(zip(roster.faction_names, np.bincount(
+            roster.faction_index, weights=roster.coalition, minlength=len(roster.faction_names)).astype(bool).tolist()))
+        coalition_size = int(np.count_nonzero(roster.coalition))
+        opposition_size = len(roster) - coalition_size
+
+        def share(seconds: float, size: int) -> float:
+            return seconds / (size * sitting_seconds) if size and sitting_seconds else 0.0
+
+        faction_rows = [(name, seconds, share(seconds, sizes.get(name, 0)), in_coalition.get(name, False))
+                        for name, seconds in factions.items()]
+        # Streaks as they stand after today, if the plenum sat today
+        today = self._today if self._today is not None and self._today.day == last_day else None
+        counts_today = today is not None and today.sittings and today.day != self.state.last_sitting_day
+        current = {mk_id: streak.current for mk_id, streak in self.state.streaks.items()}
+        if counts_today:
+            attended = today.members.keys() | self.state.open.keys()
+            current = {mk_id: current.get(mk_id, 0) + 1 if mk_id in attended else 0
+                       for mk_id in current.keys() | attended}
+        best = {mk_id: max(days, self.state.streaks[mk_id].best if mk_id in self.state.streaks else 0)
+                for mk_id, days in current.items()}
+        streaks = sorted(((mk_id, days, best[mk_id]) for mk_id, days in current.items() if days > 1),
+                         key=lambda item: (-item[1], -item[2]))
+        return AttendanceReport(
+            first_day=first_day, last_day=last_day, sittings=sittings, sitting_seconds=sitting_seconds,
+            members=sorted(members.items(), key=lambda item: -item[1])[:top],
+            factions=sorted(faction_rows, key=lambda row: (-row[2], row[0])),
+            coalition_share=share(blocs[0], coalition_size), opposition_share=share(blocs[1], opposition_size),
+            streaks=streaks[:top])
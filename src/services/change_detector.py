@@ -0,0 +1,104 @@
+import time
+from typing import NamedTuple, Optional
+import numpy as np
+from config import CHANGE_SETTLE_SECONDS, CHANGE_MAX_DELAY_SECONDS, CHANGE_MIN_DELTA
+
+
+class Decision(NamedTuple):
+    """Whether to publish a new photo now, and why."""
+    publish: bool
+    reason: str
+    delta: int
+
+
+class ChangeDetector:
+    """
+    Debounces presence changes before a new photo is published.
+
+    During votes members enter and leave the plenary over a few minutes;
+    publishing every intermediate state floods the chat with photos. A
+    change is published only once presence has stopped changing for
+    `settle_seconds` and differs from the published photo in at least
+    `min_delta` members. Whatever is still pending after
+    `max_delay_seconds` is published regardless, so the photo is never
+    wrong for long. The caller keeps editing caption counts meanwhile.
+
+    The delay runs from the first change the photo does not show, and
+    presence flapping back to the photo only ends it once it holds for
+    `settle_seconds`. While presence never settles (members moving every
+    poll), photos therefore follow every `max_delay_seconds`, which is
+    then also the typical change-to-photo delay.
+
+    Holds no I/O: the current and published masks and the clock are passed
+    in, so decisions can be replayed deterministically.
+    """
+
+    def __init__(self, settle_seconds: float = CHANGE_SETTLE_SECONDS,
+                 max_delay_seconds: float = CHANGE_MAX_DELAY_SECONDS, min_delta: int = CHANGE_MIN_DELTA):
+        """
+        Initialize ChangeDetector.
+
+        Args:
+            settle_seconds: Time presence must stay unchanged before publishing (0 publishes at once)
+            max_delay_seconds: Longest time a change may stay unpublished
+            min_delta: Members that must differ from the published photo to publish before max_delay_seconds
+        """
+        self.settle_seconds = settle_seconds
+        self.max_delay_seconds = max(max_delay_seconds, settle_seconds)
+        self.min_delta = max(1, min_delta)
+        self._last_seen: Optional[np.ndarray] = None
+        self._changed_at = 0.0
+        self._pending_since: Optional[float] = None
+        self._delta = 0
+
+    def observe(self, current: np.ndarray, published: Optional[np.ndarray],
+                now: Optional[float] = None) -> Decision:
+        """
+        Record the current presence and decide whether to publish it.
+
+        Args:
+            current: Current presence mask
+            published: Mask shown by the published photo (None if there is no photo)
+            now: Monotonic time, defaults to time.monotonic()
+
+        Returns:
+            Decision: publish flag, reason and number of members that differ
+        """
+        now = time.monotonic() if now is None else now
+        if (self._last_seen is None or self._last_seen.shape != current.shape
+                or np.any(self._last_seen ^ current)):
+            self._last_seen = current
+            self._changed_at = now
+
+        if published is None or published.shape != current.shape:
+            self._pending_since = None
+            return Decision(True, 'initial', int(np.count_nonzero(current)))
+
+        self._delta = int(np.count_nonzero(current ^ published))
+        if not self._delta:
+            # Flapping back to the photo does not restart the delay
+            if now - self._changed_at >= self.settle_seconds:
+                self._pending_since = None
+            return Decision(False, 'unchanged', 0)
+
+        if self._pending_since is None:
+            self._pending_since = now
+        if self._delta >= self.min_delta and now - self._changed_at >= self.settle_seconds:
+            reason = 'settled'
+        elif now - self._pending_since >= self.max_delay_seconds:
+            reason = 'max_delay'
+        else:
+            return Decision(False, 'settling' if self._delta >= self.min_delta else 'below_threshold', self._delta)
+        # Changes seen after this publication start a new delay
+        self._pending_since = None
+        return Decision(True, reason, self._delta)
+
+    def due_in(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until a pending change is published if presence holds still (None if nothing is pending)."""
+        if self._pending_since is None or not self._delta:
+            return None
+        now = time.monotonic() if now is None else now
+        due = self._pending_since + self.max_delay_seconds
+        if self._delta >= self.min_delta:
+            due = min(due, self._changed_at + self.settle_seconds)
+        return max(0.0, due - now)
@@ -0,0 +1,200 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from PIL import Image, ImageDraw, ImageFont
+from utils.logger import logger
+from utils.text_utils import reverse_hebrew_text
+
+Rect = Tuple[int, int, int, int]
+
+
+class TileEntry(NamedTuple):
+    """A member to place on the canvas: stable member key, photo tile and display name."""
+    key: str
+    photo: Optional[Image.Image]
+    firstname: str
+    lastname: str
+
+
+class _Tile(NamedTuple):
+    photo: Image.Image
+    name: Tuple[str, str]
+    image: Image.Image
+
+
+class TileCompositor:
+    """
+    Incremental renderer for the presence grid.
+
+    Each member is pre-rendered once into a transparent tile (photo plus
+    reversed Hebrew name). The last canvas and the key placed at every grid
+    position are kept, so a new render only repaints the rows where a
+    member changed; the rest of the canvas, including rows that did not shift,
+    is reused as is. Tiles never reach into another row, so a row is
+    repainted with the same whole-tile pastes as a full render and an
+    incremental render costs at most as much. A full render happens only on
+    the first call, when the layout parameters change, or when most rows
+    changed anyway.
+    """
+
+    # Share of rows that may change before a full render is done instead
+    FULL_RENDER_ROWS = 0.75
+
+    def __init__(self, font: ImageFont.FreeTypeFont, font_size: int, width: int = 800,
+                 img_size: int = 180, spacing: int = 20, members_per_row: int = 4,
+                 background_color: Tuple[int, int, int, int] = (220, 240, 255, 255),
+                 max_tiles: int = 200):
+        """Initialize TileCompositor with layout parameters."""
+        self.font = font
+        self.font_size = font_size
+        self.width = width
+        self.img_size = img_size
+        self.spacing = spacing
+        self.members_per_row = members_per_row
+        self.background_color = background_color
+        self.max_tiles = max_tiles
+
+        # Names may be wider than the photo; let them spill into the margins
+        self.overhang = 2 * spacing
+        self.row_height = img_size + font_size + spacing
+
+        self._tiles: Dict[str, _Tile] = {}
+        self._canvas: Optional[Image.Image] = None
+        self._placements: Dict[Tuple[int, int], str] = {}
+
+    def _row_of(self, position: Tuple[int, int]) -> int:
+        return (position[1] - self.spacing) // self.row_height
+
+    def calculate_dimensions(self, total_members: int) -> Tuple[int, int]:
+        """Calculate the dimensions for the final image based on member count."""
+        num_rows = (total_members + self.members_per_row - 1) // self.members_per_row
+        return self.width, num_rows * self.row_height
+
+    def get_position(self, index: int, total_members: int, num_rows: int) -> Tuple[int, int]:
+        """Calculate x, y position for member image and text."""
+        current_row = index // self.members_per_row
+        is_last_row = current_row == num_rows - 1
+        column_in_row = index % self.members_per_row
+
+        y = current_row * self.row_height + self.spacing
+
+        if is_last_row:
+            total_in_row = min(self.members_per_row,
+                               total_members - (current_row * self.members_per_row))
+            offset = (self.members_per_row - total_in_row) * (self.width // self.members_per_row) // 2
+            x = column_in_row * (self.width // self.members_per_row) + offset
+        else:
+            x = (self.members_per_row - 1 - column_in_row) * (self.width // self.members_per_row)
+
+        return x + self.spacing, y
+
+    def _tile_rect(self, position: Tuple[int, int]) -> Rect:
+        """Canvas area covered by a tile placed at the given member position."""
+        x, y = position
+        return (x - self.overhang, y,
+                x + self.img_size + self.overhang, y + self.row_height)
+
+    def _render_tile(self, entry: TileEntry) -> Image.Image:
+        """Render photo and name onto a transparent tile."""
+        tile = Image.new('RGBA', (self.img_size + 2 * self.overhang, self.row_height), (0, 0, 0, 0))
+        tile.paste(entry.photo, (self.overhang, 0), entry.photo)
+
+        name = f"{reverse_hebrew_text(entry.lastname)} {reverse_hebrew_text(entry.firstname)}"
+        bbox = self.font.getbbox(name)
+        text_width = bbox[2] - bbox[0]
+        text_x = self.overhang + (self.img_size - text_width) // 2
+
+        ImageDraw.Draw(tile).text((text_x, self.img_size), name, fill=(0, 0, 0), font=self.font)
+        return tile
+
+    def _get_tile(self, entry: TileEntry) -> Image.Image:
+        """Return the cached tile for an entry, re-rendering it if the photo changed."""
+        cached = self._tiles.get(entry.key)
+        name = (entry.firstname, entry.lastname)
+        if cached is None or cached.photo is not entry.photo or cached.name != name:
+            cached = _Tile(entry.photo, name, self._render_tile(entry))
+            self._tiles[entry.key] = cached
+        return cached.image
+
+    def _paint_row(self, canvas: Image.Image, row: int, placed: List[Tuple[Tuple[int, int], str]]) -> None:
+        """Clear the band of a grid row and redraw its tiles."""
+        top = row * self.row_height + self.spacing
+        canvas.paste(self.background_color[:3], (0, top, canvas.width, min(canvas.height, top + self.row_height)))
+        for position, key in placed:
+            tile = self._tiles[key].image
+            canvas.paste(tile, self._tile_rect(position)[:2], tile)
+
+    def _full_render(self, size: Tuple[int, int], placements: Dict[Tuple[int, int], str]) -> Image.Image:
+        canvas = Image.new('RGB', size, self.background_color[:3])
+        for position, key in placements.items():
+            tile = self._tiles[key].image
+            x, y = self._tile_rect(position)[:2]
+            canvas.paste(tile, (x, y), tile)
+        return canvas
+
+    def render(self, entries: List[TileEntry]) -> Image.Image:
+        """
+        Render the presence grid for the given members, in display order.
+
+        Args:
+            entries: Sorted members to place on the canvas
+
+        Returns:
+            Image.Image: RGB canvas, owned by the caller
+        """
+        total = len(entries)
+        size = self.calculate_dimensions(total)
+        num_rows = (total + self.members_per_row - 1) // self.members_per_row
+
+        placements: Dict[Tuple[int, int], str] = {}
+        rows: Dict[int, List[Tuple[Tuple[int, int], str]]] = {}
+        for i, entry in enumerate(entries):
+            if entry.photo is None:
+                continue
+            try:
+                self._get_tile(entry)
+                position = self.get_position(i, total, num_rows)
+                placements[position] = entry.key
+                rows.setdefault(i // self.members_per_row, []).append((position, entry.key))
+            except Exception as e:
+                logger.error("Error processing member %s: %s", entry.lastname or 'Unknown', e)
+
+        previous = self._canvas
+        dirty_rows = {self._row_of(position) for position in placements.keys() | self._placements.keys()
+                      if placements.get(position) != self._placements.get(position)}
+
+        if previous is not None and previous.height != size[1]:
+            # The old last row is laid out differently and its names were cut at the edge
+            dirty_rows.add(previous.height // self.row_height - 1)
+        dirty_rows = {row for row in dirty_rows if row < num_rows}
+
+        if previous is None or previous.width != size[0] or len(dirty_rows) > num_rows * self.FULL_RENDER_ROWS:
+            canvas = self._full_render(size, placements)
+        else:
+            if previous.size == size:
+                canvas = previous
+            else:
+                # One copy; rows beyond the old canvas are new positions and get painted below
+                canvas = previous.crop((0, 0, size[0], size[1]))
+                if size[1] > previous.height:
+                    canvas.paste(self.background_color[:3], (0, previous.height, size[0], size[1]))
+            for row in dirty_rows:
+                self._paint_row(canvas, row, rows.get(row, []))
+
+        self._canvas = canvas
+        self._placements = placements
+        self._evict_tiles()
+        return canvas.copy()
+
+    def _evict_tiles(self) -> None:
+        """Drop tiles of members not on the current canvas once over budget."""
+        if len(self._tiles) <= self.max_tiles:
+            return
+        in_use = set(self._placements.values())
+        for key in [key for key in self._tiles if key not in in_use]:
+            del self._tiles[key]
+            if len(self._tiles) <= self.max_tiles:
+                break
+
+    def reset(self) -> None:
+        """Forget the last canvas so the next render is a full one."""
+        self._canvas = None
+        self._placements = {}
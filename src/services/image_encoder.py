@@ -0,0 +1,149 @@
+import io
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+from PIL import Image
+from utils.metrics import metrics
+from config import (ENCODE_FORMAT, ENCODE_MAX_BYTES, ENCODE_MAX_SIDE, ENCODE_MIN_QUALITY, JPEG_QUALITY,
+                    ENCODE_SUBSAMPLING, ENCODE_PROGRESSIVE, ENCODE_CACHE_ITEMS)
+
+
+class EncodeResult(NamedTuple):
+    """Encoded image plus the settings the encoder settled on."""
+    data: bytes
+    format: str
+    quality: int
+    scale: float
+    size: Tuple[int, int]
+    seconds: float
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.format}"
+
+    @property
+    def filename(self) -> str:
+        return f"presence.{'jpg' if self.format == 'jpeg' else self.format}"
+
+    def describe(self) -> str:
+        return (f"{self.size[0]}x{self.size[1]} {self.format.upper()} q={self.quality} "
+                f"scale={self.scale:.2f}, {len(self.data) / 1024:.0f} KB in {self.seconds * 1000:.0f} ms")
+
+
+class ImageEncoder:
+    """
+    Encodes presence images to fit a byte and dimension budget.
+
+    The canvas is first scaled down to `max_side` (Telegram stores photos at
+    most 2560px on the long side, so larger uploads are only recompressed),
+    then the highest quality step that fits `max_bytes` is searched for;
+    if even `min_quality` doesn't fit, the image is scaled down further.
+    Holds settings only, so it can be shipped to render worker processes.
+    """
+
+    QUALITY_STEP = 5
+    DOWNSCALE_STEP = 0.8
+    MIN_SCALE = 0.25
+    SUBSAMPLING = {'4:4:4': 0, '4:2:2': 1, '4:2:0': 2}
+
+    def __init__(self, image_format: str = ENCODE_FORMAT, max_bytes: int = ENCODE_MAX_BYTES,
+                 max_side: int = ENCODE_MAX_SIDE, min_quality: int = ENCODE_MIN_QUALITY,
+                 max_quality: int = JPEG_QUALITY, subsampling: str = ENCODE_SUBSAMPLING,
+                 progressive: bool = ENCODE_PROGRESSIVE):
+        """
+        Initialize ImageEncoder.
+
+        Args:
+            image_format: 'jpeg' or 'webp'
+            max_bytes: Byte budget of the output (0 disables the quality search)
+            max_side: Longest allowed side in pixels (0 keeps the canvas size)
+            min_quality / max_quality: Quality range to search
+            subsampling: JPEG chroma subsampling ('4:4:4', '4:2:2' or '4:2:0')
+            progressive: Write progressive, Huffman-optimized JPEGs
+        """
+        if image_format not in ('jpeg', 'webp'):
+            raise ValueError(f"Unsupported image format: {image_format}")
+        if subsampling not in self.SUBSAMPLING:
+            raise ValueError(f"Unsupported chroma subsampling: {subsampling}")
+        self.format = image_format
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.min_quality = min(min_quality, max_quality)
+        self.max_quality = max_quality
+        self.subsampling = subsampling
+        self.progressive = progressive
+
+    def settings_key(self) -> tuple:
+        """Settings that affect the output, for image fingerprints."""
+        return (self.format, self.max_bytes, self.max_side, self.min_quality, self.max_quality,
+                self.subsampling, self.progressive)
+
+    def _save(self, image: Image.Image, quality: int) -> bytes:
+        buffer = io.BytesIO()
+        if self.format == 'jpeg':
+            image.save(buffer, format='JPEG', quality=quality, subsampling=self.SUBSAMPLING[self.subsampling],
+                       progressive=self.progressive, optimize=self.progressive)
+        else:
+            image.save(buffer, format='WEBP', quality=quality, method=4)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _resize(image: Image.Image, scale: float) -> Image.Image:
+        if scale >= 1:
+            return image
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.LANCZOS, reducing_gap=2.0)
+
+    def _fit_quality(self, image: Image.Image) -> Tuple[bytes, int]:
+        """Highest quality step within the budget (or min_quality if none fits)."""
+        data = self._save(image, self.max_quality)
+        if not self.max_bytes or len(data) <= self.max_bytes:
+            return data, self.max_quality
+
+        steps = list(range(self.min_quality, self.max_quality, self.QUALITY_STEP))
+        best: Optional[Tuple[bytes, int]] = None
+        low, high = 0, len(steps) - 1
+        while low <= high:
+            middle = (low + high) // 2
+            candidate = self._save(image, steps[middle])
+            if len(candidate) <= self.max_bytes:
+                best = (candidate, steps[middle])
+                low = middle + 1
+            else:
+                high = middle - 1
+        if best is None:
+            return self._save(image, self.min_quality), self.min_quality
+        return best
+
+    def encode(self, image: Image.Image) -> EncodeResult:
+        """Encode an RGB image within the budget."""
+        start = time.perf_counter()
+        scale = min(1.0, self.max_side / max(image.size)) if self.max_side else 1.0
+        while True:
+            scaled = self._resize(image, scale)
+            data, quality = self._fit_quality(scaled)
+            if not self.max_bytes or len(data) <= self.max_bytes or scale <= self.MIN_SCALE:
+                break
+            scale = max(self.MIN_SCALE, scale * self.DOWNSCALE_STEP)
+        return EncodeResult(data, self.format, quality, scale, scaled.size, time.perf_counter() - start)
+
+
+class EncodeCache:
+    """LRU of encoded images keyed by image fingerprint."""
+
+    def __init__(self, max_items: int = ENCODE_CACHE_ITEMS):
+        self.max_items = max_items
+        self._entries: "OrderedDict[str, EncodeResult]" = OrderedDict()
+
+    def get(self, fingerprint: str) -> Optional[EncodeResult]:
+        result = self._entries.get(fingerprint)
+        metrics.inc('encode_cache_total', result='hit' if result is not None else 'miss')
+        if result is not None:
+            self._entries.move_to_end(fingerprint)
+        return result
+
+    def put(self, fingerprint: str, result: EncodeResult) -> None:
+        self._entries[fingerprint] = result
+        self._entries.move_to_end(fingerprint)
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
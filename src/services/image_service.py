@@ -1,17 +1,41 @@
-import io
-from typing import List, Dict, Any, Optional
-from PIL import Image, ImageDraw, ImageFont
-import requests
+import asyncio
+import hashlib
+import json
+from typing import Dict, List, Optional, Tuple
+from PIL import Image, ImageFont
 from utils.logger import logger
-from utils.text_utils import reverse_hebrew_text, hebrew_sort_key
-from config import CACHE_DIR, FONT_PATH, FONT_SIZE
+from utils.metrics import metrics
+from utils.text_utils import hebrew_sort_key
+from config import FONT_PATH, FONT_SIZE, ALBUM_MODE, ALBUM_PAGE_SIZE, ENCODE_MIN_WIDTH
+from api.http_client import HttpClient
+from services.photo_cache import PhotoCache
+from services.compositor import TileCompositor, TileEntry
+from services.render_pool import RenderPool
+from services.image_encoder import EncodeCache, EncodeResult, ImageEncoder
+from services.report_chart import ChartRow, RankingChart
+from models.member import KnessetMember
 
 
 class ImageService:
-    def __init__(self):
-        """Initialize ImageService with font and cache directory."""
+    # Telegram albums hold 2-10 photos
+    MAX_ALBUM_PAGES = 10
+
+    def __init__(self, http_client: HttpClient, render_pool: RenderPool, album_mode: str = ALBUM_MODE,
+                 page_size: int = ALBUM_PAGE_SIZE, min_width: int = ENCODE_MIN_WIDTH):
+        """
+        Initialize ImageService with font, photo cache, the shared HTTP client and render pool.
+
+        Args:
+            album_mode: 'off', 'pages' or 'bloc' (see album_pages)
+            page_size: Members per album page
+            min_width: Narrowest width a single image may be scaled to; with album
+                mode off, more members than that allows are sent as an album
+        """
+        if album_mode not in ('off', 'pages', 'bloc'):
+            raise ValueError(f"Unknown album mode: {album_mode}")
+        self.http = http_client
+        self.render_pool = render_pool
         self.font = self._load_font()
-        CACHE_DIR.mkdir(exist_ok=True)
 
         # Image configuration
         self.width = 800
@@ -20,142 +44,283 @@ class ImageService:
         self.members_per_row = 4
         self.background_color = (220, 240, 255, 255)
 
+        self.photo_cache = PhotoCache(http_client, tile_size=self.img_size)
+        self.compositor = self._new_compositor()
+        self.encoder = ImageEncoder()
+        self.encode_cache = EncodeCache()
+        # The compositor keeps the last canvas, so renders must not overlap
+        self._render_lock = asyncio.Lock()
+
+        self.album_mode = album_mode
+        self.page_size = max(1, page_size)
+        self.readable_members = self._readable_members(min_width)
+        self._album_layout: Dict[int, int] = {}
+        # Every album page has its own compositor, so pages render concurrently and incrementally
+        self._page_renderers: Dict[int, Tuple[TileCompositor, asyncio.Lock]] = {}
+        self.render_pool.configure({
+            'font_path': str(FONT_PATH), 'font_size': FONT_SIZE, 'width': self.width,
+            'img_size': self.img_size, 'spacing': self.spacing,
+            'members_per_row': self.members_per_row, 'background_color': self.background_color
+        })
+
+    def _new_compositor(self) -> TileCompositor:
+        return TileCompositor(self.font, FONT_SIZE, width=self.width, img_size=self.img_size,
+                              spacing=self.spacing, members_per_row=self.members_per_row,
+                              background_color=self.background_color)
+
+    def _readable_members(self, min_width: int) -> Optional[int]:
+        """Most members one image holds before fitting it to max_side makes it narrower than min_width."""
+        if not self.encoder.max_side or not min_width:
+            return None
+        max_height = self.encoder.max_side * self.width / min(min_width, self.width)
+        return max(1, int(max_height // self.compositor.row_height)) * self.members_per_row
+
+    def _page_limit(self) -> Optional[int]:
+        """Members per page, or None when everyone goes into one image."""
+        return self.page_size if self.album_mode != 'off' else self.readable_members
+
     def _load_font(self) -> ImageFont.FreeTypeFont:
         """Load the font for image text."""
         try:
             return ImageFont.truetype(str(FONT_PATH), FONT_SIZE)
         except Exception as e:
-            logger.warning(f"Failed to load Arial font: {e}")
+            logger.warning("Failed to load Arial font: %s", e)
             return ImageFont.load_default()
 
-    async def download_member_image(self, url: str) -> Optional[Image.Image]:
+    async def download_member_image(self, url: str, allow_stale: bool = False) -> Optional[Image.Image]:
         """
-        Download and cache member image from URL.
+        Get the cached, pre-resized RGBA tile of a member image.
 
         Args:
             url: URL of the member's image
+            allow_stale: Use a cached tile due for revalidation without waiting for it
 
         Returns:
             Optional[Image.Image]: PIL Image object or None if download fails
         """
-        try:
-            if not url:
-                return None
+        return await self.photo_cache.get_tile(url, allow_stale)
 
-            cache_key = str(hash(url)) + ".jpg"
-            cache_path = CACHE_DIR / cache_key
+    def cached_member_images(self, members: List[KnessetMember]) -> int:
+        """Number of members whose photo is in the disk cache."""
+        return self.photo_cache.cached(m.image_path for m in members)
 
-            if cache_path.exists():
-                return Image.open(cache_path)
+    async def prefetch_member_images(self, members: List[KnessetMember], allow_stale: bool = False) -> int:
+        """
+        Download all missing member images concurrently.
 
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
+        Args:
+            members: List of member records
+            allow_stale: Accept cached photos due for revalidation (revalidated in the background)
 
-            response = requests.get(url, headers=headers, verify=False)
-            if response.status_code == 200:
-                image = Image.open(io.BytesIO(response.content))
-                image.save(cache_path)
-                return image
+        Returns:
+            int: Number of members whose image is available
+        """
+        try:
+            return await self.photo_cache.prefetch((m.image_path for m in members), allow_stale=allow_stale)
+        except Exception as e:
+            logger.error("Error prefetching member images: %s", e)
+            return 0
 
-            logger.warning(f"Failed to download image from {url}: {response.status_code}")
-            return None
+    def _album_groups(self, members: List[KnessetMember]) -> List[List[KnessetMember]]:
+        """Sort members for display, split by bloc in 'bloc' mode."""
+        members = sorted(members, key=hebrew_sort_key)
+        if self.album_mode != 'bloc':
+            return [members]
+        return [[m for m in members if m.is_coalition], [m for m in members if not m.is_coalition]]
 
-        except Exception as e:
-            logger.error(f"Error downloading image from {url}: {e}")
-            return None
+    def set_album_roster(self, members: List[KnessetMember]) -> None:
+        """
+        Assign every member of the roster to an album page.
 
-    def _calculate_image_dimensions(self, total_members: int) -> tuple[int, int]:
-        """Calculate the dimensions for the final image based on member count."""
-        row_height = self.img_size + FONT_SIZE + self.spacing
-        num_rows = (total_members + self.members_per_row - 1) // self.members_per_row
-        height = num_rows * row_height
-        return self.width, height
-
-    def _get_member_position(self, index: int, total_members: int,
-                             num_rows: int) -> tuple[int, int]:
-        """Calculate x, y position for member image and text."""
-        current_row = index // self.members_per_row
-        is_last_row = current_row == num_rows - 1
-        column_in_row = index % self.members_per_row
-
-        row_height = self.img_size + FONT_SIZE + self.spacing
-        y = current_row * row_height + self.spacing
-
-        if is_last_row:
-            total_in_row = min(self.members_per_row,
-                               total_members - (current_row * self.members_per_row))
-            offset = (self.members_per_row - total_in_row) * (self.width // self.members_per_row) // 2
-            x = column_in_row * (self.width // self.members_per_row) + offset
-        else:
-            x = (self.members_per_row - 1 - column_in_row) * (self.width // self.members_per_row)
+        Pages are fixed ranges of the full roster in display order, so a
+        member entering or leaving changes only their own page and the
+        other pages keep their cached uploads.
 
-        return x + self.spacing, y
+        Args:
+            members: The whole member list, present or not
+        """
+        size = self._page_limit()
+        if size is None:
+            return
+        groups = [group for group in self._album_groups(members) if group]
+        while sum(-(-len(group) // size) for group in groups) > self.MAX_ALBUM_PAGES:
+            size += 1
+
+        layout = {}
+        page = 0
+        for group in groups:
+            for start in range(0, len(group), size):
+                layout.update((member.mk_id, page) for member in group[start:start + size])
+                page += 1
+        self._album_layout = layout
+
+    def album_pages(self, present_members: List[KnessetMember]) -> List[List[KnessetMember]]:
+        """
+        Split the present members into album pages.
 
-    def _draw_member_name(self, draw: ImageDraw.ImageDraw, member: Dict[str, Any],
-                          x: int, y: int) -> None:
-        """Draw member name."""
-        lastname = reverse_hebrew_text(member['Lastname'])
-        firstname = reverse_hebrew_text(member['Firstname'])
-        name = f"{lastname} {firstname}"
+        Returns a single page when everyone fits on one page: `page_size`
+        members, or with album mode off as many as stay readable in one
+        image (see _readable_members). Pages follow the roster layout from
+        set_album_roster; without one, the sorted members are cut into pages.
+        """
+        size = self._page_limit()
+        if size is None or len(present_members) <= size:
+            return [present_members]
+
+        if self._album_layout:
+            by_page: Dict[int, List[KnessetMember]] = {}
+            unknown = len(self._album_layout)
+            for member in present_members:
+                by_page.setdefault(self._album_layout.get(member.mk_id, unknown), []).append(member)
+            pages = [by_page[page] for page in sorted(by_page)]
+        else:
+            pages = [group[start:start + size] for group in self._album_groups(present_members)
+                     for start in range(0, len(group), size)]
+            pages = [page for page in pages if page]
 
-        bbox = self.font.getbbox(name)
-        text_width = bbox[2] - bbox[0]
+        if len(pages) > self.MAX_ALBUM_PAGES:
+            pages[self.MAX_ALBUM_PAGES - 1:] = [[m for page in pages[self.MAX_ALBUM_PAGES - 1:] for m in page]]
+        return pages
 
-        text_x = x + (self.img_size - text_width) // 2
-        text_y = y + self.img_size
+    def photo_fingerprints(self, present_members: List[KnessetMember]) -> List[str]:
+        """Fingerprint of every image (album page) that would be sent for these members."""
+        return [self.presence_fingerprint(page) for page in self.album_pages(present_members)]
 
-        # Draw text without shadow
-        draw.text((text_x, text_y), name, fill=(0, 0, 0), font=self.font)
+    def presence_fingerprint(self, present_members: List[KnessetMember]) -> str:
+        """
+        Fingerprint of the image that would be rendered for these members.
 
-    async def create_presence_image(self, present_members: List[Dict[str, Any]]) -> Optional[Image.Image]:
+        Covers the members, their names and photo versions, the layout and the
+        encoder settings, so equal fingerprints mean identical uploads.
+        """
+        members = sorted((m.mk_id, m.firstname, m.lastname,
+                          self.photo_cache.version(m.image_path) or m.image_path)
+                         for m in present_members)
+        layout = (self.width, self.img_size, self.spacing, self.members_per_row,
+                  self.background_color, str(FONT_PATH), FONT_SIZE, self.encoder.settings_key())
+        payload = json.dumps([layout, members], ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    async def _get_tile_entries(self, present_members: List[KnessetMember],
+                                as_paths: bool = False) -> List[TileEntry]:
+        """Sort members for display and attach their photo tiles (or tile file paths)."""
+        sorted_members = sorted(present_members, key=hebrew_sort_key)
+
+        # Fetch missing photos concurrently instead of one by one below; cached
+        # photos are used even when due for revalidation, so renders don't wait on the photo host
+        await self.prefetch_member_images(sorted_members, allow_stale=True)
+
+        entries = []
+        for member in sorted_members:
+            # Tiles come from the cache already resized and in RGBA
+            photo = await self.download_member_image(member.image_path, allow_stale=True)
+            if as_paths and photo is not None:
+                # Process workers load tiles from the photo cache themselves
+                photo = str(self.photo_cache.tile_path(member.image_path))
+            entries.append(TileEntry(str(member.mk_id), photo, member.firstname, member.lastname))
+        return entries
+
+    async def create_presence_image(self, present_members: List[KnessetMember]) -> Optional[Image.Image]:
         """
         Create image with present Knesset members.
 
         Args:
-            present_members: List of dictionaries containing member data
+            present_members: List of member records
 
         Returns:
             Optional[Image.Image]: PIL Image object or None if creation fails
         """
         try:
-            sorted_members = sorted(present_members, key=hebrew_sort_key)
-            width, height = self._calculate_image_dimensions(len(sorted_members))
-            num_rows = (len(sorted_members) + self.members_per_row - 1) // self.members_per_row
+            entries = await self._get_tile_entries(present_members)
+            async with self._render_lock:
+                with metrics.time('render'):
+                    return await self.render_pool.run(self.compositor.render, entries)
 
-            # Create base image
-            image = Image.new('RGBA', (width, height), self.background_color)
-            draw = ImageDraw.Draw(image)
+        except Exception as e:
+            logger.error("Error creating presence image: %s", e)
+            return None
 
-            for i, member in enumerate(sorted_members):
-                try:
-                    member_img = await self.download_member_image(member['ImagePath'])
-                    if member_img is None:
-                        continue
+    async def encode_presence_image(self, present_members: List[KnessetMember],
+                                    page: Optional[int] = None) -> Optional[EncodeResult]:
+        """
+        Create the presence image and encode it within the byte budget, in the render pool.
 
-                    # Resize and convert image
-                    member_img = member_img.resize((self.img_size, self.img_size))
-                    if member_img.mode != 'RGBA':
-                        member_img = member_img.convert('RGBA')
+        Images already encoded for the same fingerprint are served from the
+        encode cache without rendering.
 
-                    # Calculate position and paste image
-                    x, y = self._get_member_position(i, len(sorted_members), num_rows)
-                    image.paste(member_img, (x, y),
-                                member_img if member_img.mode == 'RGBA' else None)
+        Args:
+            present_members: List of member records
+            page: Album page index; each page renders on its own compositor
 
-                    # Draw member name
-                    self._draw_member_name(draw, member, x, y)
+        Returns:
+            Optional[EncodeResult]: Encoded image or None if creation fails
+        """
+        try:
+            if page is None:
+                compositor, render_lock = self.compositor, self._render_lock
+            else:
+                if page not in self._page_renderers:
+                    self._page_renderers[page] = (self._new_compositor(), asyncio.Lock())
+                compositor, render_lock = self._page_renderers[page]
+            as_paths = self.render_pool.uses_processes
+            # Prefetching here settles photo versions before the fingerprint is taken
+            entries = await self._get_tile_entries(present_members, as_paths=as_paths)
+            fingerprint = self.presence_fingerprint(present_members)
+            result = self.encode_cache.get(fingerprint)
+            if result is not None:
+                return result
+
+            if as_paths:
+                result = await self.render_pool.render_encoded(compositor, entries, self.encoder, page)
+            else:
+                async with render_lock:
+                    result = await self.render_pool.render_encoded(compositor, entries, self.encoder)
+
+            logger.info("Encoded presence image: %s", result.describe())
+            metrics.set('encoded_image_bytes', len(result.data))
+            self.encode_cache.put(fingerprint, result)
+            return result
 
-                except Exception as e:
-                    logger.error(f"Error processing member {member.get('Lastname', 'Unknown')}: {e}")
-                    continue
+        except Exception as e:
+            logger.error("Error creating presence image: %s", e)
+            return None
 
-            # Convert to RGB for final output
-            rgb_image = Image.new('RGB', image.size, (255, 255, 255))
-            rgb_image.paste(image, mask=image.split()[3])
+    async def encode_album(self, pages: List[Tuple[int, List[KnessetMember]]]) -> List[Optional[EncodeResult]]:
+        """
+        Render and encode album pages concurrently in the render pool.
 
-            return rgb_image
+        Args:
+            pages: (page index, members) of the pages to encode
+
+        Returns:
+            List[Optional[EncodeResult]]: Encoded page, or None where creation failed
+        """
+        if not pages:
+            return []
+        with metrics.time('album'):
+            return list(await asyncio.gather(*(self.encode_presence_image(members, page=index)
+                                               for index, members in pages)))
+
+    async def encode_report_image(self, title: str, rows: List[ChartRow]) -> Optional[EncodeResult]:
+        """
+        Render an attendance ranking chart and encode it, in the render pool.
+
+        Args:
+            title: Chart heading
+            rows: Bars in display order
+
+        Returns:
+            Optional[EncodeResult]: Encoded chart or None if creation fails
+        """
+        try:
+            chart = RankingChart(self.font, width=self.width, spacing=self.spacing,
+                                 background_color=self.background_color[:3])
+            with metrics.time('report_render'):
+                image = await self.render_pool.run(chart.render, title, rows)
+                result = await self.render_pool.run(self.encoder.encode, image)
+            logger.info("Encoded report image: %s", result.describe())
+            return result
 
         except Exception as e:
-            logger.error(f"Error creating presence image: {e}")
-            return None
\ No newline at end of file
+            logger.error("Error creating report image: %s", e)
+            return None
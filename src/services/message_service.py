@@ -1,17 +1,74 @@
-from collections import defaultdict
+import time
 from datetime import datetime
 from typing import List, Dict, Any, Tuple
 import pytz
 from utils.text_utils import format_rtl_text
 from utils.logger import logger
-from api.telegram_api import TelegramAPI
+from utils.metrics import metrics
+from services.telegram_dispatcher import TelegramDispatcher, EditResult
+from models.roster import Roster
+from models.member import KnessetMember
+from services.attendance import AttendanceReport
+
+# Fixed caption texts per language; faction names come from the API in Hebrew
+CAPTION_TEXTS = {
+    'he': {
+        'title': "🏛️ עדכון נוכחות במליאת הכנסת",
+        'total': "👥 סה״כ חברי כנסת במליאה",
+        'coalition': "🔷 קואליציה",
+        'opposition': "🔶 אופוזיציה",
+        'factions': "📊 נוכחות לפי סיעות:",
+        'footer': "🔄 מתעדכן בכל שינוי, השעה מתרעננת {every}",
+        'every_minute': "כל דקה",
+        'every_minutes': "כל {minutes} דקות",
+        'stale': "⚠️ אתר הכנסת אינו זמין כרגע, מוצגים הנתונים האחרונים",
+        'daily_report': "📈 סיכום נוכחות יומי",
+        'weekly_report': "📈 סיכום נוכחות שבועי",
+        'sitting_time': "🕐 זמן ישיבות",
+        'sittings': "ישיבות",
+        'top_members': "🏅 הנוכחים ביותר:",
+        'streaks': "🔥 רצפי נוכחות (ימי ישיבה):",
+        'best_streak': "שיא"
+    },
+    'en': {
+        'title': "🏛️ Knesset plenum attendance",
+        'total': "👥 MKs in the plenum",
+        'coalition': "🔷 Coalition",
+        'opposition': "🔶 Opposition",
+        'factions': "📊 Attendance by faction:",
+        'footer': "🔄 Updated on every change, time refreshed {every}",
+        'every_minute': "every minute",
+        'every_minutes': "every {minutes} minutes",
+        'stale': "⚠️ The Knesset site is unavailable, showing the last known data",
+        'daily_report': "📈 Daily attendance summary",
+        'weekly_report': "📈 Weekly attendance summary",
+        'sitting_time': "🕐 Sitting time",
+        'sittings': "sittings",
+        'top_members': "🏅 Most present:",
+        'streaks': "🔥 Attendance streaks (sitting days):",
+        'best_streak': "best"
+    }
+}
 
 
 class MessageService:
-    def __init__(self):
-        """Initialize MessageService with TelegramAPI instance."""
-        self.telegram = TelegramAPI()
+    def __init__(self, dispatcher: TelegramDispatcher, language: str = 'he', caption_format: str = 'full'):
+        """
+        Initialize MessageService with the Telegram dispatcher of its chat.
+
+        Args:
+            language: Caption language ('he' or 'en')
+            caption_format: 'full' lists every faction, 'compact' only the totals
+        """
+        self.telegram = dispatcher
         self.israel_tz = pytz.timezone('Asia/Jerusalem')
+        self.language = language
+        self.caption_format = caption_format
+        self.texts = CAPTION_TEXTS[language]
+        # Timestamp-only edits are held back for the dispatcher's refresh interval
+        minutes = max(1, round(dispatcher.caption_refresh_interval / 60))
+        every = self.texts['every_minute'] if minutes == 1 else self.texts['every_minutes'].format(minutes=minutes)
+        self.footer = self.texts['footer'].format(every=every)
 
     @staticmethod
     def _get_emoji_for_percentage(percentage: float) -> str:
@@ -31,37 +88,14 @@ class MessageService:
         }
         return ''.join(number_emojis[d] for d in str(number))
 
-    def _calculate_coalition_stats(self, members: List[Dict[str, Any]]) -> Tuple[int, int, int, int]:
+    def _calculate_coalition_stats(self, roster: Roster) -> Tuple[int, int, int, int]:
         """Calculate coalition and opposition statistics."""
-        coalition_present = opposition_present = 0
-        coalition_total = opposition_total = 0
-
-        for member in members:
-            if member['IsCoalition']:
-                coalition_total += 1
-                if member['IsPresent']:
-                    coalition_present += 1
-            else:
-                opposition_total += 1
-                if member['IsPresent']:
-                    opposition_present += 1
-
-        return coalition_present, coalition_total, opposition_present, opposition_total
-
-    def _calculate_faction_stats(self, present_members: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Calculate statistics for each faction."""
-        faction_counts = defaultdict(int)
-        faction_totals = defaultdict(int)
-
-        for member in present_members:
-            faction_name = member['FactionName']
-            faction_totals[faction_name] += 1
-            if member['IsPresent']:
-                faction_counts[faction_name] += 1
+        return roster.coalition_stats()
 
+    def _calculate_faction_stats(self, roster: Roster) -> List[Dict[str, Any]]:
+        """Calculate statistics for each faction."""
         faction_data = []
-        for faction, total in faction_totals.items():
-            present = faction_counts[faction]
+        for faction, present, total in roster.faction_stats():
             if present > 0:  # רק סיעות עם נוכחים
                 percentage = (present / total) * 100
                 faction_data.append({
@@ -73,24 +107,28 @@ class MessageService:
 
         return sorted(faction_data, key=lambda x: (-x['percentage'], x['name']))
 
-    def get_faction_summary(self, present_members: List[Dict[str, Any]]) -> str:
+    def get_faction_summary(self, roster: Roster, stale: bool = False) -> str:
         """
         Generate a formatted summary of Knesset attendance by faction.
 
         Args:
-            present_members: List of dictionaries containing member data
+            roster: Roster holding the current presence of all members
+            stale: The presence is the last known one, upstream is unavailable
 
         Returns:
             str: Formatted message ready for Telegram
         """
         try:
-            # Calculate coalition/opposition statistics
-            coalition_present, coalition_total, opposition_present, opposition_total = \
-                self._calculate_coalition_stats(present_members)
+            with metrics.time('stats'):
+                # Calculate coalition/opposition statistics
+                coalition_present, coalition_total, opposition_present, opposition_total = \
+                    self._calculate_coalition_stats(roster)
+
+                # Calculate faction statistics
+                faction_data = self._calculate_faction_stats(roster)
+                total_present = sum(f['present'] for f in faction_data)
 
-            # Calculate faction statistics
-            faction_data = self._calculate_faction_stats(present_members)
-            total_present = sum(f['present'] for f in faction_data)
+            caption_start = time.perf_counter()
 
             # Get current time in Israel timezone
             current_time = datetime.now(self.israel_tz).strftime("%H:%M")
@@ -103,52 +141,123 @@ class MessageService:
                 faction_lines.append(line)
 
             # Construct message parts
+            texts = self.texts
+            line = format_rtl_text if self.language == 'he' else str
             message_parts = [
-                format_rtl_text(f"🏛️ עדכון נוכחות במליאת הכנסת | {current_time}"),
-                format_rtl_text("──────────────────"),
-                format_rtl_text(f"👥 סה״כ חברי כנסת במליאה: {self._number_to_emoji(total_present)}"),
-                "",
-                format_rtl_text(f"🔷 קואליציה: {coalition_present}/{coalition_total}"),
-                format_rtl_text(f"🔶 אופוזיציה: {opposition_present}/{opposition_total}"),
-                "",
-                format_rtl_text("📊 נוכחות לפי סיעות:"),
-                format_rtl_text("\n".join(faction_lines)),
+                line(f"{texts['title']} | {current_time}"),
+                line("──────────────────"),
+                line(f"{texts['total']}: {self._number_to_emoji(total_present)}"),
                 "",
-                format_rtl_text("🔄 מתעדכן כל דקה")
+                line(f"{texts['coalition']}: {coalition_present}/{coalition_total}"),
+                line(f"{texts['opposition']}: {opposition_present}/{opposition_total}"),
+                ""
             ]
+            if self.caption_format == 'full':
+                message_parts += [
+                    line(texts['factions']),
+                    line("\n".join(faction_lines)),
+                    ""
+                ]
+            message_parts.append(line(texts['stale'] if stale else self.footer))
 
-            return "\n".join(message_parts)
+            caption = "\n".join(message_parts)
+            metrics.observe_stage('caption', time.perf_counter() - caption_start)
+            return caption
 
         except Exception as e:
-            logger.error(f"Error generating faction summary: {e}")
+            logger.error("Error generating faction summary: %s", e)
             raise
 
-    async def update_or_resend(self, last_message_id: int, present_members: List[Dict[str, Any]],
+    @staticmethod
+    def _hours(seconds: float) -> str:
+        """Format a duration as H:MM."""
+        minutes = int(seconds // 60)
+        return f"{minutes // 60}:{minutes % 60:02d}"
+
+    def get_attendance_report(self, report: AttendanceReport, members: Dict[int, KnessetMember],
+                              streaks: int = 5) -> str:
+        """
+        Generate the caption of a daily or weekly attendance report.
+
+        Args:
+            report: Rankings from AttendanceStats
+            members: Member records by MkId, for names
+            streaks: Longest current streaks to list, each with the member's longest streak if that is longer
+
+        Returns:
+            str: Formatted message ready for Telegram
+        """
+        texts = self.texts
+        line = format_rtl_text if self.language == 'he' else str
+        days = datetime.fromisoformat(report.first_day), datetime.fromisoformat(report.last_day)
+        period = days[1].strftime('%d.%m.%Y')
+        if report.days > 1:
+            period = f"{days[0].strftime('%d.%m')}–{period}"
+
+        def name(mk_id: int) -> str:
+            member = members.get(mk_id)
+            return f"{member.firstname} {member.lastname}" if member else str(mk_id)
+
+        member_lines = [f"{rank}. {name(mk_id)}: {self._hours(seconds)}"
+                        for rank, (mk_id, seconds) in enumerate(report.members, 1)]
+        streak_lines = [f"{name(mk_id)}: {days_in_row}"
+                        + (f" ({texts['best_streak']} {best})" if best > days_in_row else "")
+                        for mk_id, days_in_row, best in report.streaks[:streaks]]
+
+        message_parts = [
+            line(f"{texts['weekly_report' if report.days > 1 else 'daily_report']} | {period}"),
+            line("──────────────────"),
+            line(f"{texts['sitting_time']}: {self._hours(report.sitting_seconds)} "
+                 f"({report.sittings} {texts['sittings']})"),
+            line(f"{texts['coalition']}: {report.coalition_share:.0%}"),
+            line(f"{texts['opposition']}: {report.opposition_share:.0%}"),
+            ""
+        ]
+        if member_lines:
+            message_parts += [line(texts['top_members']), line("\n".join(member_lines)), ""]
+        if streak_lines:
+            message_parts += [line(texts['streaks']), line("\n".join(streak_lines))]
+        return "\n".join(message_parts).strip()
+
+    @staticmethod
+    def caption_content_key(caption: str) -> str:
+        """Return the caption without its timestamped header line."""
+        return caption.split("\n", 1)[-1]
+
+    async def update_or_resend(self, last_message_id: int, present_members: List[KnessetMember],
                                caption: str) -> int:
         """
         Try to update existing message, send new one if update fails.
 
         Args:
             last_message_id: ID of the last sent message
-            present_members: List of member data dictionaries
+            present_members: List of member records
             caption: Message caption to update or send
 
         Returns:
             int: Message ID of updated or new message
         """
+        content_key = self.caption_content_key(caption)
         try:
             if not last_message_id:
                 logger.info("No last message ID, sending new message")
-                return await self.telegram.send_photo(present_members, caption)
+                return await self.telegram.send_photo(present_members, caption, content_key)
 
-            logger.info(f"Attempting to update message {last_message_id}")
-            if await self.telegram.update_caption(last_message_id, caption):
-                logger.info(f"Successfully updated message {last_message_id}")
+            logger.info("Attempting to update message %s", last_message_id)
+            result = await self.telegram.edit_caption(last_message_id, caption, content_key)
+            if result == EditResult.UPDATED:
+                logger.info("Successfully updated message %s", last_message_id)
+                return last_message_id
+            if result == EditResult.UNCHANGED:
+                logger.info("Message %s is already up to date", last_message_id)
+                return last_message_id
+            if result == EditResult.RETRY_LATER:
+                logger.warning("Temporary failure updating message %s, will retry next run", last_message_id)
                 return last_message_id
 
-            logger.warning(f"Failed to update message {last_message_id}, sending new message")
-            return await self.telegram.send_photo(present_members, caption)
+            logger.warning("Failed to update message %s, sending new message", last_message_id)
+            return await self.telegram.send_photo(present_members, caption, content_key)
 
         except Exception as e:
-            logger.error(f"Error in update_or_resend: {e}")
-            return await self.telegram.send_photo(present_members, caption)
\ No newline at end of file
+            logger.error("Error in update_or_resend: %s", e)
+            return await self.telegram.send_photo(present_members, caption, content_key)
\ No newline at end of file
@@ -0,0 +1,339 @@
+import asyncio
+import hashlib
+import io
+import json
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+from PIL import Image
+from utils.logger import logger
+from utils.metrics import metrics
+from config import (CACHE_DIR, PHOTO_CACHE_MEMORY_ITEMS, PHOTO_CACHE_MAX_BYTES,
+                    PHOTO_CACHE_REVALIDATE_AFTER, PHOTO_PREFETCH_CONCURRENCY,
+                    PHOTO_PREFETCH_PER_HOST)
+from api.http_client import HttpClient
+
+
+class PhotoCache:
+    """
+    Two-tier cache of member photos, stored as pre-resized RGBA tiles.
+
+    Disk entries are keyed by a stable digest of the URL (unlike the built-in
+    hash(), which is salted per process) and carry the ETag/Last-Modified
+    validators of the download, so stale entries are revalidated with a
+    conditional GET instead of being downloaded again. Decoded tiles are kept
+    in an in-memory LRU so a render never decodes or resizes a photo twice.
+    Renders may take a stale tile and have it revalidated in the background,
+    so a restart after a day's pause doesn't wait on the photo host. Decoding,
+    resizing and file access run on the default executor, off the event loop.
+
+    Only files named like the cache's own entries are read or removed, so
+    CACHE_DIR may point at a directory that holds other files too.
+    """
+
+    # <key>.json, <key>_<version>_<size>.png, and <hash()>.jpg of the old cache
+    META_NAME = re.compile(r'[0-9a-f]{32}\.json')
+    OWN_NAME = re.compile(r'[0-9a-f]{32}(\.json|_[0-9a-f]{16}_\d+\.png)|-?\d+\.jpg')
+
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+
+    def __init__(self, http_client: HttpClient, tile_size: int, cache_dir: Path = CACHE_DIR,
+                 memory_items: int = PHOTO_CACHE_MEMORY_ITEMS, max_disk_bytes: int = PHOTO_CACHE_MAX_BYTES,
+                 revalidate_after: float = PHOTO_CACHE_REVALIDATE_AFTER,
+                 per_host_limit: int = PHOTO_PREFETCH_PER_HOST):
+        """Initialize PhotoCache and index the existing cache directory."""
+        self.http = http_client
+        self.tile_size = tile_size
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.revalidate_after = revalidate_after
+        self.per_host_limit = per_host_limit
+
+        self._tiles: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._meta: Dict[str, Dict] = {}
+        self._disk_usage: Dict[str, Tuple[int, float]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+        self.cache_dir.mkdir(exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def cache_key(url: str) -> str:
+        """Return the process-independent cache key for a URL."""
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+    def _meta_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _tile_path(self, key: str, meta: Dict) -> Path:
+        return self.cache_dir / f"{key}_{meta['version']}_{self.tile_size}.png"
+
+    def tile_path(self, url: str) -> Optional[Path]:
+        """Return the on-disk tile file for a URL, if it is cached."""
+        meta = self._meta.get(self.cache_key(url)) if url else None
+        return self._tile_path(self.cache_key(url), meta) if meta else None
+
+    def version(self, url: str) -> Optional[str]:
+        """Return the content version of a cached photo, if it is cached."""
+        meta = self._meta.get(self.cache_key(url)) if url else None
+        return meta['version'] if meta else None
+
+    def _load_index(self) -> None:
+        """Read entry metadata from disk and drop cache files that no entry references."""
+        referenced = set()
+        for meta_path in self.cache_dir.glob("*.json"):
+            if not self.META_NAME.fullmatch(meta_path.name):
+                continue
+            try:
+                meta = json.loads(meta_path.read_text())
+                key = meta_path.stem
+                tile_path = self._tile_path(key, meta)
+                if not tile_path.exists():
+                    meta_path.unlink()
+                    continue
+                self._meta[key] = meta
+                stat = tile_path.stat()
+                self._disk_usage[key] = (stat.st_size, stat.st_mtime)
+                referenced.update((meta_path.name, tile_path.name))
+            except Exception as e:
+                logger.warning("Dropping unreadable photo cache entry %s: %s", meta_path.name, e)
+                meta_path.unlink(missing_ok=True)
+
+        # Files from the old hash()-keyed cache or orphaned tiles
+        for path in self.cache_dir.iterdir():
+            if path.is_file() and path.name not in referenced and self.OWN_NAME.fullmatch(path.name):
+                path.unlink(missing_ok=True)
+
+        self._remove_files(self._evict_disk())
+
+    def _make_tile(self, content: bytes) -> Image.Image:
+        """Decode downloaded bytes into a tile-sized RGBA image."""
+        image = Image.open(io.BytesIO(content))
+        image = image.resize((self.tile_size, self.tile_size))
+        if image.mode != 'RGBA':
+            image = image.convert('RGBA')
+        return image
+
+    def _remember(self, key: str, tile: Image.Image) -> None:
+        """Put a tile into the in-memory LRU."""
+        self._tiles[key] = tile
+        self._tiles.move_to_end(key)
+        while len(self._tiles) > self.memory_items:
+            self._tiles.popitem(last=False)
+
+    def _decode_and_write(self, key: str, url: str, response, content: bytes) -> Tuple[Image.Image, Dict, int]:
+        """Decode a download into a tile and write it to disk, replacing any older version (runs off the event loop)."""
+        tile = self._make_tile(content)
+        old_meta = self._meta.get(key)
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'version': hashlib.sha256(content).hexdigest()[:16],
+            'checked_at': time.time()
+        }
+        tile_path = self._tile_path(key, meta)
+        tile.save(tile_path, format='PNG')
+        self._meta_path(key).write_text(json.dumps(meta))
+
+        if old_meta and old_meta['version'] != meta['version']:
+            self._tile_path(key, old_meta).unlink(missing_ok=True)
+        return tile, meta, tile_path.stat().st_size
+
+    def _store(self, key: str, meta: Dict, size: int) -> List[Path]:
+        """Index an entry written by _decode_and_write; returns the files of the entries it evicted."""
+        self._meta[key] = meta
+        self._disk_usage[key] = (size, time.time())
+        return self._evict_disk()
+
+    def _evict_disk(self) -> List[Path]:
+        """Drop least recently used entries until the disk budget is met; returns their files to remove."""
+        total = sum(size for size, _ in self._disk_usage.values())
+        if total <= self.max_disk_bytes:
+            return []
+
+        paths = []
+        for key, (size, _) in sorted(self._disk_usage.items(), key=lambda item: item[1][1]):
+            if total <= self.max_disk_bytes:
+                break
+            meta = self._meta.pop(key, None)
+            if meta:
+                paths.append(self._tile_path(key, meta))
+            paths.append(self._meta_path(key))
+            self._disk_usage.pop(key, None)
+            self._tiles.pop(key, None)
+            total -= size
+        return paths
+
+    @staticmethod
+    def _remove_files(paths: List[Path]) -> None:
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+    def _needs_revalidation(self, meta: Dict) -> bool:
+        return time.time() - meta.get('checked_at', 0) > self.revalidate_after
+
+    async def _download(self, key: str, url: str) -> Optional[Image.Image]:
+        """Download (or conditionally revalidate) a photo and return its tile."""
+        meta = self._meta.get(key)
+        headers = dict(self.HEADERS)
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        host = urlsplit(url).netloc
+        host_limit = self._host_limits.get(host)
+        if host_limit is None:
+            host_limit = self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+
+        async with host_limit:
+            response = await self.http.get(url, headers=headers, verify=False)
+
+        loop = asyncio.get_running_loop()
+        if response.status_code == 304 and meta:
+            metrics.inc('photo_cache_events_total', event='revalidated')
+            meta['checked_at'] = time.time()
+            await loop.run_in_executor(None, self._meta_path(key).write_text, json.dumps(meta))
+            return None
+
+        if response.status_code == 200:
+            metrics.inc('photo_cache_events_total', event='download')
+            tile, meta, size = await loop.run_in_executor(
+                None, self._decode_and_write, key, url, response, response.content)
+            evicted = self._store(key, meta, size)
+            if evicted:
+                await loop.run_in_executor(None, self._remove_files, evicted)
+            # Replaces the tile a stale render may have put into memory
+            self._remember(key, tile)
+            return tile
+
+        metrics.inc('photo_cache_events_total', event='error')
+        logger.warning("Failed to download image from %s: %s", url, response.status_code)
+        return None
+
+    @staticmethod
+    def _read_tile(path: Path) -> Image.Image:
+        with Image.open(path) as tile:
+            tile.load()
+            return tile if tile.mode == 'RGBA' else tile.convert('RGBA')
+
+    async def _load_tile(self, key: str) -> Optional[Image.Image]:
+        """Load a tile from disk, or None if the entry is missing or corrupt."""
+        meta = self._meta.get(key)
+        if not meta:
+            return None
+        try:
+            tile = await asyncio.get_running_loop().run_in_executor(None, self._read_tile,
+                                                                    self._tile_path(key, meta))
+            size, _ = self._disk_usage.get(key, (0, 0))
+            self._disk_usage[key] = (size, time.time())
+            metrics.inc('photo_cache_events_total', event='disk_hit')
+            return tile
+        except Exception as e:
+            logger.warning("Corrupt photo cache entry for %s: %s", meta.get('url'), e)
+            self._meta.pop(key, None)
+            self._disk_usage.pop(key, None)
+            return None
+
+    def _start_download(self, key: str, url: str) -> asyncio.Future:
+        """Download or revalidate a photo; concurrent requests for the same photo share one download."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._download(key, url))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._download_done(key, url, done))
+        return task
+
+    def _download_done(self, key: str, url: str, task: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        # Background revalidations have no awaiting caller to report to
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error downloading image from %s: %s", url, task.exception())
+
+    async def get_tile(self, url: str, allow_stale: bool = False) -> Optional[Image.Image]:
+        """
+        Get the resized RGBA tile for a member photo.
+
+        Args:
+            url: URL of the member's image
+            allow_stale: Return a cached tile that is due for revalidation right
+                away and revalidate it in the background
+
+        Returns:
+            Optional[Image.Image]: tile_size x tile_size RGBA image or None if unavailable
+        """
+        if not url:
+            return None
+
+        key = self.cache_key(url)
+        meta = self._meta.get(key)
+
+        if meta and not self._needs_revalidation(meta):
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                metrics.inc('photo_cache_events_total', event='memory_hit')
+                return tile
+
+        tile = None
+        if meta is None or self._needs_revalidation(meta):
+            task = self._start_download(key, url)
+            if meta is not None and allow_stale:
+                tile = self._tiles.get(key)
+                if tile is None:
+                    tile = await self._load_tile(key)
+                if tile is not None:
+                    self._remember(key, tile)
+                    return tile
+            try:
+                tile = await asyncio.shield(task)
+            except Exception:
+                # Logged by _download_done
+                pass
+
+        if tile is None:
+            tile = self._tiles.get(key)
+        if tile is None:
+            tile = await self._load_tile(key)
+        if tile is not None:
+            self._remember(key, tile)
+        return tile
+
+    def cached(self, urls: Iterable[str]) -> int:
+        """Number of the given photos that have a tile on disk (fresh or not)."""
+        return sum(self.cache_key(url) in self._meta for url in set(urls) if url)
+
+    async def prefetch(self, urls: Iterable[str], concurrency: int = PHOTO_PREFETCH_CONCURRENCY,
+                       allow_stale: bool = False) -> int:
+        """
+        Make sure tiles for all given photos are downloaded and decoded.
+
+        Downloads run concurrently, bounded by `concurrency` overall and by
+        the per-host limit for each photo host.
+
+        Args:
+            urls: Photo URLs to fetch
+            concurrency: Maximum number of photos processed at once
+            allow_stale: Accept cached tiles due for revalidation (see get_tile)
+
+        Returns:
+            int: Number of photos with a tile available
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_one(url: str) -> Optional[Image.Image]:
+            async with semaphore:
+                return await self.get_tile(url, allow_stale)
+
+        unique_urls = list(dict.fromkeys(url for url in urls if url))
+        tiles = await asyncio.gather(*(fetch_one(url) for url in unique_urls))
+        return sum(tile is not None for tile in tiles)
@@ -0,0 +1,65 @@
+from datetime import datetime
+from typing import Optional, Set
+import pytz
+from config import (POLLING_INTERVAL, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_BACKOFF_FACTOR,
+                    POLL_ACTIVE_HOURS, POLL_ACTIVE_DAYS)
+
+
+class AdaptivePollScheduler:
+    """
+    Decides how long to wait before the next poll of the Knesset endpoint.
+
+    While presence keeps changing the bot polls at the minimum interval and
+    relaxes towards POLLING_INTERVAL once it settles. Outside plenary hours,
+    or when nobody is present, the interval grows exponentially up to the
+    maximum, and drops back as soon as a change is seen.
+    """
+
+    def __init__(self, base_interval: float = POLLING_INTERVAL, min_interval: float = POLL_MIN_INTERVAL,
+                 max_interval: float = POLL_MAX_INTERVAL, backoff_factor: float = POLL_BACKOFF_FACTOR,
+                 active_hours: str = POLL_ACTIVE_HOURS, active_days: str = POLL_ACTIVE_DAYS):
+        """
+        Initialize AdaptivePollScheduler.
+
+        Args:
+            active_hours: Plenary hours in Israel time, as 'start-end' (e.g. '8-23')
+            active_days: Plenary weekdays, comma separated (Monday=0 ... Sunday=6)
+        """
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.backoff_factor = backoff_factor
+        start, end = active_hours.split('-')
+        self.active_start, self.active_end = int(start), int(end)
+        self.active_days: Set[int] = {int(day) for day in active_days.split(',') if day.strip()}
+        self.israel_tz = pytz.timezone('Asia/Jerusalem')
+        self._quiet_polls = 0
+
+    def is_active_time(self, now: Optional[datetime] = None) -> bool:
+        """Whether the plenary is expected to be in session at the given time."""
+        now = now or datetime.now(self.israel_tz)
+        return now.weekday() in self.active_days and self.active_start <= now.hour < self.active_end
+
+    def next_interval(self, changed: bool, present_count: int, now: Optional[datetime] = None) -> float:
+        """
+        Return the number of seconds to wait before the next poll.
+
+        Args:
+            changed: Whether presence changed in the last poll
+            present_count: Number of members currently present
+            now: Current time, defaults to now in Israel
+        """
+        if changed:
+            self._quiet_polls = 0
+            return self.min_interval
+
+        self._quiet_polls = min(self._quiet_polls + 1, 32)
+        growth = self.backoff_factor ** self._quiet_polls
+
+        if present_count == 0 or not self.is_active_time(now):
+            return min(self.max_interval, self.base_interval * growth)
+        return min(self.base_interval, self.min_interval * growth)
+
+    def reset(self) -> None:
+        """Return to the fastest polling rate."""
+        self._quiet_polls = 0
@@ -0,0 +1,229 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Set
+import numpy as np
+from utils.logger import logger
+from utils.metrics import metrics
+from utils.file_id_cache import FileIdCache
+from utils.state_manager import ChannelState
+from config import TELEGRAM_GLOBAL_RATE_PER_SECOND
+from api.telegram_api import TelegramAPI
+from services.attendance import AttendanceReport
+from services.change_detector import ChangeDetector
+from services.message_service import MessageService
+from services.report_chart import ChartRow
+from services.telegram_dispatcher import TelegramDispatcher, TokenBucket
+from models.destination import Destination
+from models.member import KnessetMember
+from models.roster import Roster
+
+
+COALITION_COLOR = (70, 130, 180)
+OPPOSITION_COLOR = (230, 140, 50)
+
+CHART_TITLES = {1: "נוכחות יומית לפי סיעות", 7: "נוכחות שבועית לפי סיעות"}
+
+
+class Channel:
+    """Publication state of one destination chat."""
+
+    def __init__(self, destination: Destination, dispatcher: TelegramDispatcher,
+                 message_service: MessageService):
+        self.destination = destination
+        self.dispatcher = dispatcher
+        self.message_service = message_service
+        self.message_id: Optional[int] = None
+        self.published_ids: Set[int] = set()
+        self.published_mask: Optional[np.ndarray] = None
+        self.detector = ChangeDetector()
+
+    @property
+    def chat_id(self) -> str:
+        return self.destination.chat_id
+
+
+class Publisher:
+    """
+    Publishes one presence state to every destination chat.
+
+    Each chat has its own dispatcher (rate limit, caption edit state) and
+    message, and all of them share the file_id cache and a bot-wide rate
+    limit. Captions are built once per language/format, and when several
+    chats need a new photo it is rendered and uploaded once, through the
+    first chat that succeeds; the other chats then send it by file_id,
+    concurrently. Each chat's ChangeDetector decides when a presence change
+    is worth a new photo; until then only the caption is edited.
+    """
+
+    def __init__(self, telegram_api: TelegramAPI, file_ids: FileIdCache, destinations: List[Destination],
+                 global_rate_per_second: float = TELEGRAM_GLOBAL_RATE_PER_SECOND):
+        """Initialize Publisher with a dispatcher and message service per destination."""
+        self.telegram = telegram_api
+        self.image_service = telegram_api.image_service
+        self.file_ids = file_ids
+        global_bucket = TokenBucket(global_rate_per_second * 60, max(1, int(global_rate_per_second)))
+        self.channels: List[Channel] = []
+        for destination in destinations:
+            dispatcher = TelegramDispatcher(telegram_api, file_ids, rate_per_minute=destination.rate_per_minute,
+                                            burst=destination.burst, chat_id=destination.chat_id,
+                                            global_bucket=global_bucket)
+            message_service = MessageService(dispatcher, language=destination.language,
+                                             caption_format=destination.caption_format)
+            self.channels.append(Channel(destination, dispatcher, message_service))
+
+    def restore(self, states: Dict[str, ChannelState]) -> None:
+        """Resume from the saved per-chat state."""
+        for channel in self.channels:
+            state = states.get(channel.chat_id)
+            if state is None:
+                continue
+            channel.message_id = state.message_id
+            channel.published_ids = set(state.published_members)
+            if state.message_id:
+                channel.dispatcher.restore(state.message_id, state.caption_digest,
+                                           state.caption_published_at, state.image_fingerprint)
+
+    def channel_states(self) -> Dict[str, ChannelState]:
+        """Current per-chat state, as StateManager persists it."""
+        return {
+            channel.chat_id: ChannelState(message_id=channel.message_id,
+                                          published_members=sorted(channel.published_ids),
+                                          **channel.dispatcher.published_state(channel.message_id))
+            for channel in self.channels
+        }
+
+    def on_layout_change(self, roster: Roster, members: Optional[List[KnessetMember]] = None) -> None:
+        """Rebuild the published masks (and album pages, given the member list) after the roster layout changed."""
+        if members is not None:
+            self.image_service.set_album_roster(members)
+        for channel in self.channels:
+            channel.published_mask = roster.mask_of(channel.published_ids)
+
+    def captions(self, roster: Roster, stale: bool = False) -> Dict[str, str]:
+        """Caption of every chat, built once per distinct language and format (stale: marked as last known)."""
+        by_style: Dict[tuple, str] = {}
+        captions = {}
+        for channel in self.channels:
+            style = (channel.destination.language, channel.destination.caption_format)
+            if style not in by_style:
+                by_style[style] = channel.message_service.get_faction_summary(roster, stale)
+            captions[channel.chat_id] = by_style[style]
+        return captions
+
+    def next_due(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until a deferred photo becomes due (None if no chat has one pending)."""
+        now = time.monotonic() if now is None else now
+        pending = [due for due in (channel.detector.due_in(now) for channel in self.channels) if due is not None]
+        return min(pending, default=None)
+
+    async def publish(self, roster: Roster, present_members: List[KnessetMember],
+                      captions: Optional[Dict[str, str]] = None, now: Optional[float] = None) -> None:
+        """
+        Bring every chat up to date: a new photo where presence changed, a caption edit elsewhere.
+
+        Args:
+            roster: Roster with the current presence
+            present_members: Present member records, for rendering
+            captions: Captions by chat (built from the roster if not given)
+            now: Monotonic time for the change detectors (replays pass their own clock)
+        """
+        captions = captions or self.captions(roster)
+        now = time.monotonic() if now is None else now
+        stale, current = [], []
+        for channel in self.channels:
+            published = channel.published_mask if channel.message_id else None
+            decision = channel.detector.observe(roster.present, published, now)
+            metrics.inc('publish_decisions_total', decision=decision.reason)
+            (stale if decision.publish else current).append(channel)
+            if decision.delta and not decision.publish:
+                logger.info("Deferring photo for %s: %s members differ (%s), updating caption only",
+                            channel.chat_id, decision.delta, decision.reason)
+
+        if stale:
+            logger.info("Change detected! Present members: %d, new photo for %d/%d chats",
+                        len(present_members), len(stale), len(self.channels))
+        else:
+            logger.info("No photo due, updating existing messages")
+        await asyncio.gather(
+            self._send_photos(stale, roster, present_members, captions),
+            *(self._update(channel, roster, present_members, captions[channel.chat_id]) for channel in current)
+        )
+
+    async def _send_photos(self, channels: List[Channel], roster: Roster,
+                           present_members: List[KnessetMember], captions: Dict[str, str]) -> None:
+        pending = list(channels)
+        if pending and any(self.file_ids.get(fingerprint) is None
+                           for fingerprint in self.image_service.photo_fingerprints(present_members)):
+            # Render and upload through one chat; the others reuse its file_ids
+            while pending:
+                if await self._send_photo(pending.pop(0), roster, present_members, captions):
+                    break
+        await asyncio.gather(*(self._send_photo(channel, roster, present_members, captions)
+                               for channel in pending))
+
+    async def _send_photo(self, channel: Channel, roster: Roster, present_members: List[KnessetMember],
+                          captions: Dict[str, str]) -> bool:
+        caption = captions[channel.chat_id]
+        message_id = await channel.dispatcher.send_photo(present_members, caption,
+                                                         channel.message_service.caption_content_key(caption))
+        if not message_id:
+            logger.error("Failed to send presence photo to %s", channel.chat_id)
+            return False
+        channel.message_id = message_id
+        channel.published_ids = roster.present_ids()
+        channel.published_mask = roster.present
+        logger.info("New message ID for %s: %s", channel.chat_id, message_id)
+        return True
+
+    async def _update(self, channel: Channel, roster: Roster, present_members: List[KnessetMember],
+                      caption: str) -> None:
+        message_id = await channel.message_service.update_or_resend(channel.message_id, present_members, caption)
+        if message_id and message_id != channel.message_id:
+            # The resent photo shows current presence, deferred changes included
+            channel.message_id = message_id
+            channel.published_ids = roster.present_ids()
+            channel.published_mask = roster.present
+            logger.info("Resent presence photo to %s, new message ID: %s", channel.chat_id, message_id)
+
+    async def publish_report(self, report: AttendanceReport, members: Dict[int, KnessetMember]) -> int:
+        """
+        Send an attendance report to every chat.
+
+        The faction chart is rendered and uploaded once, through the first chat
+        that succeeds; the other chats get it by file_id. Captions are built
+        once per language and format.
+
+        Args:
+            report: Rankings from AttendanceStats
+            members: Member records by MkId, for names
+
+        Returns:
+            int: Number of chats the report reached
+        """
+        rows = [ChartRow(faction, share, f"{share:.0%}", COALITION_COLOR if coalition else OPPOSITION_COLOR)
+                for faction, _, share, coalition in report.factions]
+        encoded = await self.image_service.encode_report_image(CHART_TITLES.get(report.days, CHART_TITLES[7]), rows)
+        if encoded is None:
+            return 0
+
+        by_style: Dict[tuple, str] = {}
+        captions = {}
+        for channel in self.channels:
+            style = (channel.destination.language, channel.destination.caption_format)
+            if style not in by_style:
+                by_style[style] = channel.message_service.get_attendance_report(report, members)
+            captions[channel.chat_id] = by_style[style]
+
+        pending = list(self.channels)
+        file_id = None
+        while pending and file_id is None:
+            channel = pending.pop(0)
+            file_id = await channel.dispatcher.send_report(captions[channel.chat_id], encoded=encoded)
+        if file_id is None:
+            logger.error("Failed to send attendance report")
+            return 0
+        results = await asyncio.gather(*(channel.dispatcher.send_report(captions[channel.chat_id], file_id=file_id)
+                                         for channel in pending))
+        sent = 1 + sum(1 for result in results if result)
+        logger.info("Sent %s-day attendance report to %s/%d chats", report.days, sent, len(self.channels))
+        return sent
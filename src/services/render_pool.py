@@ -0,0 +1,159 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from PIL import Image, ImageFont
+import time
+from utils.logger import logger, setup_worker_logger
+from utils.metrics import metrics
+from config import RENDER_POOL_KIND, RENDER_POOL_WORKERS
+from services.compositor import TileCompositor, TileEntry
+from services.image_encoder import EncodeResult, ImageEncoder
+
+
+# Per-process state of pool workers in 'process' mode. Photos are shipped as
+# paths of the pre-resized tiles in the photo cache and decoded once per
+# worker, so a render job only pickles a few strings per member. Every album
+# page (None: the single image) keeps its own compositor, so pages rendered
+# by the same worker don't invalidate each other's canvas.
+_worker_layout: Dict[str, Any] = {}
+_worker_font: Optional[ImageFont.FreeTypeFont] = None
+_worker_compositors: Dict[Optional[int], TileCompositor] = {}
+_worker_photos: Dict[str, Image.Image] = {}
+_WORKER_MAX_PHOTOS = 400
+
+
+def _init_worker(layout: Dict[str, Any]) -> None:
+    """Load the worker's font; compositors are created per page on first use."""
+    global _worker_layout, _worker_font
+    setup_worker_logger()
+    _worker_layout = dict(layout)
+    try:
+        _worker_font = ImageFont.truetype(_worker_layout.pop('font_path'), _worker_layout['font_size'])
+    except Exception:
+        _worker_font = ImageFont.load_default()
+
+
+def _get_worker_compositor(page: Optional[int]) -> TileCompositor:
+    compositor = _worker_compositors.get(page)
+    if compositor is None:
+        compositor = _worker_compositors[page] = TileCompositor(_worker_font, **_worker_layout)
+    return compositor
+
+
+def _load_worker_photo(path: str) -> Optional[Image.Image]:
+    photo = _worker_photos.get(path)
+    if photo is None:
+        try:
+            with Image.open(path) as tile:
+                tile.load()
+                photo = tile if tile.mode == 'RGBA' else tile.convert('RGBA')
+        except Exception:
+            return None
+        if len(_worker_photos) >= _WORKER_MAX_PHOTOS:
+            del _worker_photos[next(iter(_worker_photos))]
+        _worker_photos[path] = photo
+    return photo
+
+
+def _render_and_encode(compositor: TileCompositor, entries: List[TileEntry],
+                       encoder: ImageEncoder) -> Tuple[EncodeResult, float]:
+    """Render and encode a presence image; also returns the render duration."""
+    start = time.perf_counter()
+    image = compositor.render(entries)
+    render_seconds = time.perf_counter() - start
+    return encoder.encode(image), render_seconds
+
+
+def _render_encoded_in_worker(entries: List[TileEntry], encoder: ImageEncoder,
+                              page: Optional[int] = None) -> Tuple[EncodeResult, float]:
+    """Render and encode a presence image (album page) inside a worker process."""
+    resolved = [entry._replace(photo=_load_worker_photo(entry.photo) if entry.photo else None)
+                for entry in entries]
+    return _render_and_encode(_get_worker_compositor(page), resolved, encoder)
+
+
+class RenderPool:
+    """
+    Runs CPU-bound rendering and JPEG encoding off the event loop.
+
+    In 'thread' mode jobs share the caller's compositor and photo tiles
+    directly (Pillow releases the GIL for most of its work). In 'process' mode
+    each worker keeps its own compositor per album page and its own tile
+    cache, and render jobs carry tile file paths instead of pickled images.
+    """
+
+    def __init__(self, kind: str = RENDER_POOL_KIND, max_workers: int = RENDER_POOL_WORKERS,
+                 layout: Optional[Dict[str, Any]] = None):
+        """
+        Initialize RenderPool.
+
+        Args:
+            kind: 'thread' or 'process'
+            max_workers: Number of worker threads or processes
+            layout: Compositor parameters for process workers (font_path, font_size, ...)
+        """
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown render pool kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.layout = layout
+        self._executor: Optional[Executor] = None
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.kind == 'process'
+
+    def configure(self, layout: Dict[str, Any]) -> None:
+        """Set compositor parameters for process workers; must happen before the first job."""
+        self.layout = layout
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.uses_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     initializer=_init_worker,
+                                                     initargs=(self.layout,))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='render')
+            logger.info("Started %s render pool with %s workers", self.kind, self.max_workers)
+        return self._executor
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run a function in the pool (a thread pool is used for callables bound to local state)."""
+        loop = asyncio.get_running_loop()
+        if self.uses_processes:
+            return await loop.run_in_executor(None, partial(fn, *args))
+        return await loop.run_in_executor(self._get_executor(), partial(fn, *args))
+
+    async def render_encoded(self, compositor: TileCompositor, entries: List[TileEntry],
+                             encoder: ImageEncoder, page: Optional[int] = None) -> EncodeResult:
+        """
+        Render the presence grid and encode it within the encoder's budget, in the pool.
+
+        Args:
+            compositor: Compositor to use in 'thread' mode
+            entries: Sorted members; in 'process' mode photos are tile file paths
+            encoder: Encoder settings
+            page: Album page index, selecting the worker's compositor in 'process' mode
+
+        Returns:
+            EncodeResult: Encoded image and the chosen quality/scale
+        """
+        loop = asyncio.get_running_loop()
+        if self.uses_processes:
+            job = loop.run_in_executor(self._get_executor(), _render_encoded_in_worker, entries, encoder, page)
+        else:
+            job = loop.run_in_executor(self._get_executor(), _render_and_encode, compositor, entries, encoder)
+        # Timed in the worker, so queueing and pickling are not counted
+        result, render_seconds = await job
+        metrics.observe_stage('render', render_seconds)
+        metrics.observe_stage('encode', result.seconds)
+        return result
+
+    def close(self) -> None:
+        """Shut down the worker pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
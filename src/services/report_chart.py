@@ -0,0 +1,69 @@
+from typing import List, NamedTuple, Tuple
+from PIL import Image, ImageDraw, ImageFont
+from utils.text_utils import reverse_hebrew_text
+
+
+class ChartRow(NamedTuple):
+    """One bar of a ranking chart: label, bar length (0..1), value text and bar color."""
+    label: str
+    fraction: float
+    value: str
+    color: Tuple[int, int, int]
+
+
+class RankingChart:
+    """
+    Horizontal bar chart of a ranking, laid out right to left.
+
+    Labels (faction names, in Hebrew) are right-aligned at the right edge and
+    bars grow leftwards from them, with the value text at the end of each
+    bar. Holds no state between renders, so it is safe to run in the render
+    pool threads.
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont, width: int = 800, row_height: int = 40,
+                 spacing: int = 20, label_width: int = 260,
+                 background_color: Tuple[int, int, int] = (220, 240, 255)):
+        """Initialize RankingChart with layout parameters."""
+        self.font = font
+        self.width = width
+        self.row_height = row_height
+        self.spacing = spacing
+        self.label_width = label_width
+        self.background_color = background_color
+
+    def _text_width(self, text: str) -> int:
+        bbox = self.font.getbbox(text)
+        return bbox[2] - bbox[0]
+
+    def render(self, title: str, rows: List[ChartRow]) -> Image.Image:
+        """
+        Render the chart.
+
+        Args:
+            title: Heading above the bars
+            rows: Bars in display order (top first)
+
+        Returns:
+            Image.Image: RGB chart
+        """
+        header = self.row_height + self.spacing
+        height = header + len(rows) * self.row_height + 2 * self.spacing
+        image = Image.new('RGB', (self.width, height), self.background_color)
+        draw = ImageDraw.Draw(image)
+
+        title = reverse_hebrew_text(title)
+        draw.text(((self.width - self._text_width(title)) // 2, self.spacing), title, fill=(0, 0, 0), font=self.font)
+
+        bar_right = self.width - self.spacing - self.label_width
+        bar_span = bar_right - 2 * self.spacing - self._text_width('100%') - self.spacing
+        for i, row in enumerate(rows):
+            top = header + self.spacing + i * self.row_height
+            label = reverse_hebrew_text(row.label)
+            draw.text((self.width - self.spacing - self._text_width(label), top), label, fill=(0, 0, 0), font=self.font)
+
+            bar_left = bar_right - max(2, int(bar_span * min(1.0, max(0.0, row.fraction))))
+            draw.rectangle((bar_left, top + 4, bar_right, top + self.row_height - 8), fill=row.color)
+            draw.text((bar_left - self.spacing // 2 - self._text_width(row.value), top), row.value,
+                      fill=(0, 0, 0), font=self.font)
+        return image
@@ -0,0 +1,112 @@
+from utils.logger import logger
+from config import METRICS_ENABLED, SNAPSHOT_API_ENABLED, TELEGRAM_GLOBAL_RATE_PER_SECOND
+
+
+class ServiceGraph:
+    """
+    The bot's long-lived services, built once and shared.
+
+    One HTTP client, render pool, ImageService (font, photo cache,
+    compositor) and TelegramAPI serve every destination chat. The modules
+    behind them (PIL, numpy, httpx) are imported when the graph is entered
+    rather than when main is imported, so `main.py --replay` hands over to
+    the replay without loading them. Used as an async context manager,
+    which closes everything in reverse order.
+    """
+
+    def __init__(self, destinations=None, file_ids=None,
+                 global_rate_per_second: float = TELEGRAM_GLOBAL_RATE_PER_SECOND,
+                 persistent: bool = True, metrics_enabled: bool = METRICS_ENABLED,
+                 snapshot_api: bool = SNAPSHOT_API_ENABLED):
+        """
+        Initialize ServiceGraph.
+
+        Args:
+            destinations: Chats to publish to (default: load_destinations())
+            file_ids: FileIdCache to use (default: the bot's own)
+            global_rate_per_second: Bot-wide Telegram rate limit
+            persistent: Create the state manager, history store and attendance aggregates (off for replays)
+            metrics_enabled: Serve /metrics
+            snapshot_api: Serve the read-only snapshot API
+        """
+        self._destinations = destinations
+        self._file_ids = file_ids
+        self._global_rate_per_second = global_rate_per_second
+        self._persistent = persistent
+        self._metrics_enabled = metrics_enabled
+        self._snapshot_api = snapshot_api
+
+        self.http_client = None
+        self.render_pool = None
+        self.state_manager = None
+        self.history_store = None
+        self.attendance = None
+        self.metrics_server = None
+        self.knesset_api = None
+        self.image_service = None
+        self.telegram_api = None
+        self.publisher = None
+        self.snapshot_server = None
+
+    async def __aenter__(self) -> 'ServiceGraph':
+        from api.http_client import HttpClient
+        from api.knesset_api import KnessetAPI
+        from api.telegram_api import TelegramAPI
+        from services.image_service import ImageService
+        from services.publisher import Publisher
+        from services.render_pool import RenderPool
+        from utils.file_id_cache import FileIdCache
+        from models.destination import load_destinations
+
+        try:
+            if self._persistent:
+                from utils.history_store import HistoryStore
+                from utils.state_manager import StateManager
+                from services.attendance import AttendanceStats
+                self.state_manager = StateManager()
+                self.history_store = HistoryStore()
+                self.attendance = AttendanceStats()
+            if self._metrics_enabled:
+                from utils.metrics_server import MetricsServer
+                self.metrics_server = MetricsServer()
+                await self.metrics_server.start()
+
+            self.render_pool = RenderPool()
+            self.http_client = HttpClient()
+            self.knesset_api = KnessetAPI(self.http_client)
+            self.image_service = ImageService(self.http_client, self.render_pool)
+            self.telegram_api = TelegramAPI(self.http_client, self.image_service)
+            destinations = self._destinations if self._destinations is not None else load_destinations()
+            self.publisher = Publisher(self.telegram_api, self._file_ids or FileIdCache(), destinations,
+                                       self._global_rate_per_second)
+            if self._snapshot_api:
+                from services.snapshot_server import SnapshotServer
+                self.snapshot_server = SnapshotServer(self.image_service)
+                await self.snapshot_server.start()
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close whatever was opened, newest first."""
+        if self.snapshot_server is not None:
+            await self.snapshot_server.stop()
+        if self.publisher is not None:
+            self.publisher.file_ids.close()
+        if self.http_client is not None:
+            await self.http_client.close()
+        if self.render_pool is not None:
+            self.render_pool.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.attendance is not None:
+            self.attendance.close()
+        if self.history_store is not None:
+            self.history_store.close()
+        if self.state_manager is not None:
+            self.state_manager.close()
+        logger.info("Services closed")
@@ -0,0 +1,236 @@
+import asyncio
+import gzip
+import hashlib
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, NamedTuple, Optional
+import msgspec
+import numpy as np
+from utils.logger import logger
+from utils.metrics import metrics
+from utils.http_server import HttpServer, Request, Response
+from config import SNAPSHOT_API_HOST, SNAPSHOT_API_PORT, SNAPSHOT_LONG_POLL_MAX, SNAPSHOT_SSE_KEEPALIVE
+from services.image_service import ImageService
+from models.member import KnessetMember
+from models.roster import Roster
+
+JSON_TYPE = 'application/json; charset=utf-8'
+
+
+class Resource(NamedTuple):
+    """A precomputed response: body, gzip variant and the strong ETag of each."""
+    body: bytes
+    content_type: str
+    etag: str
+    gzipped: Optional[bytes] = None
+    gzip_etag: Optional[str] = None
+
+
+def make_resource(body: bytes, content_type: str, compress: bool = True) -> Resource:
+    """Hash and (unless `compress` is off or the body is tiny) gzip a body once."""
+    digest = hashlib.sha256(body).hexdigest()[:24]
+    if not compress or len(body) < 256:
+        return Resource(body, content_type, f'"{digest}"')
+    return Resource(body, content_type, f'"{digest}"', gzip.compress(body, 6, mtime=0), f'"{digest}-gz"')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers the given ETag (weak comparison, as RFC 9110 asks)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+
+class SnapshotServer:
+    """
+    Read-only local HTTP API over the bot's current presence snapshot.
+
+    GET /v1/presence   Members (Knesset API fields) with presence and coalition/opposition counts
+    GET /v1/factions   Present/total per faction
+    GET /v1/image      Presence image of the current snapshot
+    GET /v1/events     Server-sent events, one `presence` event per change
+
+    Bodies, their gzip variants and strong ETags are built once per change
+    in `update`, so a request is a dictionary lookup and a socket write and
+    unchanged clients get a 304. `?wait=N` with If-None-Match turns a JSON
+    request into a long poll that returns as soon as the snapshot changes.
+    The image is rendered (or taken from the encode cache) on the first
+    request after a change. Versions (and event ids) count up from the
+    startup time in milliseconds, so they stay unique and ordered across
+    restarts and a client's Last-Event-ID never matches an unrelated event.
+    """
+
+    def __init__(self, image_service: ImageService, host: str = SNAPSHOT_API_HOST, port: int = SNAPSHOT_API_PORT,
+                 long_poll_max: float = SNAPSHOT_LONG_POLL_MAX, keepalive: float = SNAPSHOT_SSE_KEEPALIVE):
+        """
+        Initialize SnapshotServer.
+
+        Args:
+            image_service: Renders the presence image
+            long_poll_max: Longest `wait` a long poll may ask for, in seconds
+            keepalive: Seconds between SSE keep-alive comments
+        """
+        self.image_service = image_service
+        self.long_poll_max = long_poll_max
+        self.keepalive = keepalive
+        self.http = HttpServer(host, port)
+        for method in ('GET', 'HEAD'):
+            self.http.route(method, '/v1/presence', self._presence)
+            self.http.route(method, '/v1/factions', self._factions)
+            self.http.route(method, '/v1/image', self._image)
+        self.http.route('GET', '/v1/events', self._events)
+
+        self.version = int(time.time() * 1000)
+        self._digest: Optional[bytes] = None
+        self._presence_resource: Optional[Resource] = None
+        self._factions_resource: Optional[Resource] = None
+        self._event: bytes = b''
+        self._present_members: List[KnessetMember] = []
+        self._image_resource: Optional[Resource] = None
+        self._image_version = 0
+        self._image_lock = asyncio.Lock()
+        self._changed = asyncio.Event()
+        self._closed = False
+        self._encoder = msgspec.json.Encoder()
+
+    @property
+    def url(self) -> str:
+        return self.http.url
+
+    async def start(self) -> None:
+        await self.http.start()
+
+    async def stop(self) -> None:
+        # Ends open event streams and long polls
+        self._closed = True
+        self._changed.set()
+        await self.http.stop()
+
+    def update(self, roster: Roster, members: List[KnessetMember], now: Optional[float] = None) -> bool:
+        """
+        Rebuild the responses from the current roster.
+
+        Args:
+            roster: Roster with the current presence
+            members: Decoded member list the roster was loaded from
+            now: Unix time of the snapshot, defaults to time.time()
+
+        Returns:
+            bool: True if the snapshot changed (a new version was published)
+        """
+        with metrics.time('snapshot_api'):
+            coalition_present, coalition_total, opposition_present, opposition_total = roster.coalition_stats()
+            faction_coalition = np.bincount(roster.faction_index, weights=roster.coalition,
+                                            minlength=len(roster.faction_names)).astype(bool).tolist()
+            presence = {
+                'present': roster.present_count,
+                'total': len(roster),
+                'coalition': {'present': coalition_present, 'total': coalition_total},
+                'opposition': {'present': opposition_present, 'total': opposition_total},
+                'members': members,
+            }
+            digest = hashlib.sha256(self._encoder.encode(presence)).digest()
+            if digest == self._digest:
+                return False
+            self._digest = digest
+
+            self.version += 1
+            updated_at = datetime.fromtimestamp(time.time() if now is None else now, timezone.utc).isoformat(
+                timespec='seconds')
+            header = {'version': self.version, 'updated_at': updated_at}
+            self._presence_resource = make_resource(self._encoder.encode({**header, **presence}), JSON_TYPE)
+            self._factions_resource = make_resource(self._encoder.encode({**header, 'factions': [
+                {'name': name, 'present': present, 'total': total, 'coalition': coalition}
+                for (name, present, total), coalition in zip(roster.faction_stats(), faction_coalition)
+            ]}), JSON_TYPE)
+            summary = self._encoder.encode({**header, 'present': roster.present_count,
+                                            'etag': self._presence_resource.etag.strip('"')})
+            self._event = b'event: presence\nid: %d\ndata: %s\n\n' % (self.version, summary)
+            self._present_members = [m for m in members if m.is_present]
+
+        # Wake long polls and event streams
+        self._changed.set()
+        self._changed = asyncio.Event()
+        return True
+
+    # Handlers
+
+    def _serve(self, request: Request, resource: Optional[Resource], endpoint: str) -> Response:
+        if resource is None:
+            metrics.inc('snapshot_requests_total', endpoint=endpoint, status=503)
+            return Response('No snapshot yet', status=503, headers={'Retry-After': '5'})
+
+        use_gzip = resource.gzipped is not None and 'gzip' in request.headers.get('accept-encoding', '')
+        etag = resource.gzip_etag if use_gzip else resource.etag
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding',
+                   'Access-Control-Allow-Origin': '*', 'Access-Control-Expose-Headers': 'ETag'}
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            metrics.inc('snapshot_requests_total', endpoint=endpoint, status=304)
+            return Response(status=304, headers=headers, content_type=resource.content_type)
+
+        if use_gzip:
+            headers['Content-Encoding'] = 'gzip'
+        metrics.inc('snapshot_requests_total', endpoint=endpoint, status=200)
+        return Response(resource.gzipped if use_gzip else resource.body, headers=headers,
+                        content_type=resource.content_type)
+
+    async def _long_poll(self, request: Request, current) -> None:
+        """Wait for a change if the client already has the current version and asked to wait."""
+        try:
+            wait = min(float(request.query_param('wait', '0')), self.long_poll_max)
+        except ValueError:
+            return
+        resource = current()
+        if wait <= 0 or resource is None or self._closed:
+            return
+        if not etag_matches(request.headers.get('if-none-match'), resource.etag) and not (
+                resource.gzip_etag and etag_matches(request.headers.get('if-none-match'), resource.gzip_etag)):
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _presence(self, request: Request) -> Response:
+        await self._long_poll(request, lambda: self._presence_resource)
+        return self._serve(request, self._presence_resource, 'presence')
+
+    async def _factions(self, request: Request) -> Response:
+        await self._long_poll(request, lambda: self._factions_resource)
+        return self._serve(request, self._factions_resource, 'factions')
+
+    async def _current_image(self) -> Optional[Resource]:
+        async with self._image_lock:
+            if self._image_version != self.version and self._presence_resource is not None:
+                version = self.version
+                encoded = await self.image_service.encode_presence_image(self._present_members)
+                if encoded is not None:
+                    self._image_resource = make_resource(encoded.data, encoded.mime_type, compress=False)
+                    self._image_version = version
+            # On failure the previous image is better than none
+            return self._image_resource
+
+    async def _image(self, request: Request) -> Response:
+        return self._serve(request, await self._current_image(), 'image')
+
+    async def _events(self, request: Request) -> Response:
+        metrics.inc('snapshot_requests_total', endpoint='events', status=200)
+        last_event_id = request.headers.get('last-event-id')
+        return Response(stream=self._event_stream(last_event_id), content_type='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'})
+
+    async def _event_stream(self, last_event_id: Optional[str]) -> AsyncIterator[bytes]:
+        sent = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+        yield b'retry: 5000\n\n'
+        while not self._closed:
+            if self.version != sent and self._event:
+                # Clients that fell behind get the latest state only
+                sent = self.version
+                yield self._event
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), self.keepalive)
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+        logger.debug("Event stream closed")
@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import time
+from enum import Enum
+from typing import Any, Dict, List, Optional
+from utils.logger import logger
+from utils.metrics import metrics
+from config import (TELEGRAM_RATE_PER_MINUTE, TELEGRAM_RATE_BURST, TELEGRAM_MAX_RETRIES,
+                    CAPTION_REFRESH_INTERVAL, CHANNEL_ID)
+from api.telegram_api import TelegramAPI
+from utils.file_id_cache import FileIdCache
+from services.image_encoder import EncodeResult
+from models.member import KnessetMember
+
+
+class EditResult(Enum):
+    UPDATED = 'updated'
+    UNCHANGED = 'unchanged'
+    RETRY_LATER = 'retry_later'
+    FAILED = 'failed'
+
+
+class TokenBucket:
+    """Async token bucket that can also be paused by a server-side retry_after."""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Block all sends for the given number of seconds."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        """Wait until a send is allowed."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class TelegramDispatcher:
+    """
+    Rate-limited outbound queue in front of TelegramAPI.
+
+    Pending caption edits for a message are coalesced, so only the latest
+    caption is sent. Edits are dropped when the caption is already published,
+    or when only the timestamp changed and the last edit is more recent than
+    CAPTION_REFRESH_INTERVAL. A 429 pauses the whole queue for retry_after
+    seconds, and "message is not modified" counts as success, so only real
+    failures make the caller upload a new photo.
+
+    Each dispatcher serves one chat; dispatchers of several chats can share
+    a `global_bucket` that enforces the bot-wide limit on top of their own.
+    """
+
+    def __init__(self, telegram_api: TelegramAPI, file_ids: FileIdCache, rate_per_minute: float = TELEGRAM_RATE_PER_MINUTE,
+                 burst: int = TELEGRAM_RATE_BURST, max_retries: int = TELEGRAM_MAX_RETRIES,
+                 caption_refresh_interval: float = CAPTION_REFRESH_INTERVAL, chat_id: str = CHANNEL_ID,
+                 global_bucket: Optional[TokenBucket] = None):
+        """Initialize TelegramDispatcher with the TelegramAPI it sends through."""
+        self.telegram = telegram_api
+        self.file_ids = file_ids
+        self.chat_id = chat_id
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.global_bucket = global_bucket
+        self.max_retries = max_retries
+        self.caption_refresh_interval = caption_refresh_interval
+
+        self._published: Dict[int, str] = {}
+        self._published_keys: Dict[int, str] = {}
+        self._published_at: Dict[int, float] = {}
+        self._published_on: Dict[int, float] = {}
+        self._fingerprints: Dict[int, str] = {}
+        self._pending: Dict[int, tuple] = {}
+        self._edit_tasks: Dict[int, asyncio.Task] = {}
+
+    async def _send(self, method: str, call, *args, acquired: bool = False, **kwargs) -> Dict[str, Any]:
+        """Send through the rate limiter, retrying after 429 responses."""
+        result: Dict[str, Any] = {}
+        for attempt in range(self.max_retries + 1):
+            if attempt or not acquired:
+                await self.bucket.acquire()
+            if self.global_bucket is not None:
+                await self.global_bucket.acquire()
+            result = await call(*args, chat_id=self.chat_id, **kwargs)
+            retry_after = self.telegram.retry_after(result)
+            if retry_after is None:
+                return result
+            if attempt == self.max_retries:
+                logger.warning("Telegram rate limit on %s, giving up after %s attempts", method, attempt + 1)
+                break
+            metrics.inc('telegram_retries_total', method=method)
+            logger.warning("Telegram rate limit on %s, retrying in %.0fs (%d/%d)",
+                           method, retry_after, attempt + 1, self.max_retries + 1)
+            self.bucket.pause(retry_after)
+        return result
+
+    @staticmethod
+    def caption_digest(text: str) -> str:
+        """Digest under which a published caption (or its content key) is remembered."""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _remember(self, message_id: int, caption: str, content_key: Optional[str]) -> None:
+        self._published[message_id] = caption
+        self._published_keys[message_id] = self.caption_digest(content_key if content_key is not None else caption)
+        self._published_at[message_id] = time.monotonic()
+        self._published_on[message_id] = time.time()
+
+    def published_state(self, message_id: Optional[int]) -> Dict[str, Any]:
+        """What is known about a published message, in the form StateManager persists."""
+        return {
+            'caption_digest': self._published_keys.get(message_id),
+            'caption_published_at': self._published_on.get(message_id),
+            'image_fingerprint': self._fingerprints.get(message_id)
+        }
+
+    def restore(self, message_id: int, caption_digest: Optional[str], caption_published_at: Optional[float],
+                image_fingerprint: Optional[str]) -> None:
+        """Reload what was published before a restart, so unchanged captions are not re-sent."""
+        if caption_digest and caption_published_at:
+            self._published_keys[message_id] = caption_digest
+            self._published_on[message_id] = caption_published_at
+            self._published_at[message_id] = time.monotonic() - max(0.0, time.time() - caption_published_at)
+        if image_fingerprint:
+            self._fingerprints[message_id] = image_fingerprint
+
+    def image_fingerprint(self, message_id: Optional[int]) -> Optional[str]:
+        """Fingerprint of the image in a published message, if known."""
+        return self._fingerprints.get(message_id)
+
+    def _is_redundant(self, message_id: int, caption: str, content_key: Optional[str]) -> bool:
+        """Whether an edit would not change anything worth publishing."""
+        if self._published.get(message_id) == caption:
+            return True
+        if content_key is None or self._published_keys.get(message_id) != self.caption_digest(content_key):
+            return False
+        age = time.monotonic() - self._published_at.get(message_id, 0)
+        return age < self.caption_refresh_interval
+
+    async def send_photo(self, present_members: List[KnessetMember], caption: str,
+                         content_key: Optional[str] = None) -> Optional[int]:
+        """
+        Send a new presence photo, reusing an earlier upload of the same image.
+
+        Returns:
+            Optional[int]: Message ID of the new message or None on failure
+        """
+        image_service = self.telegram.image_service
+        pages = image_service.album_pages(present_members)
+        if len(pages) > 1:
+            return await self._send_album(pages, caption, content_key)
+        fingerprint = image_service.presence_fingerprint(present_members)
+
+        file_id = self.file_ids.get(fingerprint)
+        if file_id:
+            result = await self._send('sendPhoto', self.telegram.send_cached_photo, file_id, caption)
+            if result.get('ok'):
+                logger.info("Sent presence photo by cached file_id")
+                return self._sent(result, caption, content_key, fingerprint)
+            if result.get('error_code') == 400:
+                self.file_ids.discard(fingerprint)
+
+        encoded = await image_service.encode_presence_image(present_members)
+        if encoded is None:
+            logger.error("Failed to create presence image")
+            return None
+
+        result = await self._send('sendPhoto', self.telegram.upload_photo, encoded, caption)
+        if not result.get('ok'):
+            return None
+
+        # Rendering may have downloaded photos, which changes their versions
+        fingerprint = image_service.presence_fingerprint(present_members)
+        file_id = self.telegram.photo_file_id(result)
+        if file_id:
+            self.file_ids.put(fingerprint, file_id)
+        return self._sent(result, caption, content_key, fingerprint)
+
+    async def _send_album(self, pages: List[List[KnessetMember]], caption: str,
+                          content_key: Optional[str]) -> Optional[int]:
+        """
+        Send album pages as one media group, uploading only pages without a cached file_id.
+
+        Returns:
+            Optional[int]: Message ID of the album's first (captioned) message or None on failure
+        """
+        image_service = self.telegram.image_service
+        result: Dict[str, Any] = {}
+        for attempt in range(2):
+            fingerprints = [image_service.presence_fingerprint(page) for page in pages]
+            photos = [self.file_ids.get(fingerprint) for fingerprint in fingerprints]
+            missing = [index for index, file_id in enumerate(photos) if not file_id]
+            encoded = await image_service.encode_album([(index, pages[index]) for index in missing])
+            if any(page is None for page in encoded):
+                logger.error("Failed to create album pages")
+                return None
+            for index, page in zip(missing, encoded):
+                photos[index] = page
+
+            logger.info("Sending album of %d pages, %d uploaded", len(pages), len(missing))
+            result = await self._send('sendMediaGroup', self.telegram.send_media_group, photos, caption)
+            if result.get('ok'):
+                break
+            if result.get('error_code') != 400 or len(missing) == len(pages):
+                return None
+            # A cached file_id was rejected: upload every page once more
+            for fingerprint in fingerprints:
+                self.file_ids.discard(fingerprint)
+        else:
+            return None
+
+        # Rendering may have downloaded photos, which changes their versions
+        fingerprints = [image_service.presence_fingerprint(page) for page in pages]
+        for fingerprint, file_id in zip(fingerprints, self.telegram.media_group_file_ids(result)):
+            if file_id:
+                self.file_ids.put(fingerprint, file_id)
+        album_fingerprint = hashlib.sha256('|'.join(fingerprints).encode('utf-8')).hexdigest()
+        return self._sent({'result': result['result'][0]}, caption, content_key, album_fingerprint)
+
+    async def send_report(self, caption: str, encoded: Optional[EncodeResult] = None,
+                          file_id: Optional[str] = None) -> Optional[str]:
+        """
+        Send a report photo: upload `encoded`, or resend an already uploaded `file_id`.
+
+        Reports are standalone messages; the presence message is not affected.
+
+        Returns:
+            Optional[str]: file_id of the sent photo, None on failure
+        """
+        if file_id:
+            result = await self._send('sendPhoto', self.telegram.send_cached_photo, file_id, caption)
+        else:
+            result = await self._send('sendPhoto', self.telegram.upload_photo, encoded, caption)
+        return self.telegram.photo_file_id(result) if result.get('ok') else None
+
+    def _sent(self, result: Dict[str, Any], caption: str, content_key: Optional[str], fingerprint: str) -> int:
+        message_id = result['result']['message_id']
+        self._forget_others(message_id)
+        self._remember(message_id, caption, content_key)
+        self._fingerprints[message_id] = fingerprint
+        return message_id
+
+    def _forget_others(self, message_id: int) -> None:
+        """Drop what is known about earlier messages; a new photo replaces them as the chat's message."""
+        for known in (self._published, self._published_keys, self._published_at, self._published_on,
+                      self._fingerprints):
+            for old_id in [old_id for old_id in known if old_id != message_id]:
+                del known[old_id]
+        # Edits still running for an old message finish on their own
+        for old_id in [old_id for old_id, task in self._edit_tasks.items() if old_id != message_id and task.done()]:
+            del self._edit_tasks[old_id]
+
+    async def edit_caption(self, message_id: int, caption: str,
+                           content_key: Optional[str] = None) -> EditResult:
+        """
+        Queue a caption edit; concurrent edits of one message collapse into the latest.
+
+        Args:
+            message_id: Message to edit
+            caption: New caption
+            content_key: Caption without volatile parts (the timestamp); edits that
+                only change those are sent at most every CAPTION_REFRESH_INTERVAL
+
+        Returns:
+            EditResult: Outcome of the edit that carried this caption
+        """
+        if self._is_redundant(message_id, caption, content_key):
+            return EditResult.UNCHANGED
+
+        self._pending[message_id] = (caption, content_key)
+        task = self._edit_tasks.get(message_id)
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._flush_edits(message_id))
+            self._edit_tasks[message_id] = task
+        return await asyncio.shield(task)
+
+    async def _flush_edits(self, message_id: int) -> EditResult:
+        outcome = EditResult.UNCHANGED
+        while message_id in self._pending:
+            await self.bucket.acquire()
+            # Take the newest caption only after waiting, so queued edits coalesce
+            caption, content_key = self._pending.pop(message_id)
+            if self._published.get(message_id) == caption:
+                # Nothing was sent, so the token is not spent
+                self.bucket.tokens = min(self.bucket.capacity, self.bucket.tokens + 1)
+                continue
+
+            result = await self._send('editMessageCaption', self.telegram.edit_caption,
+                                      message_id, caption, acquired=True)
+            if result.get('ok') or self.telegram.is_not_modified(result):
+                self._remember(message_id, caption, content_key)
+                outcome = EditResult.UPDATED
+            elif result.get('error_code') in (400, 403):
+                outcome = EditResult.FAILED
+            else:
+                outcome = EditResult.RETRY_LATER
+        return outcome
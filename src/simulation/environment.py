@@ -0,0 +1,31 @@
+import os
+import socket
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def free_port() -> int:
+    """A TCP port on localhost that is free right now."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def configure_environment(port: int, workdir: Path, extra: Optional[Dict[str, str]] = None) -> None:
+    """
+    Point the bot at a StubServer on `port` and keep its files in `workdir`.
+
+    config reads the environment at import time, so this must run before
+    any bot module is imported.
+    """
+    os.environ.update({
+        'KNESSET_API_URL': f"http://127.0.0.1:{port}/knesset",
+        'TELEGRAM_API_BASE': f"http://127.0.0.1:{port}",
+        'TELEGRAM_TOKEN': 'stub',
+        'CHANNEL_ID': '@stub',
+        'CACHE_DIR': str(workdir / "image_cache"),
+        'HTTP2_ENABLED': 'false',
+        **(extra or {}),
+    })
+    # The logger writes knesset_bot.log to the working directory
+    os.chdir(workdir)
@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import io
+import json
+import random
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Union
+from PIL import Image, ImageDraw
+from utils.http_server import HttpServer, Request, Response
+from simulation.synthetic import SessionSimulator, make_roster
+
+
+class StubServer:
+    """
+    Offline stand-in for the Knesset lobby API, the photo host and the Telegram Bot API.
+
+    Everything is served by one local HttpServer:
+      GET  /knesset              presence payload with ETag / 304 support
+      GET  /photos/<MkId>.jpg    generated member photo with ETag
+      POST /bot<token>/<method>  sendPhoto, sendMediaGroup, editMessageCaption (other methods return ok)
+
+    Latency can be injected per service and every `rate_limit_every`-th Telegram
+    call is answered with a 429 carrying `retry_after`. Request and byte counts
+    are kept in `stats`.
+    """
+
+    PHOTO_VARIANTS = 64
+
+    def __init__(self, size: int = 120, seed: int = 0, knesset_latency: float = 0.0,
+                 photo_latency: float = 0.0, telegram_latency: float = 0.0,
+                 rate_limit_every: int = 0, retry_after: float = 1.0,
+                 host: str = '127.0.0.1', port: int = 0):
+        """
+        Initialize StubServer.
+
+        Args:
+            size: Number of synthetic members in the payload
+            knesset_latency / photo_latency / telegram_latency: Seconds added to every response
+            rate_limit_every: Answer every N-th Telegram call with a 429 (0 disables)
+            retry_after: retry_after sent with injected 429s
+        """
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self.knesset_latency = knesset_latency
+        self.photo_latency = photo_latency
+        self.telegram_latency = telegram_latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+
+        self.http = HttpServer(host, port)
+        self.http.route('GET', '/knesset', self._knesset)
+        self.http.route('GET', '/photos/', self._photo, prefix=True)
+        self.http.route('POST', '/bot', self._telegram, prefix=True)
+
+        self.stats: Counter = Counter()
+        self.members: List[Dict[str, Any]] = []
+        self.session: Optional[SessionSimulator] = None
+        self._payload = b''
+        self._etag = ''
+        self._photos: Dict[int, bytes] = {}
+
+        self._telegram_calls = 0
+        self._next_message_id = 1
+        self._next_file_id = 1
+        self._captions: Dict[int, str] = {}
+        self._file_ids: set = set()
+        self.set_size(size)
+
+    @property
+    def url(self) -> str:
+        return self.http.url
+
+    @property
+    def knesset_url(self) -> str:
+        return f"{self.url}/knesset"
+
+    @property
+    def payload(self) -> bytes:
+        """Current Knesset payload as served."""
+        return self._payload
+
+    async def start(self) -> None:
+        await self.http.start()
+        # Photo URLs embed the host, which is only known once the port is bound
+        self.set_size(len(self.members))
+
+    async def stop(self) -> None:
+        await self.http.stop()
+
+    # Knesset payload
+
+    def set_size(self, size: int) -> None:
+        """Replace the roster with `size` synthetic members."""
+        self.members = make_roster(size, self.url, seed=self.seed)
+        self.session = None
+        self.publish()
+
+    def start_session(self, steps: int, **kwargs) -> SessionSimulator:
+        """Drive presence through a simulated session of `steps` polls."""
+        self.session = SessionSimulator(self.members, steps, seed=self.seed, **kwargs)
+        self.publish()
+        return self.session
+
+    def step(self, changes: Optional[int] = None) -> None:
+        """Advance the session (or flip `changes` random members if none is running)."""
+        if self.session is not None:
+            self.session.step(changes)
+        else:
+            for member in self._rng.sample(self.members, min(changes or 1, len(self.members))):
+                member['IsPresent'] = not member['IsPresent']
+        self.publish()
+
+    def set_members(self, members: List[Dict[str, Any]]) -> None:
+        """Serve the given member list (e.g. a recorded snapshot) from now on."""
+        self.members = members
+        self.session = None
+        self.publish()
+
+    def publish(self) -> None:
+        """Re-serialize the payload after the member list was changed in place."""
+        self._payload = json.dumps({'mks': self.members}, ensure_ascii=False).encode('utf-8')
+        self._etag = f'"{hashlib.sha256(self._payload).hexdigest()[:16]}"'
+
+    async def _knesset(self, request: Request) -> Response:
+        self.stats['knesset_requests'] += 1
+        if self.knesset_latency:
+            await asyncio.sleep(self.knesset_latency)
+        if request.headers.get('if-none-match') == self._etag:
+            self.stats['knesset_not_modified'] += 1
+            return Response(status=304, headers={'ETag': self._etag})
+        self.stats['knesset_bytes'] += len(self._payload)
+        return Response(self._payload, headers={'ETag': self._etag},
+                        content_type='application/json; charset=utf-8')
+
+    # Photos
+
+    def _photo_bytes(self, mk_id: int) -> bytes:
+        """Portrait-sized JPEG; a fixed set of variants keeps large rosters cheap to serve."""
+        variant = mk_id % self.PHOTO_VARIANTS
+        data = self._photos.get(variant)
+        if data is None:
+            image = Image.new('RGB', (300, 400), (40 + variant * 3, 90, 200 - variant * 2))
+            draw = ImageDraw.Draw(image)
+            draw.ellipse((75, 60, 225, 230), fill=(230, 200, 170))
+            draw.rectangle((40, 250, 260, 400), fill=(30, 30, 60 + variant))
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=85)
+            data = self._photos[variant] = buffer.getvalue()
+        return data
+
+    async def _photo(self, request: Request) -> Response:
+        self.stats['photo_requests'] += 1
+        if self.photo_latency:
+            await asyncio.sleep(self.photo_latency)
+        match = re.fullmatch(r'/photos/(\d+)\.jpg', request.path)
+        if not match:
+            return Response('Not Found', status=404)
+        data = self._photo_bytes(int(match.group(1)))
+        etag = f'"{int(match.group(1)) % self.PHOTO_VARIANTS}"'
+        if request.headers.get('if-none-match') == etag:
+            self.stats['photo_not_modified'] += 1
+            return Response(status=304, headers={'ETag': etag})
+        self.stats['photo_bytes'] += len(data)
+        return Response(data, headers={'ETag': etag}, content_type='image/jpeg')
+
+    # Telegram
+
+    @staticmethod
+    def _json(payload: Dict[str, Any], status: int = 200) -> Response:
+        return Response(json.dumps(payload, ensure_ascii=False), status=status,
+                        content_type='application/json')
+
+    @staticmethod
+    def _multipart_fields(request: Request) -> Dict[str, Union[bytes, str]]:
+        """Decode a multipart/form-data body; file parts stay bytes, other fields become text."""
+        boundary = request.headers.get('content-type', '').partition('boundary=')[2].strip('"')
+        fields = {}
+        for part in request.body.split(b'--' + boundary.encode('latin-1')):
+            head, _, value = part.partition(b'\r\n\r\n')
+            name = re.search(rb'name="([^"]+)"', head)
+            if name:
+                value = value[:-2] if value.endswith(b'\r\n') else value
+                fields[name.group(1).decode()] = value if b'filename=' in head else value.decode('utf-8')
+        return fields
+
+    def _form(self, request: Request) -> Dict[str, Any]:
+        if request.headers.get('content-type', '').startswith('multipart/form-data'):
+            return self._multipart_fields(request)
+        return request.form()
+
+    def _new_file_id(self) -> str:
+        file_id = f"stub-file-{self._next_file_id}"
+        self._next_file_id += 1
+        self._file_ids.add(file_id)
+        return file_id
+
+    async def _telegram(self, request: Request) -> Response:
+        method = request.path.rsplit('/', 1)[-1]
+        self.stats[f'telegram_{method}'] += 1
+        self.stats['telegram_bytes_in'] += len(request.body)
+        if self.telegram_latency:
+            await asyncio.sleep(self.telegram_latency)
+
+        self._telegram_calls += 1
+        if self.rate_limit_every and self._telegram_calls % self.rate_limit_every == 0:
+            self.stats['telegram_429'] += 1
+            return self._json({'ok': False, 'error_code': 429,
+                               'description': f'Too Many Requests: retry after {self.retry_after}',
+                               'parameters': {'retry_after': self.retry_after}}, status=429)
+
+        form = self._form(request)
+        if method == 'sendPhoto':
+            return self._send_photo(form)
+        if method == 'sendMediaGroup':
+            return self._send_media_group(form)
+        if method == 'editMessageCaption':
+            return self._edit_caption(form)
+        return self._json({'ok': True, 'result': True})
+
+    def _photo_file_id(self, photo: Any) -> Optional[str]:
+        """file_id of an uploaded photo (new) or of a known file_id; None if neither."""
+        if isinstance(photo, bytes):
+            self.stats['telegram_uploads'] += 1
+            return self._new_file_id()
+        return photo if photo in self._file_ids else None
+
+    def _message(self, file_id: str, caption: str) -> Dict[str, Any]:
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        self._captions[message_id] = caption
+        return {
+            'message_id': message_id,
+            'photo': [{'file_id': f"{file_id}-thumb", 'width': 90, 'height': 90},
+                      {'file_id': file_id, 'width': 800, 'height': 800}],
+            'caption': caption
+        }
+
+    def _bad_file_id(self) -> Response:
+        return self._json({'ok': False, 'error_code': 400,
+                           'description': 'Bad Request: wrong file identifier/HTTP URL specified'}, status=400)
+
+    def _send_photo(self, form: Dict[str, Any]) -> Response:
+        file_id = self._photo_file_id(form.get('photo'))
+        if file_id is None:
+            return self._bad_file_id()
+        return self._json({'ok': True, 'result': self._message(file_id, form.get('caption', ''))})
+
+    def _send_media_group(self, form: Dict[str, Any]) -> Response:
+        media = json.loads(form.get('media') or '[]')
+        if not 2 <= len(media) <= 10:
+            return self._json({'ok': False, 'error_code': 400,
+                               'description': 'Bad Request: too few or too many media in the group'}, status=400)
+        file_ids = []
+        for item in media:
+            reference = item.get('media', '')
+            photo = form.get(reference[len('attach://'):]) if reference.startswith('attach://') else reference
+            file_id = self._photo_file_id(photo)
+            if file_id is None:
+                return self._bad_file_id()
+            file_ids.append(file_id)
+        return self._json({'ok': True, 'result': [self._message(file_id, item.get('caption', ''))
+                                                  for file_id, item in zip(file_ids, media)]})
+
+    def _edit_caption(self, form: Dict[str, Any]) -> Response:
+        message_id = int(form.get('message_id', 0))
+        if message_id not in self._captions:
+            return self._json({'ok': False, 'error_code': 400,
+                               'description': 'Bad Request: message to edit not found'}, status=400)
+        if self._captions[message_id] == form.get('caption', ''):
+            return self._json({'ok': False, 'error_code': 400,
+                               'description': 'Bad Request: message is not modified'}, status=400)
+        self._captions[message_id] = form.get('caption', '')
+        return self._json({'ok': True, 'result': {'message_id': message_id}})
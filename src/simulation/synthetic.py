@@ -0,0 +1,104 @@
+import random
+from typing import Any, Dict, List, Optional
+
+FACTIONS = [
+    ('הליכוד', True), ('ש"ס', True), ('יהדות התורה', True), ('הציונות הדתית', True),
+    ('עוצמה יהודית', True), ('נעם', True), ('יש עתיד', False), ('המחנה הממלכתי', False),
+    ('ישראל ביתנו', False), ('רע"מ', False), ('חד"ש-תע"ל', False), ('העבודה', False)
+]
+
+FIRST_NAMES = ['אבי', 'יעל', 'משה', 'מירב', 'דוד', 'שרה', 'יוסי', 'נעמה', 'איתן', 'רחל',
+               'עומר', 'תמר', 'אליהו', 'גלית', 'יצחק', 'אורית', 'בועז', 'מיכל', 'חיים', 'קארין']
+
+LAST_NAMES = ['כהן', 'לוי', 'מזרחי', 'פרץ', 'ביטון', 'דהן', 'אברהם', 'פרידמן', 'אזולאי', 'מלכה',
+              'גבאי', 'חדד', 'קליין', 'שפירא', 'רוזנברג', 'בן דוד', 'עמר', 'יוסף', 'סויסה', 'טל']
+
+
+def make_roster(size: int, photo_base_url: str, seed: int = 0,
+                present_ratio: float = 0.5) -> List[Dict[str, Any]]:
+    """
+    Generate a synthetic member list shaped like the Knesset lobby payload.
+
+    Args:
+        size: Number of members
+        photo_base_url: Base URL serving /photos/<MkId>.jpg
+        seed: Random seed, so runs are reproducible
+        present_ratio: Share of members initially present
+    """
+    rng = random.Random(seed)
+    members = []
+    for i in range(size):
+        faction, is_coalition = FACTIONS[i % len(FACTIONS)]
+        mk_id = 1000 + i
+        members.append({
+            'MkId': mk_id,
+            'Firstname': rng.choice(FIRST_NAMES),
+            'Lastname': f"{rng.choice(LAST_NAMES)} {i}" if size > len(LAST_NAMES) else rng.choice(LAST_NAMES),
+            'FactionName': faction,
+            'IsCoalition': is_coalition,
+            'IsPresent': rng.random() < present_ratio,
+            'ImagePath': f"{photo_base_url}/photos/{mk_id}.jpg"
+        })
+    return members
+
+
+class SessionSimulator:
+    """
+    Drives presence through a synthetic plenary session.
+
+    Presence ramps up at the opening, flaps by a few members at a time
+    during the session (bursts model votes) and drains at the end.
+    """
+
+    def __init__(self, members: List[Dict[str, Any]], steps: int, seed: int = 0,
+                 flap_size: int = 2, vote_every: int = 30):
+        """
+        Initialize SessionSimulator.
+
+        Args:
+            members: Member dicts to mutate in place
+            steps: Total number of steps in the session
+            flap_size: Typical number of members changing per step
+            vote_every: Steps between vote bursts
+        """
+        self.members = members
+        self.steps = steps
+        self.rng = random.Random(seed)
+        self.flap_size = flap_size
+        self.vote_every = vote_every
+        self.position = 0
+        for member in self.members:
+            member['IsPresent'] = False
+
+    def _target_ratio(self) -> float:
+        progress = self.position / max(1, self.steps)
+        if progress < 0.1:
+            return 0.6 * progress / 0.1
+        if progress > 0.9:
+            return 0.6 * (1 - progress) / 0.1
+        return 0.6
+
+    def step(self, changes: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Advance one step and return the member list."""
+        self.position += 1
+        if changes is None:
+            changes = self.rng.randint(0, self.flap_size)
+            if self.vote_every and self.position % self.vote_every == 0:
+                changes += len(self.members) // 10
+
+        present = sum(m['IsPresent'] for m in self.members)
+        target = int(self._target_ratio() * len(self.members))
+        for _ in range(changes):
+            joining = present < target if self.rng.random() < 0.8 else present >= target
+            candidates = [m for m in self.members if m['IsPresent'] != joining]
+            if not candidates:
+                continue
+            self.rng.choice(candidates)['IsPresent'] = joining
+            present += 1 if joining else -1
+        return self.members
+
+    def flip(self, count: int = 1) -> List[Dict[str, Any]]:
+        """Toggle the presence of `count` random members."""
+        for member in self.rng.sample(self.members, min(count, len(self.members))):
+            member['IsPresent'] = not member['IsPresent']
+        return self.members
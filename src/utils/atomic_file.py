@@ -0,0 +1,36 @@
+import os
+from pathlib import Path
+from typing import Union
+
+
+def atomic_write(path: Path, data: Union[bytes, str]) -> None:
+    """
+    Replace a file so readers see either the old or the new content, never a mix.
+
+    Data goes to a temporary file in the same directory, is fsynced and then
+    renamed over the target; the directory is fsynced so the rename survives
+    a power loss as well.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    try:
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+    except OSError:
+        return  # Directories can't be opened on Windows
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
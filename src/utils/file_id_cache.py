@@ -0,0 +1,83 @@
+import json
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+from config import FILE_ID_CACHE_FILE, FILE_ID_CACHE_SIZE
+from utils.atomic_file import atomic_write
+from utils.logger import logger
+
+
+class FileIdCache:
+    """
+    Persistent map from a rendered image fingerprint to the Telegram file_id
+    of its previous upload, so repeated presence states are sent by file_id.
+
+    Changes are only marked; `save` writes them in one batch on a background
+    thread, so the send path never waits on the disk.
+    """
+
+    def __init__(self, path: Path = FILE_ID_CACHE_FILE, max_items: int = FILE_ID_CACHE_SIZE):
+        """Initialize FileIdCache and load saved entries."""
+        self.path = path
+        self.max_items = max_items
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._dirty = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='file_ids')
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            if self.path.exists():
+                with open(self.path, 'r') as f:
+                    self._entries = OrderedDict(json.load(f))
+        except Exception as e:
+            logger.error("Error loading file_id cache: %s", e)
+
+    def _write(self, data: str) -> bool:
+        try:
+            atomic_write(self.path, data)
+            return True
+        except Exception as e:
+            logger.error("Error saving file_id cache: %s", e)
+            return False
+
+    def save(self) -> Optional[Future]:
+        """
+        Persist the entries in the background if they changed.
+
+        Returns:
+            Optional[Future]: Future of the write, or None if nothing changed
+        """
+        if not self._dirty:
+            return None
+        self._dirty = False
+        # Serialized here, since entries keep changing on the event loop
+        return self._executor.submit(self._write, json.dumps(self._entries))
+
+    def close(self) -> None:
+        """Write pending changes and wait for them."""
+        self.save()
+        self._executor.shutdown(wait=True)
+
+    def get(self, fingerprint: str) -> Optional[str]:
+        """Return the file_id uploaded for a fingerprint, if any."""
+        file_id = self._entries.get(fingerprint)
+        if file_id is not None:
+            self._entries.move_to_end(fingerprint)
+        return file_id
+
+    def put(self, fingerprint: str, file_id: str) -> None:
+        """Remember the file_id of an upload, evicting the least recently used entries."""
+        if self._entries.get(fingerprint) == file_id:
+            return
+        self._entries[fingerprint] = file_id
+        self._entries.move_to_end(fingerprint)
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def discard(self, fingerprint: str) -> None:
+        """Forget a fingerprint whose file_id Telegram no longer accepts."""
+        if self._entries.pop(fingerprint, None) is not None:
+            self._dirty = True
@@ -0,0 +1,369 @@
+import bisect
+import gzip
+import json
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from config import HISTORY_DIR, HISTORY_KEYFRAME_INTERVAL, HISTORY_RETENTION_DAYS
+from utils.atomic_file import atomic_write
+from utils.logger import logger
+
+Timestamp = Union[float, datetime]
+
+
+class HistoryStore:
+    """
+    Append-only on-disk time series of presence snapshots.
+
+    Members are mapped to stable bit slots (members.json), and each snapshot
+    is stored as a bitset: a full keyframe every `keyframe_interval` records
+    and at the start of each daily segment, and XOR deltas against the
+    previous snapshot in between. Snapshots are only appended when presence
+    changes, so a record holds until the next one. Every segment has a small
+    index of keyframe offsets, so point and range queries only decode the
+    records of the segments they touch, starting at the nearest keyframe.
+    Closed segments are gzip-compressed and dropped after `retention_days`.
+
+    Each record is a header (kind, timestamp, payload length), the payload
+    and a CRC32 of both. Reads stop at the first record that is cut short
+    or fails its checksum, and a torn tail left by a crash mid-append is
+    cut off before the segment is appended to again.
+    """
+
+    RECORD = struct.Struct('<BdH')
+    CRC = struct.Struct('<I')
+    INDEX = struct.Struct('<dQ')
+    KEYFRAME = 0
+    DELTA = 1
+
+    def __init__(self, directory: Path = HISTORY_DIR, keyframe_interval: int = HISTORY_KEYFRAME_INTERVAL,
+                 retention_days: int = HISTORY_RETENTION_DAYS):
+        """Initialize HistoryStore and load the member slot map."""
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+        self.retention_days = retention_days
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history')
+        self._slots: Dict[int, int] = {}
+        self._mk_ids: List[int] = []
+        self._load_members()
+
+        self._segment: Optional[str] = None
+        self._last_bits: Optional[int] = None
+        self._since_keyframe = 0
+        self._indexes: "OrderedDict[str, List[Tuple[float, int]]]" = OrderedDict()
+
+    # Member slots
+
+    def _members_path(self) -> Path:
+        return self.directory / "members.json"
+
+    def _load_members(self) -> None:
+        try:
+            if self._members_path().exists():
+                self._mk_ids = json.loads(self._members_path().read_text())
+                self._slots = {mk_id: slot for slot, mk_id in enumerate(self._mk_ids)}
+        except Exception as e:
+            logger.error("Error loading history member slots: %s", e)
+
+    def _to_bits(self, present_ids: Iterable[int]) -> int:
+        bits = 0
+        added = False
+        for mk_id in present_ids:
+            slot = self._slots.get(mk_id)
+            if slot is None:
+                slot = self._slots[mk_id] = len(self._mk_ids)
+                self._mk_ids.append(mk_id)
+                added = True
+            bits |= 1 << slot
+        if added:
+            atomic_write(self._members_path(), json.dumps(self._mk_ids))
+        return bits
+
+    def _to_ids(self, bits: int) -> Set[int]:
+        ids = set()
+        slot = 0
+        while bits:
+            if bits & 1:
+                ids.add(self._mk_ids[slot])
+            bits >>= 1
+            slot += 1
+        return ids
+
+    # Segments
+
+    @staticmethod
+    def _timestamp(when: Timestamp) -> float:
+        return when.timestamp() if isinstance(when, datetime) else float(when)
+
+    @staticmethod
+    def _segment_name(timestamp: float) -> str:
+        return time.strftime('%Y%m%d', time.gmtime(timestamp))
+
+    def _data_path(self, segment: str) -> Path:
+        path = self.directory / f"{segment}.bin"
+        return path if path.exists() else self.directory / f"{segment}.bin.gz"
+
+    def _index_path(self, segment: str) -> Path:
+        return self.directory / f"{segment}.idx"
+
+    def _segments(self) -> List[str]:
+        return sorted({path.name.split('.')[0] for path in self.directory.glob("*.idx")})
+
+    def _read_index(self, segment: str) -> List[Tuple[float, int]]:
+        path = self._index_path(segment)
+        if not path.exists():
+            return []
+        raw = path.read_bytes()
+        # A torn last entry is ignored
+        return [self.INDEX.unpack_from(raw, pos)
+                for pos in range(0, len(raw) - self.INDEX.size + 1, self.INDEX.size)]
+
+    def _get_index(self, segment: str) -> List[Tuple[float, int]]:
+        """Keyframe (timestamp, offset) pairs of a segment."""
+        index = self._indexes.get(segment)
+        if index is None:
+            index = self._read_index(segment)
+            self._indexes[segment] = index
+            while len(self._indexes) > 8:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(segment)
+        return index
+
+    def _open(self, segment: str):
+        path = self._data_path(segment)
+        return gzip.open(path, 'rb') if path.suffix == '.gz' else open(path, 'rb')
+
+    @classmethod
+    def _checksum(cls, header: bytes, payload: bytes) -> bytes:
+        return cls.CRC.pack(zlib.crc32(payload, zlib.crc32(header)))
+
+    @classmethod
+    def _valid_length(cls, data: bytes) -> int:
+        """Length of the leading run of complete records with valid checksums."""
+        position = 0
+        while position + cls.RECORD.size <= len(data):
+            header = data[position:position + cls.RECORD.size]
+            payload_end = position + cls.RECORD.size + cls.RECORD.unpack(header)[2]
+            end = payload_end + cls.CRC.size
+            if end > len(data) or data[payload_end:end] != cls._checksum(header, data[position + cls.RECORD.size:
+                                                                                     payload_end]):
+                break
+            position = end
+        return position
+
+    def _recover(self, segment: str) -> None:
+        """Cut a torn tail (a crash mid-append) off a raw segment and drop index entries past it."""
+        data_path = self.directory / f"{segment}.bin"
+        if not data_path.exists():
+            return
+        size = data_path.stat().st_size
+        valid = self._valid_length(data_path.read_bytes())
+        if valid < size:
+            logger.warning("Truncating history segment %s from %s to %s bytes after a torn write", segment, size, valid)
+            with open(data_path, 'r+b') as f:
+                f.truncate(valid)
+
+        index_path = self._index_path(segment)
+        index = [(timestamp, offset) for timestamp, offset in self._read_index(segment) if offset < valid]
+        if index_path.exists() and index_path.stat().st_size != len(index) * self.INDEX.size:
+            atomic_write(index_path, b''.join(self.INDEX.pack(*entry) for entry in index))
+        self._indexes.pop(segment, None)
+
+    def _read_states(self, segment: str, since: Optional[float] = None) -> Iterator[Tuple[float, int]]:
+        """Yield (timestamp, bits) snapshots of a segment, starting at the last keyframe <= since."""
+        index = self._get_index(segment)
+        if not index:
+            return
+        position = 0
+        if since is not None:
+            position = max(0, bisect.bisect_right([ts for ts, _ in index], since) - 1)
+
+        with self._open(segment) as f:
+            f.seek(index[position][1])
+            bits = 0
+            while True:
+                header = f.read(self.RECORD.size)
+                if len(header) < self.RECORD.size:
+                    break
+                kind, timestamp, length = self.RECORD.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or f.read(self.CRC.size) != self._checksum(header, payload):
+                    # Torn or corrupt: nothing after it can be trusted
+                    break
+                value = int.from_bytes(payload, 'little')
+                bits = value if kind == self.KEYFRAME else bits ^ value
+                yield timestamp, bits
+
+    # Writing
+
+    def record(self, present_ids: Iterable[int], timestamp: Optional[Timestamp] = None) -> None:
+        """Append a presence snapshot (synchronously); unchanged snapshots are skipped."""
+        timestamp = self._timestamp(timestamp) if timestamp is not None else time.time()
+        with self._lock:
+            bits = self._to_bits(present_ids)
+            segment = self._segment_name(timestamp)
+
+            if segment != self._segment:
+                if self._segment is not None:
+                    self.compact(exclude=segment)
+                self._recover(segment)
+                self._segment = segment
+                self._since_keyframe = self.keyframe_interval
+            elif bits == self._last_bits:
+                return
+
+            is_keyframe = self._since_keyframe >= self.keyframe_interval or self._last_bits is None
+            payload = bits if is_keyframe else bits ^ self._last_bits
+            data = payload.to_bytes((payload.bit_length() + 7) // 8, 'little')
+
+            data_path = self.directory / f"{segment}.bin"
+            with open(data_path, 'ab') as f:
+                offset = f.tell()
+                header = self.RECORD.pack(self.KEYFRAME if is_keyframe else self.DELTA, timestamp, len(data))
+                f.write(header + data + self._checksum(header, data))
+
+            if is_keyframe:
+                with open(self._index_path(segment), 'ab') as f:
+                    f.write(self.INDEX.pack(timestamp, offset))
+                self._indexes.pop(segment, None)
+                self._since_keyframe = 0
+            self._since_keyframe += 1
+            self._last_bits = bits
+
+    def submit(self, present_ids: Iterable[int], timestamp: Optional[Timestamp] = None) -> Future:
+        """Append a snapshot on the background writer thread, keeping submission order."""
+        present_ids = list(present_ids)
+        timestamp = timestamp if timestamp is not None else time.time()
+
+        def write():
+            try:
+                self.record(present_ids, timestamp)
+            except Exception as e:
+                logger.error("Error writing presence history: %s", e)
+
+        return self._executor.submit(write)
+
+    def compact(self, exclude: Optional[str] = None) -> None:
+        """Compress closed segments and delete those past the retention period."""
+        with self._lock:
+            cutoff = None
+            if self.retention_days > 0:
+                cutoff = self._segment_name(time.time() - self.retention_days * 24 * 60 * 60)
+
+            today = self._segment_name(time.time())
+            for segment in self._segments():
+                if segment in (exclude, self._segment, today):
+                    continue
+                raw_path = self.directory / f"{segment}.bin"
+                if cutoff is not None and segment < cutoff:
+                    for path in (raw_path, self.directory / f"{segment}.bin.gz", self._index_path(segment)):
+                        path.unlink(missing_ok=True)
+                    self._indexes.pop(segment, None)
+                elif raw_path.exists():
+                    with open(raw_path, 'rb') as src, gzip.open(f"{raw_path}.gz.tmp", 'wb') as dst:
+                        data = src.read()
+                        dst.write(data[:self._valid_length(data)])
+                    Path(f"{raw_path}.gz.tmp").replace(f"{raw_path}.gz")
+                    raw_path.unlink()
+
+    def close(self) -> None:
+        """Wait for pending writes."""
+        self._executor.shutdown(wait=True)
+
+    # Queries
+
+    def present_at(self, when: Timestamp) -> Set[int]:
+        """
+        Return the MkIds that were present at the given time.
+
+        Args:
+            when: Datetime or Unix timestamp
+
+        Returns:
+            Set[int]: Present members, empty if nothing was recorded before `when`
+        """
+        timestamp = self._timestamp(when)
+        with self._lock:
+            segments = self._segments()
+            position = bisect.bisect_right(segments, self._segment_name(timestamp))
+            # Walk back in case the day's first record is later than `when`
+            for segment in reversed(segments[:position]):
+                bits = None
+                for record_ts, record_bits in self._read_states(segment, since=timestamp):
+                    if record_ts > timestamp:
+                        break
+                    bits = record_bits
+                if bits is not None:
+                    return self._to_ids(bits)
+            return set()
+
+    def intervals(self, mk_id: int, start: Timestamp, end: Timestamp) -> List[Tuple[float, float]]:
+        """
+        Return the (from, to) timestamps in which a member was present between start and end.
+
+        Args:
+            mk_id: Member ID
+            start: Start of the range (datetime or Unix timestamp)
+            end: End of the range (datetime or Unix timestamp)
+        """
+        start_ts, end_ts = self._timestamp(start), self._timestamp(end)
+        with self._lock:
+            slot = self._slots.get(mk_id)
+            if slot is None or end_ts <= start_ts:
+                return []
+
+            result = []
+            since = start_ts if mk_id in self.present_at(start_ts) else None
+            first, last = self._segment_name(start_ts), self._segment_name(end_ts)
+            for segment in self._segments():
+                if segment < first or segment > last:
+                    continue
+                for record_ts, bits in self._read_states(segment, since=start_ts):
+                    if record_ts <= start_ts:
+                        continue
+                    if record_ts > end_ts:
+                        break
+                    present = bool(bits >> slot & 1)
+                    if present and since is None:
+                        since = record_ts
+                    elif not present and since is not None:
+                        result.append((since, record_ts))
+                        since = None
+            if since is not None:
+                result.append((since, end_ts))
+            return result
+
+    def snapshots(self, start: Timestamp, end: Timestamp) -> Iterator[Tuple[float, Set[int]]]:
+        """
+        Yield (timestamp, present MkIds) for every recorded change between start and end.
+
+        Args:
+            start: Start of the range (datetime or Unix timestamp)
+            end: End of the range (datetime or Unix timestamp)
+        """
+        start_ts, end_ts = self._timestamp(start), self._timestamp(end)
+        first, last = self._segment_name(start_ts), self._segment_name(end_ts)
+        for segment in self._segments():
+            if segment < first or segment > last:
+                continue
+            # Decoded a segment at a time, so the writer isn't blocked while the caller iterates
+            with self._lock:
+                states = [(record_ts, self._to_ids(bits))
+                          for record_ts, bits in self._read_states(segment, since=start_ts)
+                          if start_ts <= record_ts <= end_ts]
+            yield from states
+
+    @property
+    def members(self) -> List[int]:
+        """MkIds of every member ever recorded, in slot order."""
+        with self._lock:
+            return list(self._mk_ids)
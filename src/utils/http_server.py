@@ -0,0 +1,157 @@
+import asyncio
+from http import HTTPStatus
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+from utils.logger import logger
+
+
+class Request:
+    """Parsed HTTP request."""
+
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query: Dict[str, List[str]] = parse_qs(parts.query)
+        self.headers = headers
+        self.body = body
+
+    def query_param(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    def form(self) -> Dict[str, str]:
+        """Decode an application/x-www-form-urlencoded body."""
+        return {key: values[0] for key, values in parse_qs(self.body.decode('utf-8', 'replace')).items()}
+
+
+class Response:
+    """HTTP response; pass `stream` to send a chunked body from an async iterator."""
+
+    def __init__(self, body: Union[bytes, str] = b'', status: int = 200,
+                 headers: Optional[Dict[str, str]] = None,
+                 content_type: str = 'text/plain; charset=utf-8',
+                 stream: Optional[AsyncIterator[bytes]] = None):
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.status = status
+        self.headers = {'Content-Type': content_type, **(headers or {})}
+        self.stream = stream
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HttpServer:
+    """
+    Minimal asyncio HTTP/1.1 server for local endpoints (metrics, snapshots, stand-ins).
+
+    Supports keep-alive, Content-Length request bodies and chunked streaming
+    responses; routes match an exact path or a path prefix.
+    """
+
+    MAX_BODY = 64 * 1024 * 1024
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        """Initialize HttpServer; port 0 picks a free port on start."""
+        self.host = host
+        self.port = port
+        self._routes: List[Tuple[str, str, bool, Handler]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def route(self, method: str, path: str, handler: Handler, prefix: bool = False) -> None:
+        """Register a handler for a method and an exact path (or path prefix)."""
+        self._routes.append((method.upper(), path, prefix, handler))
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("HTTP server listening on %s", self.url)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _find_handler(self, method: str, path: str) -> Optional[Handler]:
+        for route_method, route_path, prefix, handler in self._routes:
+            if route_method in (method, '*') and (path == route_path or
+                                                  (prefix and path.startswith(route_path))):
+                return handler
+        return None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[Request, bool]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, version = request_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0))
+        if length > self.MAX_BODY:
+            raise ValueError("Request body too large")
+        body = await reader.readexactly(length) if length else b''
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+        return Request(method.upper(), target, headers, body), keep_alive
+
+    async def _write_response(self, writer: asyncio.StreamWriter, request: Request,
+                              response: Response, keep_alive: bool) -> bool:
+        headers = dict(response.headers)
+        if response.stream is not None:
+            headers['Transfer-Encoding'] = 'chunked'
+            keep_alive = False
+        else:
+            headers['Content-Length'] = str(len(response.body))
+        headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+
+        head = f"HTTP/1.1 {response.status} {HTTPStatus(response.status).phrase}\r\n"
+        head += ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode('latin-1') + b'\r\n')
+
+        if response.stream is not None:
+            async for chunk in response.stream:
+                if chunk:
+                    writer.write(f"{len(chunk):x}\r\n".encode('latin-1') + chunk + b'\r\n')
+                    await writer.drain()
+            writer.write(b'0\r\n\r\n')
+        elif request.method != 'HEAD':
+            writer.write(response.body)
+        await writer.drain()
+        return keep_alive
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                parsed = await self._read_request(reader)
+                if parsed is None:
+                    break
+                request, keep_alive = parsed
+
+                handler = self._find_handler(request.method, request.path)
+                try:
+                    response = await handler(request) if handler else Response('Not Found', status=404)
+                except Exception as e:
+                    logger.error("Error handling %s %s: %s", request.method, request.path, e)
+                    response = Response('Internal Server Error', status=500)
+
+                if not await self._write_response(writer, request, response, keep_alive):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.warning("Dropping HTTP connection: %s", e)
+        finally:
+            writer.close()
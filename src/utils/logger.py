@@ -1,15 +1,178 @@
+import atexit
+import contextvars
+import gzip
 import logging
-from pathlib import Path
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import Dict
+import msgspec
+from config import (LOG_FILE, LOG_LEVEL, LOG_LEVELS, LOG_FILE_FORMAT, LOG_MAX_BYTES, LOG_ROTATE_HOURS,
+                    LOG_BACKUP_COUNT)
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Poll cycle the current task is working on, stamped on every record
+cycle_id = contextvars.ContextVar('cycle_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'cycle'}
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """Parse 'photo_cache=DEBUG,httpx=WARNING' into name -> level."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return {name: level for name, level in levels.items() if isinstance(level, int)}
+
+
+class ContextFilter(logging.Filter):
+    """
+    Applies per-module levels and stamps the cycle id.
+
+    Runs in the thread that logs, before the record is queued. A level is
+    looked up by the record's module (e.g. 'photo_cache') and then by its
+    logger name and that name's parents (e.g. 'httpx').
+    """
+
+    def __init__(self, default_level: int, levels: Dict[str, int]):
+        super().__init__()
+        self.default_level = default_level
+        self.levels = levels
+
+    def level_for(self, record: logging.LogRecord) -> int:
+        level = self.levels.get(record.module)
+        name = record.name
+        while level is None and name:
+            level = self.levels.get(name)
+            name = name.rpartition('.')[0]
+        return self.default_level if level is None else level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level_for(record):
+            return False
+        record.cycle = cycle_id.get()
+        return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stock handler renders the message (and traceback) before queueing;
+    here the record is queued as is, so %-style arguments are only merged
+    and tracebacks only formatted on the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, module, cycle, message, extra fields and traceback."""
+
+    def __init__(self):
+        super().__init__()
+        self._encoder = msgspec.json.Encoder(enc_hook=str)
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'cycle': getattr(record, 'cycle', None),
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return self._encoder.encode(entry).decode('utf-8')
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that also rolls over every `rotate_seconds` and gzips old files.
+
+    Compression happens during rollover, i.e. on the listener thread.
+    """
+
+    def __init__(self, filename: str, max_bytes: int, rotate_seconds: float, backup_count: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.rotate_seconds = rotate_seconds
+        self.rollover_at = time.time() + rotate_seconds
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source: str, destination: str) -> None:
+        with open(source, 'rb') as src, gzip.open(destination, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.rotate_seconds and time.time() >= self.rollover_at:
+            if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+            self.rollover_at = time.time() + self.rotate_seconds
+        return super().shouldRollover(record)
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.rollover_at = time.time() + self.rotate_seconds
+
 
 def setup_logger():
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('knesset_bot.log'),
-            logging.StreamHandler()
-        ]
-    )
+    """
+    Route all logging through a queue to a background listener thread.
+
+    The event loop only appends records to an in-memory queue; formatting,
+    console output and file writes (JSON lines by default, rotated by size
+    and age, older files gzipped) happen on the listener thread, so a slow
+    disk can't stall a poll cycle.
+    """
+    levels = parse_levels(LOG_LEVELS)
+    default_level = logging.getLevelName(LOG_LEVEL.upper())
+    if not isinstance(default_level, int):
+        default_level = logging.INFO
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers = [console]
+    if LOG_FILE:
+        file_handler = CompressingRotatingFileHandler(LOG_FILE, LOG_MAX_BYTES, LOG_ROTATE_HOURS * 3600,
+                                                      LOG_BACKUP_COUNT)
+        file_handler.setFormatter(JsonFormatter() if LOG_FILE_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+        handlers.append(file_handler)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter(default_level, levels))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Drain the queue on exit
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(min([default_level, *levels.values()]))
     return logging.getLogger(__name__)
 
-logger = setup_logger()
\ No newline at end of file
+
+def setup_worker_logger() -> None:
+    """
+    Log straight to stderr in a render worker process.
+
+    Workers have no listener thread draining the queue, and must not write
+    to (or rotate) the log file of the main process.
+    """
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+    logging.getLogger().handlers = [console]
+
+logger = setup_logger()
@@ -0,0 +1,248 @@
+import bisect
+import cProfile
+import io
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+from config import METRICS_WINDOW
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Known metric families: name -> (type, help)
+DESCRIPTIONS = {
+    'stage_seconds': ('histogram', "Duration of pipeline stages"),
+    'stage_recent_seconds': ('gauge', "Latency quantiles of the most recent runs of each stage"),
+    'knesset_fetches_total': ('counter', "Knesset API fetches by outcome"),
+    'knesset_bytes_total': ('counter', "Bytes of Knesset payload downloaded"),
+    'knesset_attempts_total': ('counter', "Knesset request attempts by outcome"),
+    'knesset_hedged_total': ('counter', "Hedged second Knesset requests sent"),
+    'knesset_circuit_open': ('gauge', "1 while the Knesset circuit breaker is open"),
+    'photo_cache_events_total': ('counter', "Member photo cache lookups by outcome"),
+    'telegram_requests_total': ('counter', "Telegram Bot API calls by method and outcome"),
+    'telegram_retries_total': ('counter', "Telegram calls retried after a 429"),
+    'telegram_upload_bytes_total': ('counter', "Bytes of photos uploaded to Telegram"),
+    'encode_cache_total': ('counter', "Encoded image cache lookups by outcome"),
+    'encoded_image_bytes': ('gauge', "Size of the last encoded presence image"),
+    'publish_decisions_total': ('counter', "Per-chat photo publication decisions by reason"),
+    'cycles_total': ('counter', "Completed poll cycles"),
+    'snapshot_requests_total': ('counter', "Snapshot API requests by endpoint and status"),
+}
+
+
+class Histogram:
+    """Cumulative bucket histogram plus a rolling window of recent observations."""
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, window: int, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        if position < len(self.counts):
+            self.counts[position] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantile(self, q: float) -> float:
+        """Quantile over the rolling window."""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    """
+    In-process metrics registry exported in Prometheus text format.
+
+    Counters, gauges and histograms are keyed by name and label set and are
+    safe to update from the render and history threads. Stage timings go to
+    one `stage_seconds` histogram labelled by stage; the last duration of
+    every stage is kept as well, so a cycle can log its own breakdown.
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, prefix: str = 'knesset_bot', window: int = METRICS_WINDOW):
+        """Initialize an empty registry."""
+        self.prefix = prefix
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._last_stages: Dict[str, float] = {}
+
+    @staticmethod
+    def _labels(labels: Dict[str, object]) -> Labels:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Increase a counter."""
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """Set a gauge."""
+        with self._lock:
+            self._gauges[(name, self._labels(labels))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record a histogram observation."""
+        key = (name, self._labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.window)
+            histogram.observe(value)
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        """Record the duration of a pipeline stage."""
+        self.observe('stage_seconds', seconds, stage=stage)
+        with self._lock:
+            self._last_stages[stage] = seconds
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block (sync or async) as a pipeline stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start)
+
+    def take_last_stages(self) -> Dict[str, float]:
+        """Return and clear the durations of stages run since the last call."""
+        with self._lock:
+            stages, self._last_stages = self._last_stages, {}
+        return stages
+
+    def value(self, name: str, **labels) -> float:
+        """Current value of a counter or gauge (0 if never set)."""
+        key = (name, self._labels(labels))
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0))
+
+    # Export
+
+    def _name(self, name: str) -> str:
+        return f"{self.prefix}_{name}"
+
+    @staticmethod
+    def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ''
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    @staticmethod
+    def _format_value(value: float) -> str:
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+    def _header(self, lines: List[str], name: str, kind: str) -> None:
+        help_text = DESCRIPTIONS.get(name, (kind, name.replace('_', ' ')))[1]
+        lines.append(f"# HELP {self._name(name)} {help_text}")
+        lines.append(f"# TYPE {self._name(name)} {kind}")
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            recent = [(key, tuple(histogram.quantile(q) for q in self.QUANTILES))
+                      for key, histogram in histograms]
+            snapshots = [(key, list(h.counts), h.sum, h.count) for key, h in histograms]
+
+        for kind, items in (('counter', counters), ('gauge', gauges)):
+            seen = set()
+            for (name, labels), value in items:
+                if name not in seen:
+                    self._header(lines, name, kind)
+                    seen.add(name)
+                lines.append(f"{self._name(name)}{self._format_labels(labels)} {self._format_value(value)}")
+
+        seen = set()
+        for (name, labels), counts, total, count in snapshots:
+            if name not in seen:
+                self._header(lines, name, 'histogram')
+                seen.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(Histogram.BUCKETS, counts):
+                cumulative += bucket_count
+                le = (('le', self._format_value(bound)),)
+                lines.append(f"{self._name(name)}_bucket{self._format_labels(labels, le)} {cumulative}")
+            lines.append(f"{self._name(name)}_bucket{self._format_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{self._name(name)}_sum{self._format_labels(labels)} {repr(total)}")
+            lines.append(f"{self._name(name)}_count{self._format_labels(labels)} {count}")
+
+        seen = set()
+        for (name, labels), values in recent:
+            recent_name = name.replace('_seconds', '_recent_seconds')
+            if recent_name not in seen:
+                self._header(lines, recent_name, 'gauge')
+                seen.add(recent_name)
+            for q, value in zip(self.QUANTILES, values):
+                lines.append(f"{self._name(recent_name)}"
+                             f"{self._format_labels(labels, (('quantile', str(q)),))} {repr(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    """
+    cProfile wrapper that can be switched on and off while the bot runs.
+
+    Profiles the event loop thread only; render and history work running
+    in pool threads shows up as time spent awaiting them.
+    """
+
+    def __init__(self):
+        self._profile: Optional[cProfile.Profile] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def start(self) -> bool:
+        """Start profiling; returns False if it was already running."""
+        with self._lock:
+            if self._profile is not None:
+                return False
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            return True
+
+    def stop(self) -> Optional[pstats.Stats]:
+        """Stop profiling and return the collected stats (None if it wasn't running)."""
+        with self._lock:
+            profile, self._profile = self._profile, None
+        if profile is None:
+            return None
+        profile.disable()
+        return pstats.Stats(profile)
+
+    @staticmethod
+    def format(stats: pstats.Stats, sort: str = 'cumulative', limit: int = 40) -> str:
+        """Render the top entries of a profile as text."""
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+metrics = Metrics()
+profiler = Profiler()
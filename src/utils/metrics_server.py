@@ -0,0 +1,92 @@
+import asyncio
+import math
+import pstats
+import signal
+import time
+from pathlib import Path
+from typing import Optional
+from utils.logger import logger
+from utils.http_server import HttpServer, Request, Response
+from utils.metrics import Metrics, Profiler, metrics, profiler
+from config import METRICS_HOST, METRICS_PORT, PROFILING_ENABLED, PROFILE_DIR
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint for pipeline metrics and on-demand profiling.
+
+    GET /metrics                     Prometheus text format
+    GET /debug/profile?seconds=N     cProfile the event loop for N seconds (PROFILING_ENABLED);
+                                     &sort= takes a pstats sort key (default cumulative)
+
+    With profiling enabled, SIGUSR1 also toggles the profiler; the profile
+    collected between two signals is written to PROFILE_DIR.
+    """
+
+    def __init__(self, registry: Metrics = metrics, profile: Profiler = profiler,
+                 host: str = METRICS_HOST, port: int = METRICS_PORT,
+                 profiling: bool = PROFILING_ENABLED, profile_dir: Path = PROFILE_DIR):
+        """Initialize MetricsServer."""
+        self.metrics = registry
+        self.profiler = profile
+        self.profiling = profiling
+        self.profile_dir = profile_dir
+        self.http = HttpServer(host, port)
+        self.http.route('GET', '/metrics', self._metrics)
+        if profiling:
+            self.http.route('GET', '/debug/profile', self._profile)
+
+    async def start(self) -> None:
+        await self.http.start()
+        if self.profiling:
+            try:
+                asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self.toggle_profiler)
+            except (NotImplementedError, AttributeError, RuntimeError):
+                logger.warning("SIGUSR1 profiling toggle is not supported on this platform")
+
+    async def stop(self) -> None:
+        if self.profiling:
+            try:
+                asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR1)
+            except (NotImplementedError, AttributeError, RuntimeError):
+                pass
+            self.profiler.stop()
+        await self.http.stop()
+
+    async def _metrics(self, request: Request) -> Response:
+        return Response(self.metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    async def _profile(self, request: Request) -> Response:
+        try:
+            seconds = float(request.query_param('seconds', '10'))
+        except ValueError:
+            return Response('seconds must be a number', status=400)
+        if not math.isfinite(seconds) or seconds <= 0:
+            return Response('seconds must be a positive number', status=400)
+        seconds = min(seconds, 300.0)
+        # Checked up front: a bad key would only fail after the whole profiling window
+        sort = request.query_param('sort', 'cumulative')
+        if sort not in pstats.Stats.sort_arg_dict_default:
+            return Response(f"sort must be one of: {', '.join(sorted(pstats.Stats.sort_arg_dict_default))}",
+                            status=400)
+        if not self.profiler.start():
+            return Response('Profiler is already running', status=409)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stats = self.profiler.stop()
+        return Response(self.profiler.format(stats, sort=sort))
+
+    def toggle_profiler(self) -> Optional[Path]:
+        """Start the profiler, or stop it and dump the profile; returns the dump path."""
+        if self.profiler.start():
+            logger.info("Profiler started")
+            return None
+        stats = self.profiler.stop()
+        if stats is None:
+            return None
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        path = self.profile_dir / f"profile-{time.strftime('%Y%m%d-%H%M%S')}.pstats"
+        stats.dump_stats(str(path))
+        logger.info("Profiler stopped, profile written to %s", path)
+        return path
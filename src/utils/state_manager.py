@@ -1,29 +1,153 @@
-import json
-from config import STORAGE_FILE
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+import msgspec
+from config import STORAGE_FILE, ROSTER_SNAPSHOT_FILE, CHANNEL_ID
+from utils.atomic_file import atomic_write
 from utils.logger import logger
 
+
+class ChannelState(msgspec.Struct, frozen=True):
+    """What was last published to one chat."""
+    message_id: Optional[int] = None
+    published_members: List[int] = []
+    # Digest of the caption without its timestamp, and the fingerprint of the image
+    caption_digest: Optional[str] = None
+    caption_published_at: Optional[float] = None
+    image_fingerprint: Optional[str] = None
+
+
+class BotState(msgspec.Struct, frozen=True):
+    """
+    Everything needed to resume after a restart without re-rendering or re-uploading.
+
+    `last_message_id` and `previous_present_members` are the fields of the
+    original single-channel state file; they are moved into `channels`
+    (under CHANNEL_ID) when such a file is loaded.
+    """
+    last_message_id: Optional[int] = None
+    previous_present_members: List[int] = []
+    channels: Dict[str, ChannelState] = {}
+    # Validators of the last Knesset fetch
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    payload_digest: Optional[str] = None
+
+
 class StateManager:
-    @staticmethod
-    def load_state():
+    """
+    Crash-safe persistence of BotState.
+
+    Writes are atomic (temp file, fsync, rename), happen only when the state
+    actually changed and run on a single background thread, so the event
+    loop never waits on the disk and writes land in submission order. A
+    corrupt file is moved aside and reported instead of being silently
+    treated as "no state". The last Knesset payload is kept next to the
+    state, so a restart has a roster before its first fetch.
+    """
+
+    def __init__(self, path: Path = STORAGE_FILE, snapshot_path: Path = ROSTER_SNAPSHOT_FILE):
+        """Initialize StateManager."""
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.state = BotState()
+        self._persisted: Optional[BotState] = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state')
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder(BotState)
+
+    def load(self) -> BotState:
+        """Load the saved state, or an empty one if there is none."""
         try:
-            if STORAGE_FILE.exists():
-                with open(STORAGE_FILE, 'r') as f:
-                    state = json.load(f)
-                    return state.get('last_message_id'), set(state.get('previous_present_members', []))
-        except Exception as e:
-            logger.error(f"Error loading state: {e}")
-        return None, set()
+            if self.path.exists():
+                self.state = self._persisted = self._migrate(self._decoder.decode(self.path.read_bytes()))
+        except (OSError, msgspec.DecodeError) as e:
+            corrupt_path = self.path.with_name(f"{self.path.name}.corrupt-{int(time.time())}")
+            logger.error("State file %s is unreadable (%s), moved to %s", self.path, e, corrupt_path)
+            try:
+                self.path.replace(corrupt_path)
+            except OSError:
+                pass
+            self.state = BotState()
+        return self.state
 
     @staticmethod
-    def save_state(last_message_id, previous_present_members):
+    def _migrate(state: BotState) -> BotState:
+        """Move the fields of a single-channel state file into `channels`."""
+        if state.last_message_id is None and not state.previous_present_members:
+            return state
+        channels = dict(state.channels)
+        channels.setdefault(str(CHANNEL_ID), ChannelState(message_id=state.last_message_id,
+                                                          published_members=sorted(state.previous_present_members)))
+        return msgspec.structs.replace(state, last_message_id=None, previous_present_members=[],
+                                       channels=channels)
+
+    def channel(self, chat_id: str) -> ChannelState:
+        """Saved state of one chat (empty if it was never published to)."""
+        return self.state.channels.get(chat_id, ChannelState())
+
+    def load_state(self) -> Tuple[Optional[int], Set[int]]:
+        """Return the last message ID and published members of CHANNEL_ID."""
+        channel = self.load().channels.get(str(CHANNEL_ID), ChannelState())
+        return channel.message_id, set(channel.published_members)
+
+    def _write(self, state: BotState) -> bool:
+        with self._lock:
+            if state == self._persisted:
+                return True
+            try:
+                atomic_write(self.path, self._encoder.encode(state))
+                self._persisted = state
+                return True
+            except Exception as e:
+                logger.error("Error saving state: %s", e)
+                return False
+
+    def update(self, **changes) -> Optional[Future]:
+        """
+        Apply changes to the state and persist it in the background.
+
+        Returns:
+            Optional[Future]: Future of the write (result: success), or None if nothing changed
+        """
+        state = msgspec.structs.replace(self.state, **changes)
+        if state == self.state:
+            return None
+        self.state = state
+        return self._executor.submit(self._write, state)
+
+    def save_state(self, last_message_id: Optional[int], previous_present_members) -> bool:
+        """Synchronously persist the last message ID and published members of CHANNEL_ID."""
+        channels = dict(self.state.channels)
+        channels[str(CHANNEL_ID)] = msgspec.structs.replace(
+            self.channel(str(CHANNEL_ID)), message_id=last_message_id,
+            published_members=sorted(previous_present_members))
+        self.state = msgspec.structs.replace(self.state, channels=channels)
+        return self._write(self.state)
+
+    def load_snapshot(self) -> Optional[bytes]:
+        """The Knesset payload saved by the last run, if any."""
+        try:
+            return self.snapshot_path.read_bytes() if self.snapshot_path.exists() else None
+        except OSError as e:
+            logger.warning("Roster snapshot %s is unreadable: %s", self.snapshot_path, e)
+            return None
+
+    def _write_snapshot(self, payload: bytes) -> bool:
         try:
-            state = {
-                'last_message_id': last_message_id,
-                'previous_present_members': list(previous_present_members)
-            }
-            with open(STORAGE_FILE, 'w') as f:
-                json.dump(state, f)
+            atomic_write(self.snapshot_path, payload)
             return True
         except Exception as e:
-            logger.error(f"Error saving state: {e}")
-            return False
\ No newline at end of file
+            logger.error("Error saving roster snapshot: %s", e)
+            return False
+
+    def save_snapshot(self, payload: bytes) -> Future:
+        """Persist the latest Knesset payload in the background."""
+        return self._executor.submit(self._write_snapshot, payload)
+
+    def close(self) -> None:
+        """Wait for pending writes."""
+        self._executor.shutdown(wait=True)
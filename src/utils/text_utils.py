@@ -11,6 +11,6 @@ def hebrew_sort_key(member):
     """
     Key function for sorting Hebrew names from right to left
     """
-    lastname_reversed = member['Lastname']
-    firstname_reversed = member['Firstname']
+    lastname_reversed = member.lastname
+    firstname_reversed = member.firstname
     return (lastname_reversed, firstname_reversed)
\ No newline at end of file
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The bot imports its modules from src/, as when run with `python src/main.py`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,112 @@
+from datetime import datetime
+import pytz
+from models.member import KnessetMember
+from models.roster import Roster
+from services.attendance import AttendanceStats
+
+ISRAEL = pytz.timezone('Asia/Jerusalem')
+
+
+def at(hour: int, minute: int = 0, day: int = 1) -> float:
+    return ISRAEL.localize(datetime(2026, 6, day, hour, minute)).timestamp()
+
+
+def roster_with(*present: int) -> Roster:
+    members = [
+        KnessetMember(1, 'A', 'A', faction_name='X', is_coalition=True, is_present=1 in present),
+        KnessetMember(2, 'B', 'B', faction_name='Y', is_present=2 in present),
+        KnessetMember(3, 'C', 'C', faction_name='Y', is_present=3 in present),
+    ]
+    roster = Roster()
+    roster.update(members)
+    return roster
+
+
+def stats(tmp_path) -> AttendanceStats:
+    return AttendanceStats(tmp_path / 'attendance.json', report_time='21:00', weekly_day=4)
+
+
+def test_present_time_per_member_faction_and_bloc(tmp_path):
+    attendance = stats(tmp_path)
+    attendance.observe(roster_with(1), now=at(10))
+    attendance.observe(roster_with(1, 2), now=at(10, 30))
+    attendance.observe(roster_with(), now=at(11))
+
+    report = attendance.report(roster_with(), now=at(12))
+    assert report.members == [(1, 3600), (2, 1800)]
+    assert report.sittings == 1 and report.sitting_seconds == 3600
+    assert report.factions == [('X', 3600, 1.0, True), ('Y', 1800, 0.25, False)]
+    assert report.coalition_share == 1.0 and report.opposition_share == 0.25
+
+
+def test_open_stints_count_up_to_now(tmp_path):
+    attendance = stats(tmp_path)
+    attendance.observe(roster_with(1), now=at(10))
+    report = attendance.report(roster_with(1), now=at(10, 15))
+    assert report.members == [(1, 900)]
+    assert report.sitting_seconds == 900
+
+
+def test_unchanged_cycles_visit_nothing(tmp_path):
+    attendance = stats(tmp_path)
+    assert attendance.observe(roster_with(1, 2), now=at(10)) == 2
+    assert attendance.observe(roster_with(1, 2), now=at(10, 1)) == 0
+    assert attendance.observe(roster_with(2), now=at(10, 2)) == 1
+
+
+def test_stints_are_split_at_midnight(tmp_path):
+    attendance = stats(tmp_path)
+    attendance.observe(roster_with(1), now=at(23))
+    attendance.observe(roster_with(), now=at(1, day=2))
+    day1, day2 = attendance.state.days
+    assert day1.members == {1: 3600} and day2.members == {1: 3600}
+    assert day2.sittings[0].continued
+    report = attendance.report(roster_with(), days=2, now=at(2, day=2))
+    assert report.members == [(1, 7200)]
+    # A sitting continued past midnight is not counted twice
+    assert report.sittings == 1
+
+
+def test_streaks_count_sitting_days(tmp_path):
+    attendance = stats(tmp_path)
+    for day in (1, 2, 3):
+        attendance.observe(roster_with(1, 2) if day < 3 else roster_with(1), now=at(10, day=day))
+        attendance.observe(roster_with(), now=at(11, day=day))
+    attendance.observe(roster_with(), now=at(10, day=4))
+    assert attendance.state.streaks[1].current == 3
+    assert attendance.state.streaks[2].current == 0 and attendance.state.streaks[2].best == 2
+
+
+def test_report_shows_current_and_longest_streaks(tmp_path):
+    attendance = stats(tmp_path)
+    for day, present in ((1, (1, 2)), (2, (1, 2)), (3, (1, 2)), (4, (1,)), (5, (1, 2)), (6, (1, 2))):
+        attendance.observe(roster_with(*present), now=at(10, day=day))
+        attendance.observe(roster_with(), now=at(11, day=day))
+    report = attendance.report(roster_with(), now=at(12, day=6))
+    assert report.streaks == [(1, 6, 6), (2, 2, 3)]
+
+
+def test_reports_fall_due_after_the_report_time(tmp_path):
+    attendance = stats(tmp_path)
+    attendance.observe(roster_with(1), now=at(10))
+    assert attendance.reports_due(now=at(20)) == []
+    assert attendance.report_due_in(now=at(20)) == 3600
+    # 2026-06-05 is a Friday (weekly_day=4)
+    assert attendance.reports_due(now=at(21)) == [1]
+    attendance.mark_reported(now=at(21))
+    assert attendance.report_due_in(now=at(22)) is None
+
+
+def test_save_and_load(tmp_path):
+    attendance = stats(tmp_path)
+    attendance.observe(roster_with(1), now=at(10))
+    attendance.observe(roster_with(1, 2), now=at(10, 30))
+    attendance.save().result()
+    assert attendance.save() is None
+    attendance.close()
+
+    restored = stats(tmp_path)
+    restored.load()
+    # Presence while the bot was down is unknown: open stints end at the last update
+    assert restored.state.open == {}
+    assert restored.state.days[-1].members == {1: 1800}
@@ -0,0 +1,107 @@
+import numpy as np
+from services.change_detector import ChangeDetector
+
+
+def mask(*present, size=6):
+    result = np.zeros(size, dtype=bool)
+    result[list(present)] = True
+    return result
+
+
+def test_first_photo_is_published_at_once():
+    detector = ChangeDetector(settle_seconds=60, max_delay_seconds=300)
+    assert detector.observe(mask(0, 1), None, now=0).reason == 'initial'
+
+
+def test_unchanged_presence_is_not_published():
+    detector = ChangeDetector(settle_seconds=60, max_delay_seconds=300)
+    decision = detector.observe(mask(0, 1), mask(0, 1), now=0)
+    assert not decision.publish and decision.reason == 'unchanged'
+    assert detector.due_in(now=0) is None
+
+
+def test_change_waits_until_presence_settles():
+    detector = ChangeDetector(settle_seconds=60, max_delay_seconds=300)
+    published = mask(0)
+    assert detector.observe(mask(0, 1), published, now=0).reason == 'settling'
+    assert detector.due_in(now=0) == 60
+    assert not detector.observe(mask(0, 1), published, now=59).publish
+    decision = detector.observe(mask(0, 1), published, now=60)
+    assert decision.publish and decision.reason == 'settled' and decision.delta == 1
+
+
+def test_new_change_restarts_settling():
+    detector = ChangeDetector(settle_seconds=60, max_delay_seconds=300)
+    published = mask(0)
+    detector.observe(mask(0, 1), published, now=0)
+    detector.observe(mask(0, 1, 2), published, now=45)
+    assert not detector.observe(mask(0, 1, 2), published, now=90).publish
+    assert detector.observe(mask(0, 1, 2), published, now=105).reason == 'settled'
+
+
+def test_settle_zero_publishes_every_change():
+    detector = ChangeDetector(settle_seconds=0, max_delay_seconds=300)
+    assert detector.observe(mask(0, 1), mask(0), now=0).reason == 'settled'
+
+
+def test_small_change_waits_for_max_delay():
+    detector = ChangeDetector(settle_seconds=60, max_delay_seconds=300, min_delta=3)
+    published = mask(0)
+    assert detector.observe(mask(0, 1), published, now=0).reason == 'below_threshold'
+    assert not detector.observe(mask(0, 1), published, now=200).publish
+    # Settling alone does not publish below min_delta
+    assert detector.due_in(now=200) == 100
+    assert detector.observe(mask(0, 1), published, now=300).reason == 'max_delay'
+
+
+def test_large_change_settles_with_min_delta():
+    detector = ChangeDetector(settle_seconds=60, max_delay_seconds=300, min_delta=3)
+    published = mask(0)
+    detector.observe(mask(0, 1, 2, 3), published, now=0)
+    decision = detector.observe(mask(0, 1, 2, 3), published, now=60)
+    assert decision.reason == 'settled' and decision.delta == 3
+
+
+def test_max_delay_runs_from_first_unpublished_change():
+    detector = ChangeDetector(settle_seconds=60, max_delay_seconds=300)
+    published = mask(0)
+    # Presence changes every 15 s and never settles
+    for step in range(21):
+        current = mask(0, 1 + step % 2)
+        decision = detector.observe(current, published, now=step * 15)
+        if decision.publish:
+            break
+    assert decision.reason == 'max_delay' and step * 15 == 300
+
+
+def test_flapping_back_to_the_photo_keeps_the_delay():
+    detector = ChangeDetector(settle_seconds=60, max_delay_seconds=300)
+    published = mask(0)
+    for step in range(21):
+        # Every other poll matches the published photo again
+        current = mask(0, 1) if step % 2 == 0 else published
+        decision = detector.observe(current, published, now=step * 15)
+        assert decision.reason != 'settled'
+        if decision.publish:
+            break
+    assert decision.reason == 'max_delay' and step * 15 == 300
+
+
+def test_returning_to_the_photo_for_settle_ends_the_delay():
+    detector = ChangeDetector(settle_seconds=60, max_delay_seconds=300)
+    published = mask(0)
+    detector.observe(mask(0, 1), published, now=0)
+    detector.observe(published, published, now=15)
+    assert detector.due_in(now=15) is None
+    detector.observe(published, published, now=75)
+    detector.observe(mask(0, 2), published, now=280)
+    assert not detector.observe(mask(0, 2), published, now=300).publish
+    assert detector.due_in(now=300) == 40
+
+
+def test_publication_starts_a_new_delay():
+    detector = ChangeDetector(settle_seconds=60, max_delay_seconds=300)
+    detector.observe(mask(0, 1), mask(0), now=0)
+    assert detector.observe(mask(0, 1), mask(0), now=60).publish
+    detector.observe(mask(0, 1, 2), mask(0, 1), now=70)
+    assert detector.due_in(now=70) == 60
@@ -0,0 +1,100 @@
+import gzip
+from datetime import datetime, timezone
+from utils.history_store import HistoryStore
+
+# 06:00 UTC, so a day's records stay in one segment
+DAY = datetime(2026, 6, 1, 6, tzinfo=timezone.utc).timestamp()
+NEXT_DAY = DAY + 24 * 60 * 60
+
+
+def fill(store: HistoryStore, start: float = DAY):
+    states = [{1}, {1, 2}, {2}, {2, 3}, {1, 2, 3}, {3}, set(), {1}]
+    for i, present in enumerate(states):
+        store.record(present, start + i * 60)
+    return states
+
+
+def test_point_queries_across_keyframes_and_deltas(tmp_path):
+    store = HistoryStore(tmp_path, keyframe_interval=3)
+    states = fill(store)
+    for i, present in enumerate(states):
+        assert store.present_at(DAY + i * 60 + 30) == present
+    assert store.present_at(DAY - 1) == set()
+
+
+def test_unchanged_snapshots_are_skipped(tmp_path):
+    store = HistoryStore(tmp_path)
+    store.record({1}, DAY)
+    store.record({1}, DAY + 60)
+    assert [ts for ts, _ in store.snapshots(DAY, DAY + 120)] == [DAY]
+
+
+def test_intervals(tmp_path):
+    store = HistoryStore(tmp_path, keyframe_interval=3)
+    fill(store)
+    assert store.intervals(1, DAY, DAY + 600) == [(DAY, DAY + 120), (DAY + 240, DAY + 300), (DAY + 420, DAY + 600)]
+    assert store.intervals(4, DAY, DAY + 600) == []
+
+
+def test_closed_segments_are_compressed_and_still_read(tmp_path):
+    store = HistoryStore(tmp_path, keyframe_interval=3, retention_days=0)
+    states = fill(store)
+    store.record({4}, NEXT_DAY)
+    store.compact()
+    segment = HistoryStore._segment_name(DAY)
+    assert (tmp_path / f"{segment}.bin.gz").exists() and not (tmp_path / f"{segment}.bin").exists()
+    assert [ids for _, ids in store.snapshots(DAY, NEXT_DAY)] == states + [{4}]
+    assert store.present_at(NEXT_DAY - 1) == states[-1]
+
+
+def test_reopened_store_keeps_member_slots(tmp_path):
+    fill(HistoryStore(tmp_path))
+    store = HistoryStore(tmp_path)
+    assert store.members == [1, 2, 3]
+    assert store.present_at(DAY + 150) == {2}
+
+
+def test_torn_tail_is_cut_before_appending(tmp_path):
+    store = HistoryStore(tmp_path, keyframe_interval=3)
+    states = fill(store)
+    data_path = tmp_path / f"{HistoryStore._segment_name(DAY)}.bin"
+    size = data_path.stat().st_size
+    with open(data_path, 'ab') as f:
+        # Half a record header, as a crash mid-append leaves it
+        f.write(HistoryStore.RECORD.pack(HistoryStore.DELTA, DAY + 1000, 4)[:5])
+
+    store = HistoryStore(tmp_path, keyframe_interval=3)
+    assert [ids for _, ids in store.snapshots(DAY, DAY + 3600)] == states
+    store.record({5}, DAY + 1200)
+    assert data_path.stat().st_size > size
+    assert [ids for _, ids in store.snapshots(DAY, DAY + 3600)] == states + [{5}]
+    assert store.present_at(DAY + 1300) == {5}
+
+
+def test_reads_stop_at_a_corrupt_record(tmp_path):
+    store = HistoryStore(tmp_path, keyframe_interval=100)
+    states = fill(store)
+    data_path = tmp_path / f"{HistoryStore._segment_name(DAY)}.bin"
+    data = bytearray(data_path.read_bytes())
+    # Flip a payload bit of the third record
+    offset = 0
+    for _ in range(2):
+        offset += HistoryStore.RECORD.size + HistoryStore.RECORD.unpack_from(data, offset)[2] + HistoryStore.CRC.size
+    data[offset + HistoryStore.RECORD.size] ^= 1
+    data_path.write_bytes(bytes(data))
+
+    store = HistoryStore(tmp_path, keyframe_interval=100)
+    assert [ids for _, ids in store.snapshots(DAY, DAY + 3600)] == states[:2]
+
+
+def test_compaction_drops_a_torn_tail(tmp_path):
+    store = HistoryStore(tmp_path, retention_days=0)
+    states = fill(store)
+    segment = HistoryStore._segment_name(DAY)
+    with open(tmp_path / f"{segment}.bin", 'ab') as f:
+        f.write(b'\x01\x02\x03')
+    store.record({4}, NEXT_DAY)
+    store.compact()
+    data = gzip.decompress((tmp_path / f"{segment}.bin.gz").read_bytes())
+    assert HistoryStore._valid_length(data) == len(data)
+    assert [ids for _, ids in store.snapshots(DAY, DAY + 3600)] == states
@@ -0,0 +1,25 @@
+import json
+from models.member import decode_lobby
+
+
+def payload(*members) -> bytes:
+    return json.dumps({'mks': list(members)}).encode()
+
+
+def member(mk_id, **fields):
+    record = {'MkId': mk_id, 'Firstname': 'First', 'Lastname': 'Last', 'FactionName': 'Faction',
+              'IsCoalition': False, 'IsPresent': True, 'ImagePath': None}
+    record.update(fields)
+    return record
+
+
+def test_null_names_are_accepted_and_interned_as_empty():
+    data = decode_lobby(payload(member(1, FactionName=None, Firstname=None), member(2)))
+    assert [m.mk_id for m in data.mks] == [1, 2]
+    first = data.mks[0].interned()
+    assert first.faction_name == '' and first.firstname == '' and first.lastname == 'Last'
+
+
+def test_an_invalid_record_is_skipped_instead_of_the_snapshot():
+    data = decode_lobby(payload(member(1), member('x'), member(3, IsPresent='yes')))
+    assert [m.mk_id for m in data.mks] == [1]
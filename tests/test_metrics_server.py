@@ -0,0 +1,28 @@
+import asyncio
+import pytest
+from utils.http_server import Request
+from utils.metrics import Metrics, Profiler
+from utils.metrics_server import MetricsServer
+
+
+def profile(target: str):
+    server = MetricsServer(registry=Metrics(), profile=Profiler(), profiling=True)
+    return server, asyncio.run(server._profile(Request('GET', target, {}, b'')))
+
+
+@pytest.mark.parametrize('seconds', ['abc', 'nan', 'inf', '-1', '0'])
+def test_bad_seconds_are_rejected(seconds):
+    server, response = profile(f'/debug/profile?seconds={seconds}')
+    assert response.status == 400
+    assert not server.profiler.running
+
+
+def test_bad_sort_is_rejected_before_profiling():
+    server, response = profile('/debug/profile?seconds=0.01&sort=bogus')
+    assert response.status == 400
+    assert not server.profiler.running
+
+
+def test_profile_with_a_sort_key():
+    _, response = profile('/debug/profile?seconds=0.01&sort=tottime')
+    assert response.status == 200
@@ -0,0 +1,93 @@
+import asyncio
+import io
+from PIL import Image
+from services.photo_cache import PhotoCache
+
+URL = 'https://photos.example/1.jpg'
+
+
+class Response:
+    def __init__(self, status_code: int, content: bytes = b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class PhotoHost:
+    """Serves one photo, whose body and ETag can be changed between requests."""
+
+    def __init__(self, color):
+        self.set(color)
+        self.requests = 0
+
+    def set(self, color) -> None:
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 40), color).save(buffer, format='PNG')
+        self.body = buffer.getvalue()
+        self.etag = f'"{color}"'
+
+    async def get(self, url, headers=None, **kwargs) -> Response:
+        self.requests += 1
+        if headers and headers.get('If-None-Match') == self.etag:
+            return Response(304)
+        return Response(200, self.body, {'ETag': self.etag})
+
+
+def pixel(tile: Image.Image):
+    return tile.getpixel((5, 5))[:3]
+
+
+def test_revalidated_photo_replaces_the_stale_tile(tmp_path):
+    async def run():
+        host = PhotoHost((255, 0, 0))
+        cache = PhotoCache(host, tile_size=20, cache_dir=tmp_path, revalidate_after=3600)
+        assert pixel(await cache.get_tile(URL)) == (255, 0, 0)
+        old_version = cache.version(URL)
+
+        # Due for revalidation, and the photo changed upstream
+        cache.revalidate_after = 0
+        host.set((0, 0, 255))
+        assert pixel(await cache.get_tile(URL, allow_stale=True)) == (255, 0, 0)
+        await asyncio.gather(*cache._inflight.values())
+
+        cache.revalidate_after = 3600
+        assert cache.version(URL) != old_version
+        assert pixel(await cache.get_tile(URL)) == (0, 0, 255)
+        assert host.requests == 2
+
+    asyncio.run(run())
+
+
+def test_unchanged_photo_is_revalidated_without_a_download(tmp_path):
+    async def run():
+        host = PhotoHost((0, 255, 0))
+        cache = PhotoCache(host, tile_size=20, cache_dir=tmp_path, revalidate_after=0)
+        await cache.get_tile(URL)
+        version = cache.version(URL)
+        assert pixel(await cache.get_tile(URL)) == (0, 255, 0)
+        assert cache.version(URL) == version and host.requests == 2
+
+    asyncio.run(run())
+
+
+def test_foreign_files_in_the_cache_dir_are_kept(tmp_path):
+    (tmp_path / 'notes.json').write_text('{}')
+    (tmp_path / 'photo.png').write_bytes(b'')
+    PhotoCache(PhotoHost((0, 0, 0)), tile_size=20, cache_dir=tmp_path)
+    assert (tmp_path / 'notes.json').exists() and (tmp_path / 'photo.png').exists()
+
+
+def test_least_recently_used_photos_are_evicted_from_disk(tmp_path):
+    async def run():
+        host = PhotoHost((255, 0, 0))
+        cache = PhotoCache(host, tile_size=20, cache_dir=tmp_path)
+        await cache.get_tile(URL)
+        first = cache.tile_path(URL)
+        # Room for one tile only
+        cache.max_disk_bytes = first.stat().st_size
+        await cache.get_tile('https://photos.example/2.jpg')
+        assert cache.version(URL) is None and not first.exists()
+        assert not (tmp_path / f"{PhotoCache.cache_key(URL)}.json").exists()
+        assert cache.tile_path('https://photos.example/2.jpg').exists()
+
+    asyncio.run(run())
@@ -0,0 +1,57 @@
+from api.resilience import CircuitBreaker, LatencyWindow
+
+
+def test_latency_window_needs_enough_samples():
+    window = LatencyWindow(size=100, min_samples=10)
+    for i in range(9):
+        window.observe(i)
+    assert window.quantile(0.5) is None
+    window.observe(9)
+    assert window.quantile(0.5) == 5
+    assert window.quantile(0.99) == 9
+
+
+def test_latency_window_forgets_old_samples():
+    window = LatencyWindow(size=10, min_samples=1)
+    for i in range(20):
+        window.observe(i)
+    assert window.quantile(0) == 10
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=30, max_cooldown=300)
+    breaker.record_failure(now=0)
+    breaker.record_failure(now=1)
+    assert breaker.allow(now=1) and breaker.retry_in(now=1) is None
+    breaker.record_failure(now=2)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow(now=10)
+    assert breaker.retry_in(now=10) == 22
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=30, max_cooldown=300)
+    breaker.record_failure(now=0)
+    breaker.record_success()
+    breaker.record_failure(now=1)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_probe_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=30, max_cooldown=300)
+    breaker.record_failure(now=0)
+    assert breaker.allow(now=30)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.cooldown == 30
+
+
+def test_failed_probe_doubles_the_cooldown_up_to_the_cap():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=30, max_cooldown=100)
+    breaker.record_failure(now=0)
+    now = 0
+    for expected in (60, 100, 100):
+        now += breaker.cooldown
+        assert breaker.allow(now=now)
+        breaker.record_failure(now=now)
+        assert breaker.state == CircuitBreaker.OPEN and breaker.cooldown == expected
@@ -0,0 +1,47 @@
+import time
+from services.snapshot_server import etag_matches
+
+
+def test_missing_header_does_not_match():
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches('', '"abc"')
+
+
+def test_exact_and_listed_tags_match():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", "abc"', '"abc"')
+    assert not etag_matches('"x", "y"', '"abc"')
+
+
+def test_weak_tags_match_weakly():
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"x",W/"abc"', '"abc"')
+
+
+def test_star_matches_anything():
+    assert etag_matches('*', '"abc"')
+
+
+def snapshot(*present):
+    from models.member import KnessetMember
+    from models.roster import Roster
+    members = [KnessetMember(mk_id, 'A', 'B', faction_name='X', is_present=mk_id in present) for mk_id in (1, 2)]
+    roster = Roster()
+    roster.update(members)
+    return roster, members
+
+
+def test_versions_keep_increasing_across_restarts():
+    from services.snapshot_server import SnapshotServer
+    server = SnapshotServer(image_service=None)
+    assert server.update(*snapshot(1))
+    assert not server.update(*snapshot(1))
+    assert server.update(*snapshot(1, 2))
+    last = server.version
+
+    # A restart takes far longer than one millisecond per published change
+    time.sleep(0.01)
+    restarted = SnapshotServer(image_service=None)
+    restarted.update(*snapshot(1, 2))
+    assert restarted.version > last
+    assert b'id: %d\n' % restarted.version in restarted._event
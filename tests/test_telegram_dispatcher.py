@@ -0,0 +1,35 @@
+import asyncio
+import time
+from services.telegram_dispatcher import TokenBucket
+
+
+async def timed_acquires(bucket: TokenBucket, count: int):
+    start = time.monotonic()
+    for _ in range(count):
+        await bucket.acquire()
+    return time.monotonic() - start
+
+
+def test_burst_is_sent_at_once():
+    bucket = TokenBucket(rate_per_minute=60, burst=3)
+    assert asyncio.run(timed_acquires(bucket, 3)) < 0.05
+
+
+def test_sends_past_the_burst_wait_for_tokens():
+    # 10 per second: the fourth send waits about 0.1 s
+    bucket = TokenBucket(rate_per_minute=600, burst=3)
+    assert 0.08 <= asyncio.run(timed_acquires(bucket, 4)) < 0.3
+
+
+def test_pause_blocks_sends():
+    bucket = TokenBucket(rate_per_minute=600, burst=3)
+    bucket.pause(0.2)
+    assert asyncio.run(timed_acquires(bucket, 1)) >= 0.19
+
+
+def test_pause_keeps_the_longer_one():
+    bucket = TokenBucket(rate_per_minute=600, burst=3)
+    bucket.pause(10)
+    until = bucket.paused_until
+    bucket.pause(1)
+    assert bucket.paused_until == until